@@ -4,6 +4,7 @@ import azure.functions as func
 from src.processors import AnalyticsProcessor, process_response
 from src.storage import set_blob_data, set_next_request, get_container_client, merge_blob_data, queue_email
 from src.handlers import start_analytics, send_next_request
+from src.sweeper import sweep_pages
 
 # Create Azure Function app
 app = func.FunctionApp()
@@ -19,6 +20,7 @@ __all__ = [
     'queue_email',
     'start_analytics',
     'send_next_request',
+    'sweep_pages',
 ]
 
 
@@ -60,3 +62,23 @@ def send_next_analytics_request(msg: func.QueueMessage) -> None:
 
     """
     return send_next_request(msg)
+
+
+@app.function_name("sweeporphanedpages")
+@app.timer_trigger(
+    schedule="0 0 4 * * *",  # Every day at 4:00 AM UTC
+    arg_name="timer",
+    run_on_startup=False,
+    use_monitor=False
+)
+def sweep_orphaned_pages(timer: func.TimerRequest) -> None:
+    """Azure Function timer trigger wrapper
+
+    Parameters:
+    timer (func.TimerRequest): The timer trigger request object.
+
+    Returns:
+    None
+
+    """
+    return sweep_pages(timer)
@@ -0,0 +1,159 @@
+"""Alma Analytics circuit breaker module"""
+
+import logging
+import os
+import time
+from typing import Any
+
+from src.storage import get_state, put_state
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Longer than a request can take, so a trial request whose instance died does not keep the circuit half-open
+TRIAL_TIMEOUT = 330.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit is open"""
+
+    def __init__(self, retry_after: float):
+        """Initialize the error
+
+        Parameters:
+        retry_after (float): The number of seconds until a request may be sent again.
+
+        Returns:
+        None
+
+        """
+        super().__init__(f"Alma Analytics circuit is open, retry in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker shared by every instance through a state blob
+
+    The circuit opens after failure_threshold consecutive failures, and requests fail fast for open_seconds. Then
+    one instance is let through with a trial request: success closes the circuit, failure opens it again.
+    Errors reading or writing the state are logged and let requests through.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float):
+        """Initialize the circuit breaker
+
+        Parameters:
+        name (str): The name of the shared state entity.
+        failure_threshold (int): The number of consecutive failures that opens the circuit.
+        open_seconds (float): The number of seconds the circuit stays open before a trial request.
+
+        Returns:
+        None
+
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+    def allow(self) -> float:
+        """Check whether a request may be sent, claiming the trial request if the circuit is due one
+
+        Returns:
+        float: 0 if the request may be sent, or the number of seconds until the circuit may let a request through.
+
+        """
+        try:
+            while True:
+                now: float = time.time()
+                state, etag = get_state(self.name)
+
+                if state is None or state['state'] == CLOSED:
+                    return 0.0
+
+                reopens: float = state['opened_at'] + self.open_seconds if state['state'] == OPEN \
+                    else state['trial_until']
+                if now < reopens:
+                    return reopens - now
+
+                trial: dict[str, Any] = {**state, 'state': HALF_OPEN, 'trial_until': now + TRIAL_TIMEOUT}
+                if put_state(self.name, trial, etag):
+                    log_circuit_state(trial)
+                    return 0.0
+        except Exception as e:
+            logging.warning("Circuit breaker unavailable, sending request anyway: %s", str(e))
+            return 0.0
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful request"""
+        self._update(lambda state, now: None if state['state'] == CLOSED and not state['failures'] else {
+            'state': CLOSED, 'failures': 0, 'opened_at': 0.0, 'trial_until': 0.0,
+        })
+
+    def record_failure(self) -> None:
+        """Count a failed request, opening the circuit at the threshold or when the trial request failed"""
+        def fail(state: dict[str, Any], now: float) -> dict[str, Any]:
+            failures: int = state['failures'] + 1
+            if state['state'] == HALF_OPEN or failures >= self.failure_threshold:
+                return {'state': OPEN, 'failures': failures, 'opened_at': now, 'trial_until': 0.0}
+            return {**state, 'failures': failures}
+
+        self._update(fail)
+
+    def _update(self, change: Any) -> None:
+        """Apply a change to the shared state, retrying if another instance changed it first
+
+        Parameters:
+        change (Callable): Returns the new state from the current state and time, or None to leave it unchanged.
+
+        Returns:
+        None
+
+        """
+        try:
+            while True:
+                stored, etag = get_state(self.name)
+                state: dict[str, Any] = stored or {'state': CLOSED, 'failures': 0, 'opened_at': 0.0, 'trial_until': 0.0}
+                updated: dict[str, Any] | None = change(state, time.time())
+
+                if updated is None:
+                    return
+
+                if put_state(self.name, updated, etag):
+                    if updated['state'] != state['state']:
+                        log_circuit_state(updated)
+                    return
+        except Exception as e:
+            logging.warning("Circuit breaker unavailable, not recording the request: %s", str(e))
+
+
+def log_circuit_state(state: dict[str, Any]) -> None:
+    """Log a circuit state change as a metric for Application Insights
+
+    Parameters:
+    state (dict): The circuit state.
+
+    Returns:
+    None
+
+    """
+    logging.warning("Alma circuit breaker: state=%s failures=%s", state['state'], state['failures'])
+
+
+def get_circuit_breaker() -> CircuitBreaker | None:
+    """Get the Alma Analytics circuit breaker configured by the app settings
+
+    Returns:
+    CircuitBreaker: The circuit breaker, or None if ALMA_CIRCUIT_FAILURES is not set.
+
+    """
+    failures: str | None = os.getenv('ALMA_CIRCUIT_FAILURES')
+
+    if not failures:
+        return None
+
+    return CircuitBreaker(
+        'alma-analytics-circuit',
+        int(failures),
+        float(os.getenv('ALMA_CIRCUIT_OPEN_SECONDS', '300'))
+    )
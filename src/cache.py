@@ -0,0 +1,311 @@
+"""Alma Analytics Response Cache Module"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from src.storage import DELETE_BATCH_SIZE, get_container_client, with_container
+
+CACHE_CONTAINER = 'duplicates-barcode-cache'
+CACHE_KEYS = ('iz', 'analysis', 'resume', 'columns', 'filter')
+
+
+class CachedResponse:  # pylint: disable=too-few-public-methods
+    """Stand-in for a successful requests.Response served from the cache"""
+
+    status_code = 200
+    headers: dict[str, str] = {}
+
+    def __init__(self, text: str):
+        """Initialize the cached response
+
+        Parameters:
+        text (str): The response text.
+
+        Returns:
+        None
+
+        """
+        self.text = text
+
+    def raise_for_status(self) -> None:
+        """Do nothing, cached responses were successful"""
+
+
+class ResponseCache:  # pylint: disable=too-many-instance-attributes
+    """Two-tier cache of Alma Analytics responses keyed on the request content
+
+    The memory tier is an LRU bounded to max_entries and max_bytes. The persistent tier is a local directory if one
+    is given, or the duplicates-barcode-cache blob container otherwise. Entries older than ttl seconds are ignored in
+    both tiers, and deleted from the persistent tier when read or swept.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 16, directory: str | None = None,
+                 max_bytes: int = 64 * 1024 * 1024):
+        """Initialize the cache
+
+        Parameters:
+        ttl (float): The number of seconds an entry stays valid.
+        max_entries (int): The maximum number of entries in the memory tier.
+        directory (str): The local directory of the persistent tier, or None to use blob storage.
+        max_bytes (int): The maximum size of the response texts in the memory tier.
+
+        Returns:
+        None
+
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(payload: dict[str, Any]) -> str:
+        """Get the cache key of a request
+
+        Parameters:
+        payload (dict): The JSON body of the Alma Analytics request.
+
+        Returns:
+        str: The SHA-256 digest of the fields that determine the response.
+
+        """
+        content: dict[str, Any] = {name: payload.get(name) for name in CACHE_KEYS}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def get(self, payload: dict[str, Any]) -> str | None:
+        """Get a cached response
+
+        Parameters:
+        payload (dict): The JSON body of the Alma Analytics request.
+
+        Returns:
+        str: The cached response text, or None on a miss.
+
+        """
+        key: str = self.key(payload)
+        entry: tuple[float, str] | None = self.memory.get(key)
+
+        if entry is None:
+            try:
+                entry = self._read(key)
+            except Exception as e:
+                logging.warning("Error reading response cache: %s", str(e))
+
+        if entry is not None and time.time() - entry[0] > self.ttl:
+            self._forget(key)
+            try:
+                self._delete(key)
+            except Exception as e:
+                logging.warning("Error deleting expired response cache entry: %s", str(e))
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            self.log_stats()
+            return None
+
+        self._remember(key, entry)
+        self.hits += 1
+        self.log_stats()
+
+        return entry[1]
+
+    def put(self, payload: dict[str, Any], text: str) -> None:
+        """Cache a response
+
+        Parameters:
+        payload (dict): The JSON body of the Alma Analytics request.
+        text (str): The response text.
+
+        Returns:
+        None
+
+        """
+        key: str = self.key(payload)
+        entry: tuple[float, str] = (time.time(), text)
+        self._remember(key, entry)
+
+        try:
+            self._write(key, entry)
+        except Exception as e:
+            logging.warning("Error writing response cache: %s", str(e))
+
+    def log_stats(self) -> None:
+        """Log the hit and miss counters as a metric for Application Insights"""
+        logging.info("Alma response cache: hits=%s misses=%s", self.hits, self.misses)
+
+    def sweep(self) -> int:
+        """Delete the expired entries of the persistent tier
+
+        Returns:
+        int: The number of entries deleted.
+
+        """
+        cutoff: float = time.time() - self.ttl
+
+        if self.directory:
+            if not os.path.isdir(self.directory):
+                return 0
+            expired: list[str] = [
+                name for name in os.listdir(self.directory)
+                if os.path.getmtime(os.path.join(self.directory, name)) < cutoff
+            ]
+            for name in expired:
+                os.remove(os.path.join(self.directory, name))
+        else:
+            container_client = get_container_client(CACHE_CONTAINER)
+            modified_before: datetime = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+            expired = [blob.name for blob in container_client.list_blobs() if blob.last_modified < modified_before]
+            for start in range(0, len(expired), DELETE_BATCH_SIZE):
+                container_client.delete_blobs(*expired[start:start + DELETE_BATCH_SIZE], raise_on_any_failure=False)
+
+        logging.info("Swept %s expired responses from the response cache", len(expired))
+
+        return len(expired)
+
+    def _remember(self, key: str, entry: tuple[float, str]) -> None:
+        """Put an entry in the memory tier, evicting the least recently used entries
+
+        Responses larger than max_bytes are only kept in the persistent tier.
+
+        Parameters:
+        key (str): The cache key.
+        entry (tuple): The creation time and response text.
+
+        Returns:
+        None
+
+        """
+        self._forget(key)
+
+        size: int = sys.getsizeof(entry[1])
+        if size > self.max_bytes:
+            return
+
+        self.memory[key] = entry
+        self.memory_bytes += size
+        while len(self.memory) > self.max_entries or self.memory_bytes > self.max_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= sys.getsizeof(evicted[1])
+
+    def _forget(self, key: str) -> None:
+        """Remove an entry from the memory tier
+
+        Parameters:
+        key (str): The cache key.
+
+        Returns:
+        None
+
+        """
+        entry: tuple[float, str] | None = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= sys.getsizeof(entry[1])
+
+    def _read(self, key: str) -> tuple[float, str] | None:
+        """Read an entry from the persistent tier
+
+        Parameters:
+        key (str): The cache key.
+
+        Returns:
+        tuple: The creation time and response text, or None if there is no entry.
+
+        """
+        if self.directory:
+            path: str = os.path.join(self.directory, f'{key}.json')
+            if not os.path.exists(path):
+                return None
+            with open(path, encoding='utf-8') as file:
+                return os.path.getmtime(path), file.read()
+
+        try:
+            downloader = get_container_client(CACHE_CONTAINER).download_blob(f'{key}.json', encoding='utf-8')
+        except ResourceNotFoundError:
+            return None
+
+        return downloader.properties.last_modified.timestamp(), downloader.readall()
+
+    def _write(self, key: str, entry: tuple[float, str]) -> None:
+        """Write an entry to the persistent tier
+
+        Parameters:
+        key (str): The cache key.
+        entry (tuple): The creation time and response text.
+
+        Returns:
+        None
+
+        """
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f'{key}.json'), 'w', encoding='utf-8') as file:
+                file.write(entry[1])
+            return
+
+        container_client = get_container_client(CACHE_CONTAINER)
+        with_container(container_client, lambda: container_client.upload_blob(f'{key}.json', entry[1], overwrite=True))
+
+    def _delete(self, key: str) -> None:
+        """Delete an entry from the persistent tier if it exists
+
+        Parameters:
+        key (str): The cache key.
+
+        Returns:
+        None
+
+        """
+        if self.directory:
+            path: str = os.path.join(self.directory, f'{key}.json')
+            if os.path.exists(path):
+                os.remove(path)
+            return
+
+        try:
+            get_container_client(CACHE_CONTAINER).delete_blob(f'{key}.json')
+        except ResourceNotFoundError:
+            pass
+
+
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Get the response cache configured by the app settings
+
+    The cache is created once per process, so the memory tier and counters survive warm invocations.
+
+    Returns:
+    ResponseCache: The response cache, or None if ANALYTICS_CACHE_TTL is not set.
+
+    """
+    global _response_cache  # pylint: disable=global-statement
+
+    ttl: str | None = os.getenv('ANALYTICS_CACHE_TTL')
+
+    if not ttl:
+        return None
+
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            float(ttl),
+            int(os.getenv('ANALYTICS_CACHE_MAX_ENTRIES', '16')),
+            os.getenv('ANALYTICS_CACHE_DIR'),
+            int(os.getenv('ANALYTICS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+        )
+
+    return _response_cache
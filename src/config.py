@@ -0,0 +1,179 @@
+"""Database Configuration Module"""
+
+import logging
+import os
+import time
+from typing import Any
+
+from sqlalchemy import Column, Engine, MetaData, String, Table, create_engine, select
+
+metadata = MetaData()
+
+# Settings of a job, such as IZ, ANALYSIS_NAME or NEAR_DUPLICATE_MAX_DISTANCE
+job_settings = Table(
+    'job_settings', metadata,
+    Column('job', String(100), primary_key=True),
+    Column('name', String(100), primary_key=True),
+    Column('value', String(4000)),
+)
+
+# Email recipients of a job
+job_recipients = Table(
+    'job_recipients', metadata,
+    Column('job', String(100), primary_key=True),
+    Column('email', String(320), primary_key=True),
+)
+
+
+class ConfigProvider:
+    """Settings and recipients of a job, read from the database and cached for ttl seconds"""
+
+    def __init__(self, engine: Engine, job: str, ttl: float = 300):
+        """Initialize the provider
+
+        Parameters:
+        engine (Engine): The SQLAlchemy engine.
+        job (str): The name of the job in the database.
+        ttl (float): The number of seconds the settings are cached.
+
+        Returns:
+        None
+
+        """
+        self.engine = engine
+        self.job = job
+        self.ttl = ttl
+        self.loaded_at: float | None = None
+        self.settings: dict[str, str] = {}
+        self.recipients: list[str] = []
+
+    def load(self) -> None:
+        """Read the settings and recipients of the job, unless the cached copy is still valid
+
+        If the database cannot be read, the previous settings are kept until the next attempt after ttl seconds, so
+        an outage does not add a connection attempt to every setting lookup.
+        """
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+
+        self.loaded_at = time.monotonic()
+
+        try:
+            with self.engine.connect() as connection:
+                settings = connection.execute(
+                    select(job_settings.c.name, job_settings.c.value).where(job_settings.c.job == self.job)
+                )
+                self.settings = {str(name): str(value) for name, value in settings if value is not None}
+                recipients = connection.execute(
+                    select(job_recipients.c.email)
+                    .where(job_recipients.c.job == self.job)
+                    .order_by(job_recipients.c.email)
+                )
+                self.recipients = [str(email) for email, in recipients]
+        except Exception as e:
+            logging.warning("Error reading configuration from the database, using the cached settings: %s", str(e))
+
+    def get(self, name: str) -> str | None:
+        """Get a setting of the job
+
+        Parameters:
+        name (str): The setting name.
+
+        Returns:
+        str: The setting value, or None if the job does not set it.
+
+        """
+        self.load()
+        return self.settings.get(name)
+
+    def get_recipients(self) -> list[str]:
+        """Get the email recipients of the job
+
+        Returns:
+        list: The email addresses.
+
+        """
+        self.load()
+        return self.recipients
+
+
+_config_provider: ConfigProvider | None = None
+_config_unavailable: bool = False
+
+
+def config_from_db_enabled() -> bool:
+    """Check whether settings and recipients should be read from the database.
+
+    Returns:
+    bool: True if CONFIG_FROM_DB is set to true.
+
+    """
+    return os.getenv('CONFIG_FROM_DB', '').lower() == 'true'
+
+
+def get_config_provider() -> ConfigProvider | None:
+    """Get the configuration provider for the database in SQLALCHEMY_DB_URL
+
+    The engine and its connection pool are created once per process, so warm invocations reuse both the connections
+    and the cached settings. If the engine cannot be created, for example because the driver of the URL is not
+    installed, the app settings are used for the rest of the process.
+
+    Returns:
+    ConfigProvider: The provider, or None if CONFIG_FROM_DB is not enabled, SQLALCHEMY_DB_URL is not set or the
+    engine cannot be created.
+
+    """
+    global _config_provider, _config_unavailable  # pylint: disable=global-statement
+
+    url: str | None = os.getenv('SQLALCHEMY_DB_URL')
+
+    if not config_from_db_enabled() or not url or _config_unavailable:
+        return None
+
+    if _config_provider is None:
+        try:
+            engine: Engine = create_engine(url, pool_pre_ping=True, pool_recycle=1800)
+        except Exception as e:
+            logging.error("Error creating the configuration database engine, using the app settings: %s", str(e))
+            _config_unavailable = True
+            return None
+
+        _config_provider = ConfigProvider(
+            engine,
+            os.getenv('CONFIG_JOB', 'scf-duplicates'),
+            float(os.getenv('CONFIG_CACHE_TTL', '300'))
+        )
+
+    return _config_provider
+
+
+def get_setting(name: str, default: Any = None) -> Any:
+    """Get a setting from the database, falling back to the app setting of the same name
+
+    Parameters:
+    name (str): The setting name.
+    default (Any): The value if neither the database nor the app settings have the setting.
+
+    Returns:
+    Any: The setting value.
+
+    """
+    provider = get_config_provider()
+
+    value: str | None = provider.get(name) if provider is not None else None
+
+    return value if value is not None else os.getenv(name, default)
+
+
+def get_recipients() -> str | None:
+    """Get the email recipients from the database, falling back to EMAIL_RECIPIENTS
+
+    Returns:
+    str: The comma-separated email addresses.
+
+    """
+    provider = get_config_provider()
+
+    recipients: list[str] = provider.get_recipients() if provider is not None else []
+
+    return ','.join(recipients) if recipients else os.getenv('EMAIL_RECIPIENTS')
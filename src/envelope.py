@@ -0,0 +1,80 @@
+"""Queue Message Envelope Module"""
+
+import json
+import os
+import zlib
+from typing import Any
+
+import msgpack  # type:ignore[import-untyped]
+
+# The first byte of a compact message is its envelope version. JSON messages start with '{' instead.
+MSGPACK_VERSION = 1
+MSGPACK_ZLIB_VERSION = 2
+
+
+def compact_messages_enabled() -> bool:
+    """Check whether next request messages should use the compact envelope.
+
+    Returns:
+    bool: True if COMPACT_QUEUE_MESSAGES is set to true.
+
+    """
+    return os.getenv('COMPACT_QUEUE_MESSAGES', '').lower() == 'true'
+
+
+def encode_message(message: dict[str, Any]) -> bytes:
+    """Encode a queue message.
+
+    Compact messages are msgpack, compressed with zlib when that makes them smaller than
+    COMPRESS_MESSAGES_OVER bytes. Otherwise messages are JSON.
+
+    Parameters:
+    message (dict): The message.
+
+    Returns:
+    bytes: The encoded message.
+
+    """
+    if not compact_messages_enabled():
+        return json.dumps(message).encode()
+
+    packed: bytes = msgpack.packb(message)
+
+    if len(packed) > int(os.getenv('COMPRESS_MESSAGES_OVER', '1024')):
+        compressed: bytes = zlib.compress(packed)
+        if len(compressed) < len(packed):
+            return bytes([MSGPACK_ZLIB_VERSION]) + compressed
+
+    return bytes([MSGPACK_VERSION]) + packed
+
+
+def decode_message(body: bytes) -> dict[str, Any]:
+    """Decode a queue message of any envelope version.
+
+    Parameters:
+    body (bytes): The encoded message.
+
+    Returns:
+    dict: The message.
+
+    Raises:
+    ValueError: If the message cannot be decoded.
+
+    """
+    if not body:
+        raise ValueError("Empty message")
+
+    try:
+        if body[0] == MSGPACK_VERSION:
+            message: Any = msgpack.unpackb(body[1:])
+        elif body[0] == MSGPACK_ZLIB_VERSION:
+            message = msgpack.unpackb(zlib.decompress(body[1:]))
+        else:
+            message = json.loads(body.decode())
+    except (ValueError, TypeError, zlib.error, msgpack.UnpackException) as e:
+        raise ValueError(f"Invalid message: {e}") from e
+
+    if not isinstance(message, dict):
+        raise ValueError("Message is not an object")
+
+    return message
@@ -0,0 +1,128 @@
+"""Report Export Module"""
+
+import csv
+import io
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+from azure.storage.blob import BlobBlock, BlobClient, BlobSasPermissions, BlobServiceClient, ContentSettings
+from azure.storage.blob import generate_blob_sas
+
+from src.config import get_setting
+from src.storage import BLOCK_SIZE, ensure_container, get_container_client, stage_block
+
+REPORT_CONTAINER = 'duplicates-barcode-reports'
+
+
+def export_enabled() -> bool:
+    """Check whether the merged report should be exported to blob storage.
+
+    Returns:
+    bool: True if EXPORT_REPORT is set to true.
+
+    """
+    return os.getenv('EXPORT_REPORT', '').lower() == 'true'
+
+
+def export_report(columns: Any, rows: Iterable[list]) -> dict[str, Any] | None:
+    """Stream the merged report rows into a CSV blob.
+
+    Rows are written to staged blocks as they arrive, so the full report is never held in memory. Only the first
+    EXPORT_PREVIEW_ROWS rows are kept for the email preview.
+
+    Parameters:
+    columns (dict | list): The report columns.
+    rows (Iterable[list]): The report rows.
+
+    Returns:
+    dict: The download URL (None if no link could be signed), the row count and the preview rows, or None if the
+    export failed.
+
+    """
+    preview_size: int = int(get_setting('EXPORT_PREVIEW_ROWS', '50'))
+    headers: list = list(columns.values()) if isinstance(columns, dict) else list(columns)
+    blob_name: str = f"scf-duplicates-{datetime.now(timezone.utc):%Y-%m-%dT%H%M%S}.csv"
+
+    try:
+        container_client = get_container_client(REPORT_CONTAINER)
+        ensure_container(container_client)
+        blob_client: BlobClient = container_client.get_blob_client(blob_name)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        blocks: list[BlobBlock] = []
+        preview: list[list] = []
+        row_count: int = 0
+
+        for row in rows:
+            writer.writerow(row)
+            if row_count < preview_size:
+                preview.append(row)
+            row_count += 1
+
+            if buffer.tell() >= BLOCK_SIZE:
+                blocks.append(stage_block(blob_client, buffer.getvalue().encode(), len(blocks)))
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell() or not blocks:
+            blocks.append(stage_block(blob_client, buffer.getvalue().encode(), len(blocks)))
+
+        blob_client.commit_block_list(blocks, content_settings=ContentSettings(content_type='text/csv'))
+        url: str | None = get_download_url(blob_client)
+
+    except Exception as e:
+        logging.error("Error exporting report: %s", str(e))
+        return None
+
+    logging.info("Exported %s report rows to %s", row_count, blob_name)
+
+    return {
+        'url': url,
+        'row_count': row_count,
+        'preview': preview,
+    }
+
+
+def get_download_url(blob_client: BlobClient) -> str | None:
+    """Get a read-only download URL for the report blob.
+
+    The link is signed with the account key of the connection string, or with a user delegation key when the
+    storage credential is a managed identity. User delegation keys last at most 7 days.
+
+    Parameters:
+    blob_client (BlobClient): The blob client for the report.
+
+    Returns:
+    str: The blob URL with a SAS token valid for EXPORT_LINK_DAYS days, or None if the credential cannot sign one.
+
+    """
+    now: datetime = datetime.now(timezone.utc)
+    expiry: datetime = now + timedelta(days=int(os.getenv('EXPORT_LINK_DAYS', '30')))
+    account_key: str | None = getattr(blob_client.credential, 'account_key', None)
+    signing: dict[str, Any] = {}
+
+    if account_key:
+        signing['account_key'] = account_key
+    elif hasattr(blob_client.credential, 'get_token'):
+        expiry = min(expiry, now + timedelta(days=7))
+        blob_service = BlobServiceClient(f"{blob_client.scheme}://{blob_client.primary_hostname}",
+                                         credential=blob_client.credential)
+        signing['user_delegation_key'] = blob_service.get_user_delegation_key(now, expiry)
+    else:
+        logging.warning("The storage credential cannot sign a download link for %s", blob_client.blob_name)
+        return None
+
+    sas_token: str = generate_blob_sas(
+        account_name=blob_client.account_name,  # type:ignore[arg-type]
+        container_name=blob_client.container_name,
+        blob_name=blob_client.blob_name,
+        permission=BlobSasPermissions(read=True),
+        expiry=expiry,
+        **signing
+    )
+
+    return f"{blob_client.url}?{sas_token}"
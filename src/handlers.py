@@ -1,14 +1,156 @@
 """Analytics handlers module"""
 
-import json
 import logging
 import os
+import time
 import azure.functions as func
 import requests  # type:ignore[import-untyped]
-from src.processors import process_response
+from src.breaker import CircuitOpenError, get_circuit_breaker
+from src.cache import CachedResponse, get_response_cache
+from src.config import get_setting
+from src.envelope import decode_message
+from src.processors import process_response, process_stream
+from src.profiling import profiled, set_profile_run
+from src.replay import capture_enabled, capture_response
+from src.runs import acquire_run_lock, get_partition_filters, get_run, new_run, renew_run_lock, run_lock_enabled
+from src.storage import queue_request, resolve_columns
+from src.throttle import get_rate_limiter, parse_retry_after
+
+MAX_THROTTLED_ATTEMPTS = 3
+# Longest Retry-After waited out in the function without a shared rate limiter, longer ones park the request
+MAX_LOCAL_BACKOFF = 60.0
+
+
+def post_analytics(payload: dict) -> requests.Response | CachedResponse:
+    """Send a request to the Alma Analytics API, serving it from the response cache if possible.
+
+    Parameters:
+    payload (dict): The JSON body for the Alma Analytics API.
+
+    Returns:
+    requests.Response | CachedResponse: The response from the API or the cache.
+
+    Raises:
+    CircuitOpenError: If the circuit breaker is open.
+
+    """
+    cache = get_response_cache()
+
+    if cache:
+        text: str | None = cache.get(payload)
+        if text is not None:
+            return CachedResponse(text)
+
+    breaker = get_circuit_breaker()
+
+    if breaker:
+        retry_after: float = breaker.allow()
+        if retry_after:
+            raise CircuitOpenError(retry_after)
+
+    try:
+        response = send_throttled(payload)
+    except requests.RequestException:
+        if breaker:
+            breaker.record_failure()
+        raise
+
+    if breaker:
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    if cache and response.status_code == 200:
+        cache.put(payload, response.text)
+        return CachedResponse(response.text)
+
+    return response
+
+
+def send_throttled(payload: dict) -> requests.Response:
+    """Send a request to the Alma Analytics API, honoring the shared rate limit.
+
+    A 429 response is retried after its Retry-After, shared with every instance through the rate limiter if one is
+    configured and waited out locally otherwise. A 429 whose Retry-After is longer than MAX_LOCAL_BACKOFF is returned
+    when there is no rate limiter, so the caller can park the request.
+
+    Parameters:
+    payload (dict): The JSON body for the Alma Analytics API.
+
+    Returns:
+    requests.Response: The response from the API.
+
+    """
+    limiter = get_rate_limiter()
+
+    for attempt in range(1, MAX_THROTTLED_ATTEMPTS + 1):
+        if limiter:
+            try:
+                limiter.acquire()
+            except Exception as e:
+                logging.warning("Rate limiter unavailable, sending request anyway: %s", str(e))
+
+        response = requests.post(
+            os.getenv('HTTP_ALMA_ANALYTICS_URL'),  # type:ignore[arg-type]
+            json=payload,
+            headers={'x-functions-key': os.getenv('HTTP_ALMA_ANALYTICS_API_KEY')},
+            timeout=300,
+            stream=True
+        )
+
+        if response.status_code != 429 or attempt == MAX_THROTTLED_ATTEMPTS:
+            return response
+
+        retry_after: float = parse_retry_after(response.headers.get('Retry-After'))
+
+        if not limiter and retry_after > MAX_LOCAL_BACKOFF:
+            return response
+
+        response.close()
+        logging.warning("Alma Analytics throttled the request, retrying in %s seconds", retry_after)
+
+        if not limiter:
+            time.sleep(retry_after)
+            continue
+
+        try:
+            limiter.penalize(retry_after)
+        except Exception as e:
+            logging.warning("Rate limiter unavailable, backing off locally: %s", str(e))
+            time.sleep(retry_after)
+
+    return response
+
+
+def handle_response(response: requests.Response | CachedResponse, run: dict, elapsed: float | None = None) -> None:
+    """Process a successful response, parsing it incrementally if STREAM_RESPONSES is enabled.
+
+    Responses are captured for replay instead of streamed when CAPTURE_RESPONSES is enabled.
+
+    Parameters:
+    response (requests.Response | CachedResponse): The response from the API or the cache.
+    run (dict): The run context of the request.
+    elapsed (float): The number of seconds the request took, or None if unknown.
+
+    Returns:
+    None
+
+    """
+    set_profile_run(run)
+
+    if capture_enabled():
+        capture_response(response.text, run, elapsed)
+        process_response(response.text, run)
+    elif isinstance(response, requests.Response) and os.getenv('STREAM_RESPONSES', '').lower() == 'true':
+        response.raw.decode_content = True
+        process_stream(response.raw, run)  # type:ignore[arg-type]
+    else:
+        process_response(response.text, run)
 
 
 # noinspection PyUnusedLocal
+@profiled
 def start_analytics(req: func.TimerRequest) -> None:  # pylint: disable=unused-argument
     """Process a timer trigger to start analytics data collection.
 
@@ -21,17 +163,29 @@ def start_analytics(req: func.TimerRequest) -> None:  # pylint: disable=unused-a
     """
     logging.info("Starting analytics data collection")
 
+    filters: list[str] = get_partition_filters()
+    run: dict = new_run(len(filters) or 1)
+
+    if run_lock_enabled() and not acquire_run_lock(run):
+        return
+
+    if filters:
+        start_partitions(filters, run)
+        return
+
+    started: float = time.monotonic()
+    payload: dict = {
+        'iz': get_setting('IZ'),
+        'analysis': get_setting('ANALYSIS_NAME')
+    }
+
     try:
         # Call Alma Analytics API
-        response = requests.post(
-            os.getenv('HTTP_ALMA_ANALYTICS_URL'),  # type:ignore[arg-type]
-            json={
-                'iz': os.getenv('IZ'),
-                'analysis': os.getenv('ANALYSIS_NAME')
-            },
-            headers={'x-functions-key': os.getenv('HTTP_ALMA_ANALYTICS_API_KEY')},
-            timeout=300
-        )
+        response = post_analytics(payload)
+    except CircuitOpenError as e:
+        logging.warning("Alma Analytics circuit is open")
+        park_request({**payload, **run}, e.retry_after)
+        return
     except requests.RequestException as e:
         logging.error("Request failed: %s", e)
         return
@@ -39,13 +193,47 @@ def start_analytics(req: func.TimerRequest) -> None:  # pylint: disable=unused-a
         logging.error("An error occurred: %s", e)
         return
 
+    if response.status_code == 429:
+        logging.warning("Alma Analytics throttled the request")
+        park_request({**payload, **run}, parse_retry_after(response.headers.get('Retry-After')))
+        return
+
     if response.status_code != 200:
         logging.warning(response.text)
         return
 
-    process_response(response.text)
+    handle_response(response, run, time.monotonic() - started)
+
 
+def start_partitions(filters: list[str], run: dict | None = None) -> None:
+    """Queue the first request of every partition so the partitions are extracted in parallel.
 
+    Parameters:
+    filters (list): The Alma Analytics filter expression of each partition.
+    run (dict): The run context. A new run is started if not given.
+
+    Returns:
+    None
+
+    """
+    if run is None:
+        run = new_run(len(filters))
+    logging.info("Starting run %s with %s partitions", run['batch_id'], len(filters))
+
+    try:
+        for partition, analysis_filter in enumerate(filters):
+            queue_request({
+                'iz': get_setting('IZ'),
+                'analysis': get_setting('ANALYSIS_NAME'),
+                'filter': analysis_filter,
+                **run,
+                'partition': partition,
+            })
+    except Exception as e:
+        logging.error("Error queueing partition requests: %s", str(e))
+
+
+@profiled
 def send_next_request(msg: func.QueueMessage) -> None:
     """Process the queue message and send the next request to Alma Analytics API.
 
@@ -59,21 +247,38 @@ def send_next_request(msg: func.QueueMessage) -> None:
     logging.info("Sending next request to Alma Analytics API")
 
     try:
-        message_body = msg.get_body().decode()
-        message_data = json.loads(message_body)
+        message_data = decode_message(msg.get_body())
     except (ValueError, TypeError) as e:
         logging.error("Invalid message format: %s", str(e))
         return
 
+    run: dict = get_run(message_data)
+
     try:
-        response = requests.post(
-            os.getenv('HTTP_ALMA_ANALYTICS_URL'),  # type:ignore[arg-type]
-            json=message_data,
-            headers={'x-functions-key': os.getenv('HTTP_ALMA_ANALYTICS_API_KEY')},
-            timeout=300
-        )
+        message_data = resolve_columns(message_data)
+    except Exception as e:
+        logging.error("Error loading columns: %s", str(e))
+        return
+
+    if run_lock_enabled() and not renew_run_lock(run):
+        return
+
+    started: float = time.monotonic()
+
+    try:
+        response = post_analytics(message_data)
+
+        if response.status_code == 429:
+            logging.warning("Alma Analytics throttled the request")
+            park_request(message_data, parse_retry_after(response.headers.get('Retry-After')))
+            return
+
         response.raise_for_status()
 
+    except CircuitOpenError as e:
+        logging.warning("Alma Analytics circuit is open")
+        park_request(message_data, e.retry_after)
+        return
     except requests.RequestException as e:
         logging.error("Error processing API request: %s", str(e))
         return
@@ -85,4 +290,24 @@ def send_next_request(msg: func.QueueMessage) -> None:
         logging.warning(response.text)
         return
 
-    process_response(response.text)
+    handle_response(response, run, time.monotonic() - started)
+
+
+def park_request(message: dict, delay: float) -> None:
+    """Put a request back in the next request queue, hidden until Alma Analytics may accept it again.
+
+    Parameters:
+    message (dict): The request.
+    delay (float): The number of seconds to hide the request for.
+
+    Returns:
+    None
+
+    """
+    logging.warning("Parking the request for %.0f seconds", delay)
+
+    try:
+        # Queue messages can be hidden for at most 7 days
+        queue_request(message, min(int(delay) + 1, 7 * 24 * 3600))
+    except Exception as e:
+        logging.error("Error parking request: %s", str(e))
@@ -0,0 +1,202 @@
+"""Duplicate History Module"""
+
+import itertools
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator
+
+import pyarrow as pa  # type:ignore[import-untyped]
+import pyarrow.dataset as ds  # type:ignore[import-untyped]
+import pyarrow.parquet as pq  # type:ignore[import-untyped]
+from pyarrow.fs import AzureFileSystem, FileSystem, LocalFileSystem  # type:ignore[import-untyped]
+
+from src.storage import ensure_container, get_barcode_key, get_container_client
+
+HISTORY_CONTAINER = 'duplicates-barcode-history'
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('month', pa.int8())]), flavor='hive')
+
+
+def history_enabled() -> bool:
+    """Check whether each run's duplicate clusters should be appended to the history dataset.
+
+    Returns:
+    bool: True if RECORD_HISTORY is set to true.
+
+    """
+    return os.getenv('RECORD_HISTORY', '').lower() == 'true'
+
+
+def get_history_filesystem() -> tuple[FileSystem, str]:
+    """Get the filesystem and base directory of the history dataset.
+
+    Returns:
+    tuple: A local filesystem and HISTORY_DIR if it is set, or the duplicates-barcode-history blob container.
+
+    """
+    directory: str | None = os.getenv('HISTORY_DIR')
+
+    if directory:
+        return LocalFileSystem(), directory
+
+    container_client = get_container_client(HISTORY_CONTAINER)
+    ensure_container(container_client)
+    filesystem = AzureFileSystem(
+        account_name=container_client.account_name,
+        account_key=container_client.credential.account_key
+    )
+
+    return filesystem, HISTORY_CONTAINER
+
+
+class HistoryWriter:  # pylint: disable=too-many-instance-attributes
+    """Writer of one run's rows to the history dataset, in batches of HISTORY_BATCH_ROWS
+
+    Each run is one Parquet file under year=/month= partitions of the run date. Every report value is stored as text,
+    since Alma Analytics columns differ between analyses.
+    """
+
+    def __init__(self, columns: Any, run: dict[str, Any]):
+        """Initialize the writer
+
+        Parameters:
+        columns (dict | list): The report columns.
+        run (dict): The run context.
+
+        Returns:
+        None
+
+        """
+        self.labels: list[str] = [str(label) for label in (columns.values() if isinstance(columns, dict) else columns)]
+        self.fields: list = list(columns.keys()) if isinstance(columns, dict) else list(range(len(self.labels)))
+        self.run_id: str = run['batch_id']
+        self.run_date = datetime.fromtimestamp(int(run['batch_id'].split('-', 1)[0]), timezone.utc).date()
+        self.schema = pa.schema(
+            [('run_id', pa.string()), ('run_date', pa.date32()), ('cluster_size', pa.int32())]
+            + [(label, pa.string()) for label in self.labels]
+        )
+        self.batch_size: int = int(os.getenv('HISTORY_BATCH_ROWS', '10000'))
+        self.batch: list[dict[str, Any]] = []
+        self.writer: pq.ParquetWriter | None = None
+        self.failed = False
+
+    def add(self, row: Any, cluster_size: int | None) -> None:
+        """Add a report row
+
+        Parameters:
+        row (dict | list): The report row.
+        cluster_size (int): The number of rows with the same barcode, or None if there is no barcode column.
+
+        Returns:
+        None
+
+        """
+        if self.failed:
+            return
+
+        values: list = [row.get(field) for field in self.fields] if isinstance(row, dict) else list(row)
+        self.batch.append({
+            'run_id': self.run_id,
+            'run_date': self.run_date,
+            'cluster_size': cluster_size,
+            **{label: None if value is None else str(value) for label, value in zip(self.labels, values)},
+        })
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows, opening the run's file on the first write"""
+        if self.failed or not self.batch:
+            return
+
+        try:
+            if self.writer is None:
+                filesystem, base = get_history_filesystem()
+                directory: str = f"{base}/year={self.run_date.year}/month={self.run_date.month}"
+                filesystem.create_dir(directory, recursive=True)
+                self.writer = pq.ParquetWriter(f"{directory}/run-{self.run_id}.parquet", self.schema,
+                                               filesystem=filesystem)
+            self.writer.write_batch(pa.RecordBatch.from_pylist(self.batch, schema=self.schema))
+        except Exception as e:
+            logging.error("Error recording history: %s", str(e))
+            self.failed = True
+
+        self.batch = []
+
+    def close(self) -> None:
+        """Write the remaining rows and close the run's file"""
+        self.flush()
+
+        if self.writer is None or self.failed:
+            return
+
+        try:
+            self.writer.close()
+        except Exception as e:
+            logging.error("Error recording history: %s", str(e))
+            return
+
+        logging.info("Recorded run %s in the duplicate history", self.run_id)
+
+
+def record_history(columns: Any, rows: Iterable[Any], run: dict[str, Any]) -> Iterator[Any]:
+    """Pass the report rows through unchanged while appending them to the history dataset.
+
+    Each row is recorded with the run ID, the run date and the size of its barcode's cluster in the report. A failure
+    to write the history is logged and does not stop the report.
+
+    Parameters:
+    columns (dict | list): The report columns.
+    rows (Iterable): The report rows, sorted by barcode.
+    run (dict): The run context.
+
+    Returns:
+    Iterator: The rows.
+
+    """
+    history = HistoryWriter(columns, run)
+    key = get_barcode_key(columns)
+
+    if key is None:
+        for row in rows:
+            history.add(row, None)
+            yield row
+    else:
+        for _, group in itertools.groupby(rows, key):
+            cluster: list[Any] = list(group)
+            for row in cluster:
+                history.add(row, len(cluster))
+                yield row
+
+    history.close()
+
+
+def query_history(columns: list[str] | None = None, where: Any = None) -> pa.Table:
+    """Query the history of every run's duplicate clusters.
+
+    Filters on year and month prune whole partitions. The other filters are pushed down to the Parquet row groups,
+    and only the requested columns are read. For example, the runs a barcode has been duplicated in since 2025:
+
+        query_history(['run_date', 'cluster_size'], (ds.field('year') >= 2025) & (ds.field('Barcode') == '39000123'))
+
+    Parameters:
+    columns (list): The columns to read, or None to read every column.
+    where (pyarrow.dataset.Expression): The row filter, or None to read every row.
+
+    Returns:
+    pyarrow.Table: The matching rows.
+
+    """
+    filesystem, base = get_history_filesystem()
+    dataset = ds.dataset(base, filesystem=filesystem, format='parquet', partitioning=PARTITIONING)
+
+    # Runs can have different columns, so unify the schemas of the partitions being read
+    fragments: list = list(dataset.get_fragments(filter=where))
+    if not fragments:
+        return pa.table({name: pa.array([], pa.string()) for name in columns or []})
+
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments] + [PARTITIONING.schema])
+    dataset = ds.dataset(base, schema=schema, filesystem=filesystem, format='parquet', partitioning=PARTITIONING)
+
+    return dataset.to_table(columns=columns, filter=where)
@@ -0,0 +1,363 @@
+"""Barcode Index Module"""
+
+import base64
+import hashlib
+import itertools
+import logging
+import math
+import os
+import zlib
+from typing import Any, Callable, Iterable, Iterator
+
+from src.storage import delete_state, get_page_name, get_state, put_state
+
+
+class BloomFilter:
+    """Bloom filter of barcodes, used once a run has too many barcodes to index exactly"""
+
+    def __init__(self, size: int, hashes: int, bits: bytearray | None = None):
+        """Initialize the Bloom filter
+
+        Parameters:
+        size (int): The number of bits.
+        hashes (int): The number of hash functions.
+        bits (bytearray): The existing bits, or None for an empty filter.
+
+        Returns:
+        None
+
+        """
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = 0.01) -> 'BloomFilter':
+        """Create a Bloom filter sized for a number of barcodes
+
+        Parameters:
+        capacity (int): The expected number of barcodes.
+        error_rate (float): The acceptable false positive rate.
+
+        Returns:
+        BloomFilter: The empty Bloom filter.
+
+        """
+        size: int = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        return cls(size, max(1, round(size / capacity * math.log(2))))
+
+    def _positions(self, item: str) -> Iterator[int]:
+        """Get the bit positions of an item using double hashing
+
+        Parameters:
+        item (str): The item.
+
+        Returns:
+        Iterator[int]: The bit positions.
+
+        """
+        digest: bytes = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> bool:
+        """Add an item to the filter
+
+        Parameters:
+        item (str): The item.
+
+        Returns:
+        bool: True if the item was probably added before.
+
+        """
+        present: bool = True
+        for position in self._positions(item):
+            if not self.bits[position // 8] & (1 << position % 8):
+                present = False
+                self.bits[position // 8] |= 1 << position % 8
+
+        return present
+
+    def to_dict(self) -> dict[str, Any]:
+        """Serialize the filter
+
+        Returns:
+        dict: The size, hash count and compressed bits.
+
+        """
+        return {
+            'size': self.size,
+            'hashes': self.hashes,
+            'bits': base64.b64encode(zlib.compress(bytes(self.bits))).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> 'BloomFilter':
+        """Deserialize a filter
+
+        Parameters:
+        data (dict): The serialized filter.
+
+        Returns:
+        BloomFilter: The filter.
+
+        """
+        return cls(data['size'], data['hashes'], bytearray(zlib.decompress(base64.b64decode(data['bits']))))
+
+
+class BarcodeIndex:
+    """Index of the barcodes seen by one partition of a run
+
+    Small runs map every barcode to the pages it appears on, so duplicates and the pages holding them are known
+    exactly. Past exact_limit barcodes the index switches to a Bloom filter plus the barcodes it reported as seen
+    before, which are duplicate candidates that the final step still has to confirm.
+    """
+
+    def __init__(self, exact_limit: int, capacity: int):
+        """Initialize an empty index
+
+        Parameters:
+        exact_limit (int): The number of barcodes to index exactly.
+        capacity (int): The expected number of barcodes, used to size the Bloom filter.
+
+        Returns:
+        None
+
+        """
+        self.exact_limit = exact_limit
+        self.capacity = capacity
+        self.pages: dict[str, list[int]] | None = {}
+        self.bloom: BloomFilter | None = None
+        self.candidates: set[str] = set()
+        self.indexed: list[int] = []
+        self.complete = True
+
+    def add_page(self, page: int, barcodes: Iterable[str]) -> None:
+        """Add the barcodes of a page
+
+        Parameters:
+        page (int): The page number.
+        barcodes (Iterable[str]): The barcodes on the page.
+
+        Returns:
+        None
+
+        """
+        if page in self.indexed:
+            return  # Redelivered page
+
+        self.indexed.append(page)
+
+        for barcode in barcodes:
+            if self.pages is not None:
+                self.pages.setdefault(barcode, []).append(page)
+                if len(self.pages) > self.exact_limit:
+                    self._to_sketch()
+            elif self.bloom.add(barcode):  # type:ignore[union-attr]
+                self.candidates.add(barcode)
+
+    def _to_sketch(self) -> None:
+        """Switch from exact pages to a Bloom filter and duplicate candidates"""
+        self.bloom = BloomFilter.for_capacity(max(self.capacity, self.exact_limit * 2))
+
+        for barcode, pages in (self.pages or {}).items():
+            self.bloom.add(barcode)
+            if len(pages) > 1:
+                self.candidates.add(barcode)
+
+        self.pages = None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Serialize the index
+
+        Returns:
+        dict: The serialized index.
+
+        """
+        data: dict[str, Any] = {'indexed': self.indexed, 'complete': self.complete}
+
+        if self.pages is not None:
+            data['pages'] = self.pages
+        else:
+            data['bloom'] = self.bloom.to_dict()  # type:ignore[union-attr]
+            data['candidates'] = sorted(self.candidates)
+
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any] | None, exact_limit: int, capacity: int) -> 'BarcodeIndex':
+        """Deserialize an index
+
+        Parameters:
+        data (dict): The serialized index, or None for an empty index.
+        exact_limit (int): The number of barcodes to index exactly.
+        capacity (int): The expected number of barcodes.
+
+        Returns:
+        BarcodeIndex: The index.
+
+        """
+        index = cls(exact_limit, capacity)
+
+        if data is None:
+            return index
+
+        index.indexed = data['indexed']
+        index.complete = data['complete']
+
+        if 'pages' in data:
+            index.pages = data['pages']
+        else:
+            index.pages = None
+            index.bloom = BloomFilter.from_dict(data['bloom'])
+            index.candidates = set(data['candidates'])
+
+        return index
+
+
+def detection_enabled() -> bool:
+    """Check whether the report should be reduced to duplicate barcodes.
+
+    Returns:
+    bool: True if DETECT_DUPLICATES is set to true.
+
+    """
+    return os.getenv('DETECT_DUPLICATES', '').lower() == 'true'
+
+
+def get_index_name(run: dict[str, Any], partition: int) -> str:
+    """Get the name of the shared state entity of a partition's barcode index
+
+    Parameters:
+    run (dict): The run context.
+    partition (int): The partition.
+
+    Returns:
+    str: The state entity name.
+
+    """
+    return f"index-{run['batch_id']}-{partition:03d}"
+
+
+def load_index(run: dict[str, Any], partition: int) -> tuple[BarcodeIndex, str | None]:
+    """Load the barcode index of a partition
+
+    Parameters:
+    run (dict): The run context.
+    partition (int): The partition.
+
+    Returns:
+    tuple: The index and its ETag.
+
+    """
+    state, etag = get_state(get_index_name(run, partition))
+    index = BarcodeIndex.from_dict(
+        state,
+        int(os.getenv('INDEX_EXACT_LIMIT', '50000')),
+        int(os.getenv('INDEX_EXPECTED_BARCODES', '1000000'))
+    )
+
+    return index, etag
+
+
+def update_barcode_index(run: dict[str, Any], rows: Iterable[Any], key: Callable[[Any], str] | None) -> None:
+    """Add the barcodes of a page to the run's barcode index
+
+    Parameters:
+    run (dict): The run context of the page.
+    rows (Iterable): The rows of the page.
+    key (Callable): The barcode key, or None if the page could not be indexed.
+
+    Returns:
+    None
+
+    """
+    barcodes: list[str] = [key(row) for row in rows] if key else []
+
+    try:
+        while True:
+            index, etag = load_index(run, run['partition'])
+            if key is None:
+                index.complete = False
+            else:
+                index.add_page(run['page'], barcodes)
+            if put_state(get_index_name(run, run['partition']), index.to_dict(), etag):
+                return
+    except Exception as e:
+        logging.error("Error updating barcode index: %s", str(e))
+
+
+def resolve_duplicates(run: dict[str, Any]) -> tuple[set[str] | None, set[str] | None]:
+    """Resolve the duplicate barcodes of a finished run from its partitions' indexes
+
+    Parameters:
+    run (dict): The run context.
+
+    Returns:
+    tuple: The duplicate candidate barcodes and the names of the pages holding them. Either is None when it is
+    unknown, and every row or page must be checked.
+
+    """
+    try:
+        indexes: list[BarcodeIndex] = [load_index(run, partition)[0] for partition in range(run['partitions'])]
+    except Exception as e:
+        logging.error("Error loading barcode index: %s", str(e))
+        return None, None
+
+    if not all(index.complete for index in indexes):
+        return None, None
+
+    if any(index.pages is None for index in indexes):
+        if len(indexes) > 1:
+            return None, None  # Bloom filters cannot tell which barcodes appear in several partitions
+        return indexes[0].candidates, None
+
+    pages: dict[str, list[str]] = {}
+    for partition, index in enumerate(indexes):
+        for barcode, numbers in (index.pages or {}).items():
+            names: list[str] = [get_page_name({**run, 'partition': partition, 'page': page})[1] for page in numbers]
+            pages.setdefault(barcode, []).extend(names)
+
+    duplicates: set[str] = {barcode for barcode, names in pages.items() if len(names) > 1}
+    logging.info("Barcode index found %s duplicate barcodes in run %s", len(duplicates), run['batch_id'])
+
+    return duplicates, {name for barcode in duplicates for name in pages[barcode]}
+
+
+def delete_barcode_indexes(run: dict[str, Any]) -> None:
+    """Delete the barcode indexes of a finished run
+
+    Parameters:
+    run (dict): The run context.
+
+    Returns:
+    None
+
+    """
+    try:
+        for partition in range(run['partitions']):
+            delete_state(get_index_name(run, partition))
+    except Exception as e:
+        logging.error("Error deleting barcode index: %s", str(e))
+
+
+def iter_duplicates(rows: Iterable[Any], key: Callable[[Any], str], candidates: set[str] | None) -> Iterator[Any]:
+    """Keep only the rows whose barcode appears more than once
+
+    Parameters:
+    rows (Iterable): The rows of the run, sorted by barcode.
+    key (Callable): The barcode key.
+    candidates (set): The duplicate candidate barcodes, or None to check every row.
+
+    Returns:
+    Iterator: The rows of duplicate barcodes.
+
+    """
+    if candidates is not None:
+        rows = (row for row in rows if key(row) in candidates)
+
+    for _, group in itertools.groupby(rows, key):
+        cluster: list[Any] = list(group)
+        if len(cluster) > 1:
+            yield from cluster
@@ -0,0 +1,205 @@
+"""Near-Duplicate Barcode Module"""
+
+import heapq
+import itertools
+import os
+from typing import Callable, Iterable, Iterator
+
+from src.config import get_setting
+
+# Characters a scanner or OCR commonly reads in place of a digit
+OCR_CONFUSABLES = str.maketrans('OQDILZSBG', '000112586')
+
+
+def near_duplicates_enabled() -> bool:
+    """Check whether near-duplicate barcodes should be reported.
+
+    Returns:
+    bool: True if DETECT_NEAR_DUPLICATES is set to true.
+
+    """
+    return os.getenv('DETECT_NEAR_DUPLICATES', '').lower() == 'true'
+
+
+def find_near_duplicates(barcodes: set[str], max_distance: int | None = None,
+                         limit: int | None = None) -> tuple[int, list[list[str]]]:
+    """Find pairs of different barcodes that are probably the same barcode mistyped or misread.
+
+    Every check uses a blocking key or a set lookup, so the work grows with the number of barcodes times their
+    length instead of with every pair of barcodes:
+
+    - leading zeros: the barcodes are equal once leading zeros are dropped
+    - ocr: the barcodes are equal once letters commonly misread for digits are replaced
+    - substitution, insertion/deletion and transposition: the barcodes are one edit apart
+
+    Barcodes are issued in sequential ranges, so almost every barcode is one digit substitution or transposition away
+    from another valid barcode. Those edits are only reported if NEAR_DUPLICATE_DIGIT_EDITS is set to true.
+
+    The pairs are counted as they are found, and only the first limit pairs are kept, so memory does not grow with
+    the number of pairs.
+
+    Parameters:
+    barcodes (set): The distinct barcodes of the run.
+    max_distance (int): 0 to only report leading zeros and OCR errors, 1 to also report single edits. Defaults to
+    NEAR_DUPLICATE_MAX_DISTANCE.
+    limit (int): The number of pairs to keep. Defaults to NEAR_DUPLICATE_EMAIL_LIMIT.
+
+    Returns:
+    tuple: The number of pairs found, and the first limit sorted [barcode, barcode, reason] triples.
+
+    """
+    if max_distance is None:
+        max_distance = int(get_setting('NEAR_DUPLICATE_MAX_DISTANCE', '1'))
+
+    if limit is None:
+        limit = int(get_setting('NEAR_DUPLICATE_EMAIL_LIMIT', '100'))
+
+    digit_edits: bool = str(get_setting('NEAR_DUPLICATE_DIGIT_EDITS', '')).lower() == 'true'
+    count: int = 0
+
+    def iter_counted() -> Iterator[list[str]]:
+        nonlocal count
+        for pair in iter_near_duplicates(barcodes, max_distance, digit_edits):
+            count += 1
+            yield pair
+
+    first: list[list[str]] = heapq.nsmallest(limit, iter_counted())
+
+    return count, first
+
+
+def iter_near_duplicates(barcodes: set[str], max_distance: int, digit_edits: bool) -> Iterator[list[str]]:
+    """Find each pair of near-duplicate barcodes once, with the first reason that matches it.
+
+    Parameters:
+    barcodes (set): The distinct barcodes of the run.
+    max_distance (int): 0 to only report leading zeros and OCR errors, 1 to also report single edits.
+    digit_edits (bool): Whether to report a digit substituted or transposed with another digit.
+
+    Returns:
+    Iterator[list]: The [barcode, barcode, reason] triples, the smaller barcode first.
+
+    """
+    for group in iter_blocks(barcodes, strip_zeros):
+        for first, second in itertools.combinations(group, 2):
+            yield [first, second, 'leading zeros']
+
+    for group in iter_blocks(barcodes, ocr_key):
+        for first, second in itertools.combinations(group, 2):
+            yield [first, second, 'ocr']
+
+    if max_distance < 1:
+        return
+
+    for first, second, reason in iter_edit_pairs(barcodes, digit_edits):
+        # Skip the pairs already reported as leading zeros or OCR errors
+        if strip_zeros(first) != strip_zeros(second) and ocr_key(first) != ocr_key(second):
+            yield [min(first, second), max(first, second), reason]
+
+
+def strip_zeros(barcode: str) -> str:
+    """Get the leading zeros blocking key of a barcode.
+
+    Parameters:
+    barcode (str): The barcode.
+
+    Returns:
+    str: The barcode without leading zeros.
+
+    """
+    return barcode.lstrip('0')
+
+
+def ocr_key(barcode: str) -> str:
+    """Get the OCR blocking key of a barcode.
+
+    Parameters:
+    barcode (str): The barcode.
+
+    Returns:
+    str: The barcode with letters commonly misread for digits replaced by the digits.
+
+    """
+    return barcode.upper().translate(OCR_CONFUSABLES)
+
+
+def iter_edit_pairs(barcodes: set[str], digit_edits: bool) -> Iterator[tuple[str, str, str]]:
+    """Find pairs of barcodes one substitution, insertion, deletion or transposition apart, each pair once.
+
+    Substitutions share a blocking key with the substituted position deleted, one position at a time so only one key
+    per barcode is held in memory. Insertions, deletions and transpositions are looked up in the set of barcodes.
+
+    Parameters:
+    barcodes (set): The distinct barcodes of the run.
+    digit_edits (bool): Whether to report a digit substituted or transposed with another digit.
+
+    Returns:
+    Iterator[tuple]: The barcode pairs and the kind of edit between them.
+
+    """
+    for position in range(max((len(barcode) for barcode in barcodes), default=0)):
+        for group in iter_blocks(
+                (barcode for barcode in barcodes if len(barcode) > position),
+                lambda barcode, i=position: barcode[:i] + barcode[i + 1:]  # type:ignore[misc]
+        ):
+            if digit_edits:
+                pairs: Iterable[tuple[str, str]] = itertools.combinations(group, 2)
+            else:
+                digits: list[str] = [barcode for barcode in group if barcode[position].isdigit()]
+                others: list[str] = [barcode for barcode in group if not barcode[position].isdigit()]
+                pairs = itertools.chain(itertools.combinations(others, 2), itertools.product(others, digits))
+            for first, second in pairs:
+                yield first, second, 'substitution'
+
+    for barcode in barcodes:
+        shorter_found: set[str] = set()
+        for position, character in enumerate(barcode):
+            shorter: str = barcode[:position] + barcode[position + 1:]
+            if shorter in barcodes and shorter not in shorter_found:
+                shorter_found.add(shorter)
+                yield barcode, shorter, 'insertion/deletion'
+
+            if position == len(barcode) - 1 or (not digit_edits and character.isdigit()
+                                                and barcode[position + 1].isdigit()):
+                continue
+
+            swapped: str = barcode[:position] + barcode[position + 1] + character + barcode[position + 2:]
+            # Each pair is found from both barcodes, so only report it from the smaller one
+            if swapped > barcode and swapped in barcodes:
+                yield barcode, swapped, 'transposition'
+
+
+def iter_blocks(barcodes: Iterable[str], key: Callable[[str], str]) -> Iterator[list[str]]:
+    """Group barcodes by a blocking key, yielding only the groups with more than one barcode.
+
+    Parameters:
+    barcodes (Iterable[str]): The barcodes.
+    key (Callable): The blocking key.
+
+    Returns:
+    Iterator[list]: The groups of barcodes sharing a key.
+
+    """
+    blocks: dict[str, list[str]] = {}
+
+    for barcode in barcodes:
+        blocks.setdefault(key(barcode), []).append(barcode)
+
+    return (sorted(group) for group in blocks.values() if len(group) > 1)
+
+
+def collect_barcodes(rows: Iterable[list], key: Callable[[list], str], barcodes: set[str]) -> Iterator[list]:
+    """Pass rows through unchanged while collecting their barcodes.
+
+    Parameters:
+    rows (Iterable): The rows of the run.
+    key (Callable): The barcode key.
+    barcodes (set): Receives the barcodes.
+
+    Returns:
+    Iterator: The rows.
+
+    """
+    for row in rows:
+        barcodes.add(key(row).strip())
+        yield row
@@ -2,16 +2,30 @@
 
 import json
 import logging
-from typing import Any
+import os
+from typing import Any, BinaryIO, Iterator
 
+import ijson  # type:ignore[import-untyped]
+from ijson.common import ObjectBuilder  # type:ignore[import-untyped]
+
+from src.envelope import compact_messages_enabled
+from src.export import export_enabled, export_report
+from src.history import history_enabled, record_history
+from src.index import delete_barcode_indexes, detection_enabled, iter_duplicates, resolve_duplicates
+from src.index import update_barcode_index
+from src.near_duplicates import collect_barcodes, find_near_duplicates, near_duplicates_enabled
+from src.runs import delete_partitions, finish_partition, new_run, release_run_lock, run_lock_enabled
 from src.storage import set_blob_data, set_next_request, get_container_client, merge_blob_data, queue_email
+from src.storage import delete_blob_data, get_barcode_key, iter_run_rows, set_blob_chunks, delete_columns
+from src.storage import delete_run_pages
 
 
-def process_response(response_text: str) -> None:
+def process_response(response_text: str, run: dict[str, Any] | None = None) -> None:
     """Process the response from Alma Analytics API
 
     Parameters:
     response_text (str): The response text from the API.
+    run (dict): The run context of the request. A new single-partition run is started if not given.
 
     Returns:
     None
@@ -24,16 +38,255 @@ def process_response(response_text: str) -> None:
         logging.error("Error processing response: %s", str(e))
         return
 
+    if run is None:
+        run = new_run()
+
     if data['status'] == 'success':
+        if detection_enabled():
+            update_barcode_index(run, data['data']['rows'], get_barcode_key(data['data'].get('columns')))
+
         if data['data']['is_finished'] == 'false':
             # Not finished, save data and queue next request
-            batch_id = set_blob_data(data)
-            set_next_request(data, batch_id)  # type:ignore[arg-type]
+            batch_id = set_blob_data(data, run)
+            set_next_request(data, batch_id, run)  # type:ignore[arg-type]
         else:
-            # Final batch, merge all data and send email
-            container_client = get_container_client()
-            merged_data = merge_blob_data(container_client, data['data'])
-            queue_email(merged_data)
+            if run['partitions'] > 1:
+                # Partitioned run, only the last partition to finish merges every partition's pages
+                set_blob_data(data, run)
+            finish_run(data, run, page_stored=run['partitions'] > 1)
+
+
+def process_stream(stream: BinaryIO, run: dict[str, Any] | None = None) -> None:
+    """Process a streamed response from Alma Analytics API
+
+    Rows are parsed one at a time and written straight into page storage, so the response is never held in memory.
+
+    Parameters:
+    stream (BinaryIO): The response body.
+    run (dict): The run context of the request. A new single-partition run is started if not given.
+
+    Returns:
+    None
+
+    """
+    if run is None:
+        run = new_run()
+
+    envelope: dict[str, Any] = {}
+    batch_id = set_blob_chunks(iter_stream_json(stream, envelope), run)
+
+    if batch_id is None:
+        return
+
+    if envelope.get('status') != 'success':
+        logging.warning("Alma Analytics request failed: %s", json.dumps(envelope))
+        delete_blob_data(run)
+        return
+
+    if detection_enabled():
+        # The rows were not kept, so the final step has to check every row of the run
+        update_barcode_index(run, [], None)
+
+    if envelope['data']['is_finished'] == 'false':
+        # Not finished, queue next request
+        set_next_request(envelope, batch_id, run)
+    else:
+        finish_run(envelope, run, page_stored=True)
+
+
+def finish_run(data: Any, run: dict[str, Any], page_stored: bool) -> None:
+    """Merge the pages of a finished run and send the email
+
+    Parameters:
+    data (dict): The final batch data.
+    run (dict): The run context of the final batch.
+    page_stored (bool): Whether the rows of the final batch were stored as a page.
+
+    Returns:
+    None
+
+    """
+    if not finish_partition(run):
+        return
+
+    merge_data: dict[str, Any] = {
+        'batch_id': run['batch_id'],
+        'data': {**data['data'], 'rows': [] if page_stored else data['data']['rows']},
+    }
+
+    # Final batch, merge all data and send email
+    container_client = get_container_client()
+    barcodes: set[str] | None = set() if near_duplicates_enabled() else None
+    rows: Iterator[Any] | None = iter_report_rows(container_client, merge_data, run, barcodes)
+
+    if history_enabled():
+        rows = record_history(
+            merge_data['data'].get('columns'),
+            rows if rows is not None else iter_run_rows(container_client, merge_data),
+            run
+        )
+
+    if export_enabled():
+        email_data: Any = export_merged_data(container_client, merge_data, rows, run, barcodes)
+    else:
+        email_data = merge_blob_data(container_client, merge_data, rows)['data']
+
+    if barcodes:
+        # Every row has been read once the report is built, so the barcodes are complete
+        count, near_duplicates = find_near_duplicates(barcodes)
+        logging.info("Found %s near-duplicate barcode pairs in run %s", count, run['batch_id'])
+        email_data = {**email_data, 'near_duplicates': near_duplicates, 'near_duplicate_count': count}
+
+    if queue_email(email_data):
+        # The report has been sent, so the pages are no longer needed to build it again
+        delete_run_pages(container_client, run)
+
+    delete_partitions(run)
+
+    if detection_enabled():
+        delete_barcode_indexes(run)
+
+    if compact_messages_enabled():
+        delete_columns(run)
+
+    if run_lock_enabled():
+        release_run_lock(run)
+
+
+def iter_report_rows(container_client: Any, data: Any, run: dict[str, Any],
+                     barcodes: set[str] | None = None) -> Iterator[Any] | None:
+    """Iterate over the rows to report for a finished run
+
+    The barcode index built along the chain limits the work to candidate barcodes, and to the pages holding them when
+    the index is exact. Collecting barcodes for near-duplicate detection needs every page.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    data (dict): The batch ID of the run and the final batch data.
+    run (dict): The run context.
+    barcodes (set): Receives the barcodes of every row, or None to not collect them.
+
+    Returns:
+    Iterator: The rows of duplicate barcodes sorted by barcode if DETECT_DUPLICATES is set, or every row if only
+    barcodes are collected, or None if neither is needed.
+
+    """
+    if not detection_enabled() and barcodes is None:
+        return None
+
+    key = get_barcode_key(data['data'].get('columns'))
+
+    if key is None:
+        logging.warning("No %s column, reporting every row", os.getenv('BARCODE_COLUMN', 'barcode'))
+        return iter_run_rows(container_client, data)
+
+    if not detection_enabled():
+        return collect_barcodes(iter_run_rows(container_client, data), key, barcodes)  # type:ignore[arg-type]
+
+    candidates, pages = resolve_duplicates(run)
+
+    if barcodes is not None:
+        # Collecting barcodes needs every row of every page
+        return iter_duplicates(collect_barcodes(iter_run_rows(container_client, data), key, barcodes), key, candidates)
+
+    return iter_duplicates(iter_run_rows(container_client, data, pages, candidates), key, candidates)
+
+
+def iter_stream_rows(stream: BinaryIO, envelope: dict[str, Any]) -> Iterator[Any]:
+    """Parse a response incrementally, yielding its rows one at a time
+
+    Every field other than the rows is collected into envelope, which is complete once the rows are exhausted.
+
+    Parameters:
+    stream (BinaryIO): The response body.
+    envelope (dict): Receives the response without its rows.
+
+    Returns:
+    Iterator: The rows of the response.
+
+    """
+    envelope_builder = ObjectBuilder()
+    row_builder = ObjectBuilder()
+    depth: int = 0
+
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if not prefix.startswith('data.rows.'):
+            envelope_builder.event(event, value)
+            continue
+
+        row_builder.event(event, value)
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+
+        if depth == 0 and event != 'map_key':
+            yield row_builder.value
+            row_builder = ObjectBuilder()
+
+    envelope.update(envelope_builder.value)
+
+
+def iter_stream_json(stream: BinaryIO, envelope: dict[str, Any]) -> Iterator[str]:
+    """Re-serialize a streamed response as page JSON, one row at a time
+
+    Parameters:
+    stream (BinaryIO): The response body.
+    envelope (dict): Receives the response without its rows.
+
+    Returns:
+    Iterator[str]: The page JSON text in chunks.
+
+    """
+    yield '{"data": {"rows": ['
+    for index, row in enumerate(iter_stream_rows(stream, envelope)):
+        yield (', ' if index else '') + json.dumps(row)
+    yield ']'
+
+    # The envelope is complete once the rows have been consumed
+    for key, value in envelope.get('data', {}).items():
+        if key != 'rows':
+            yield f', {json.dumps(key)}: {json.dumps(value)}'
+    yield '}'
+    for key, value in envelope.items():
+        if key != 'data':
+            yield f', {json.dumps(key)}: {json.dumps(value)}'
+    yield '}'
+
+
+def export_merged_data(container_client: Any, data: Any, rows: Iterator[Any] | None = None,
+                       run: dict[str, Any] | None = None, barcodes: set[str] | None = None) -> Any:
+    """Export the merged rows to a CSV blob and return the email data with a preview
+
+    If the report cannot be exported or linked, the rows are sent inline instead, read again from the stored pages with
+    the same filtering as the export.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    data (dict): The batch ID of the run and the final batch data.
+    rows (Iterator): The rows of the run to export, or None to export every row.
+    run (dict): The run context, used to read the report rows again, or None to fall back to every row.
+    barcodes (set): Receives the barcodes of every row read again, or None to not collect them.
+
+    Returns:
+    dict: The final batch data with preview rows and a link to the full report.
+
+    """
+    final_data: Any = data['data']
+    report = export_report(final_data['columns'], rows if rows is not None else iter_run_rows(container_client, data))
+
+    if report is None or report['url'] is None:
+        # Fall back to sending the rows inline, read again from the stored pages
+        report_rows: Iterator[Any] | None = iter_report_rows(container_client, data, run, barcodes) \
+            if run is not None else None
+        return merge_blob_data(container_client, data, report_rows)['data']
+
+    return {
+        **final_data,
+        'rows': report['preview'],
+        'row_count': report['row_count'],
+        'report_url': report['url'],
+    }
 
 
 class AnalyticsProcessor:  # pylint: disable=too-few-public-methods
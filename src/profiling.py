@@ -0,0 +1,130 @@
+"""Handler Profiling Module"""
+
+import cProfile
+import functools
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Callable, TypeVar
+
+from src.storage import get_container_client, with_container
+
+DIAGNOSTICS_CONTAINER = 'duplicates-barcode-diagnostics'
+F = TypeVar('F', bound=Callable[..., Any])
+
+# The run context of the page being processed, used to name the profile blobs
+_profile_run: ContextVar[dict[str, Any] | None] = ContextVar('profile_run', default=None)
+
+
+def profiled(function: F) -> F:
+    """Profile 1 in PROFILE_SAMPLE_RATE calls of a handler
+
+    The setting is read once when the handler is decorated. If it is not set, the handler is returned unchanged, so
+    profiling costs nothing when disabled.
+
+    Parameters:
+    function (Callable): The handler entry point.
+
+    Returns:
+    Callable: The handler, wrapped to capture a profile on sampled calls.
+
+    """
+    sample_rate: int = int(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+
+    if sample_rate <= 0:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if random.randrange(sample_rate):
+            return function(*args, **kwargs)
+
+        token = _profile_run.set(None)
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        try:
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            save_profile(function.__name__, profiler, snapshot, _profile_run.get())
+            _profile_run.reset(token)
+
+    return wrapper  # type:ignore[return-value]
+
+
+def set_profile_run(run: dict[str, Any]) -> None:
+    """Record the run context of the page being processed, so its profile can be found by run ID and page
+
+    Parameters:
+    run (dict): The run context.
+
+    Returns:
+    None
+
+    """
+    _profile_run.set(run)
+
+
+def get_profile_name(function_name: str, run: dict[str, Any] | None) -> str:
+    """Get the blob name prefix of a profile
+
+    Parameters:
+    function_name (str): The name of the profiled handler.
+    run (dict): The run context of the page, or None if the handler did not reach a page.
+
+    Returns:
+    str: The blob name without extension.
+
+    """
+    if run is None:
+        return f"{function_name}/{int(time.time())}"
+
+    return f"batch-{run['batch_id']}/{run['partition']:03d}-{run['page']:06d}-{function_name}"
+
+
+def save_profile(function_name: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot,
+                 run: dict[str, Any] | None) -> None:
+    """Write a profile to the diagnostics container
+
+    The raw cProfile stats are stored as .prof, loadable with pstats or snakeviz, next to a .txt summary of the
+    slowest functions and the top allocations.
+
+    Parameters:
+    function_name (str): The name of the profiled handler.
+    profiler (cProfile.Profile): The finished profiler.
+    snapshot (tracemalloc.Snapshot): The allocations at the end of the call.
+    run (dict): The run context of the page, or None if the handler did not reach a page.
+
+    Returns:
+    None
+
+    """
+    name: str = get_profile_name(function_name, run)
+    limit: int = int(os.getenv('PROFILE_TOP_ENTRIES', '30'))
+
+    try:
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(limit)
+        summary.write('\nTop allocations:\n')
+        for stat in snapshot.statistics('lineno')[:limit]:
+            summary.write(f'{stat}\n')
+
+        profiler.create_stats()
+        container_client = get_container_client(DIAGNOSTICS_CONTAINER)
+        with_container(container_client, lambda: container_client.upload_blob(
+            f'{name}.prof', marshal.dumps(profiler.stats), overwrite=True
+        ))
+        container_client.upload_blob(f'{name}.txt', summary.getvalue(), overwrite=True)
+
+    except Exception as e:
+        logging.error("Error saving profile: %s", str(e))
+        return
+
+    logging.info("Saved profile %s", name)
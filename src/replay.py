@@ -0,0 +1,222 @@
+"""Response Capture and Replay Module"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import string
+import time
+from typing import Any
+
+from src.processors import process_response
+from src.runs import new_run
+from src.storage import get_container_client, with_container
+
+REPLAY_CONTAINER = 'duplicates-barcode-replay'
+REPLAY_QUEUE = 'duplicates-barcode-replay'
+
+
+def capture_enabled() -> bool:
+    """Check whether Alma Analytics responses should be captured for replay.
+
+    Returns:
+    bool: True if CAPTURE_RESPONSES is set to true and CAPTURE_SALT is set.
+
+    """
+    if os.getenv('CAPTURE_RESPONSES', '').lower() != 'true':
+        return False
+
+    if not os.getenv('CAPTURE_SALT'):
+        logging.warning("CAPTURE_RESPONSES needs CAPTURE_SALT to anonymize responses, not capturing")
+        return False
+
+    return True
+
+
+def anonymize_value(value: Any, salt: bytes) -> Any:
+    """Replace a text value with a keyed hash of the same length and character classes.
+
+    Equal values stay equal, so duplicate barcodes are still duplicates in the replay. Other values are kept.
+
+    Parameters:
+    value (Any): The value.
+    salt (bytes): The secret key.
+
+    Returns:
+    Any: The anonymized value.
+
+    """
+    if not isinstance(value, str):
+        return value
+
+    digest: bytes = hashlib.blake2b(value.encode(), key=salt[:64], digest_size=64).digest()
+    while len(digest) < len(value):
+        digest += hashlib.blake2b(digest, key=salt[:64], digest_size=64).digest()
+
+    characters: list[str] = []
+    for character, byte in zip(value, digest):
+        if character.isdigit():
+            characters.append(string.digits[byte % 10])
+        elif character.isupper():
+            characters.append(string.ascii_uppercase[byte % 26])
+        elif character.isalpha():
+            characters.append(string.ascii_lowercase[byte % 26])
+        else:
+            characters.append(character)
+
+    return ''.join(characters)
+
+
+def anonymize_response(data: Any, salt: bytes) -> Any:
+    """Anonymize the rows of a response, keeping its columns, shape and status.
+
+    Parameters:
+    data (dict): The response data.
+    salt (bytes): The secret key.
+
+    Returns:
+    dict: The response with anonymized rows and no resume token.
+
+    """
+    content: dict[str, Any] = dict(data.get('data') or {})
+
+    content['rows'] = [
+        {key: anonymize_value(value, salt) for key, value in row.items()} if isinstance(row, dict)
+        else [anonymize_value(value, salt) for value in row]
+        for row in content.get('rows', [])
+    ]
+    if 'resume' in content:
+        content['resume'] = 'replay'
+
+    return {**data, 'data': content}
+
+
+def capture_response(response_text: str, run: dict[str, Any], elapsed: float | None) -> None:
+    """Record an anonymized page response with its timing and size in the run's replay bundle.
+
+    Parameters:
+    response_text (str): The response text from the API.
+    run (dict): The run context of the page.
+    elapsed (float): The number of seconds the request took, or None if unknown.
+
+    Returns:
+    None
+
+    """
+    try:
+        page: dict[str, Any] = {
+            'partition': run['partition'],
+            'partitions': run['partitions'],
+            'page': run['page'],
+            'captured_at': time.time(),
+            'elapsed': elapsed,
+            'bytes': len(response_text.encode()),
+            'response': anonymize_response(json.loads(response_text), os.getenv('CAPTURE_SALT', '').encode()),
+        }
+        blob_name: str = f"batch-{run['batch_id']}/{run['partition']:03d}-{run['page']:06d}.json"
+
+        container_client = get_container_client(REPLAY_CONTAINER)
+        with_container(container_client, lambda: container_client.upload_blob(
+            blob_name, json.dumps(page), overwrite=True
+        ))
+    except Exception as e:
+        logging.error("Error capturing response: %s", str(e))
+
+
+def load_bundle(source: str) -> list[dict[str, Any]]:
+    """Load the pages of a replay bundle in capture order.
+
+    Parameters:
+    source (str): A local directory holding the page files, or the batch ID of a bundle in the replay container.
+
+    Returns:
+    list: The captured pages.
+
+    """
+    if os.path.isdir(source):
+        pages: list[dict[str, Any]] = []
+        for name in os.listdir(source):
+            with open(os.path.join(source, name), encoding='utf-8') as file:
+                pages.append(json.load(file))
+    else:
+        container_client = get_container_client(REPLAY_CONTAINER)
+        pages = [
+            json.loads(container_client.download_blob(blob.name).readall())
+            for blob in container_client.list_blobs(name_starts_with=f'batch-{source}/')
+        ]
+
+    return sorted(pages, key=lambda page: page['captured_at'])
+
+
+def replay_bundle(pages: list[dict[str, Any]], speed: float = 0) -> list[float]:
+    """Feed captured pages through process_response and the storage layer as a new run.
+
+    Next requests and emails are sent to the duplicates-barcode-replay queue instead of the live queues, so the replay
+    neither continues a chain nor sends mail. History, report exports and the run lock are turned off, so the replay
+    does not add to the live history or reports, or take the lock from a live run.
+
+    Parameters:
+    pages (list): The captured pages.
+    speed (float): How many times faster than captured to replay, or 0 to replay without waiting.
+
+    Returns:
+    list: The number of seconds each page took to process.
+
+    """
+    run: dict[str, Any] = new_run(pages[0]['partitions'] if pages else 1)
+    sinks: dict[str, str | None] = {
+        'NEXT_REQUEST_QUEUE': REPLAY_QUEUE,
+        'EMAIL_QUEUE': REPLAY_QUEUE,
+        'EMAIL_STORAGE_CONNECTION_STRING': os.getenv('AZURE_STORAGE_CONNECTION_STRING'),
+        'RECORD_HISTORY': None,
+        'EXPORT_REPORT': None,
+        'RUN_LOCK_SECONDS': None,
+    }
+    saved: dict[str, str | None] = {name: os.environ.get(name) for name in sinks}
+    timings: list[float] = []
+    started: float = time.monotonic()
+
+    try:
+        for name, value in sinks.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+        for page in pages:
+            if speed > 0:
+                due: float = (page['captured_at'] - pages[0]['captured_at']) / speed
+                time.sleep(max(0.0, due - (time.monotonic() - started)))
+
+            page_started: float = time.monotonic()
+            process_response(json.dumps(page['response']),
+                             {**run, 'partition': page['partition'], 'page': page['page']})
+            timings.append(time.monotonic() - page_started)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    logging.info("Replayed %s pages as run %s in %.2f seconds (slowest page %.2f seconds)",
+                 len(timings), run['batch_id'], sum(timings), max(timings, default=0))
+
+    return timings
+
+
+def main() -> None:
+    """Replay a bundle from the command line"""
+    parser = argparse.ArgumentParser(description="Replay captured Alma Analytics responses")
+    parser.add_argument('source', help="A local directory of page files, or the batch ID of a captured run")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="How many times faster than captured to replay, or 0 to replay without waiting")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    replay_bundle(load_bundle(arguments.source), arguments.speed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Analytics Run Module"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any
+
+from src.config import get_setting
+from src.storage import delete_state, get_state, put_state
+
+RUN_KEYS = ('batch_id', 'partition', 'partitions', 'page')
+RUN_LOCK = 'run-lock'
+
+
+def new_run(partitions: int = 1) -> dict[str, Any]:
+    """Create the context for a new run of the analysis
+
+    Every page of every partition is stored under the run's batch ID, so the final step can merge them. The batch ID
+    is the start time followed by a random suffix, so runs started in the same second still own the run lock
+    separately.
+
+    Parameters:
+    partitions (int): The number of partitions the analysis is split into.
+
+    Returns:
+    dict: The run context.
+
+    """
+    return {
+        'batch_id': f"{int(time.time())}-{uuid.uuid4().hex[:8]}",
+        'partition': 0,
+        'partitions': partitions,
+        'page': 0,
+    }
+
+
+def get_run(message_data: dict[str, Any]) -> dict[str, Any]:
+    """Get the run context from a next request message
+
+    Parameters:
+    message_data (dict): The queue message data.
+
+    Returns:
+    dict: The run context, with the columns reference of the message if it has one.
+
+    """
+    run: dict[str, Any] = new_run()
+    run.update({key: message_data[key] for key in RUN_KEYS + ('columns_ref',) if key in message_data})
+
+    return run
+
+
+def get_partition_filters() -> list[str]:
+    """Get the filters the analysis is partitioned by
+
+    Returns:
+    list: The Alma Analytics filter expressions from ANALYSIS_PARTITION_FILTERS, or an empty list if the analysis is
+    not partitioned.
+
+    """
+    setting: str | None = get_setting('ANALYSIS_PARTITION_FILTERS')
+
+    if not setting:
+        return []
+
+    try:
+        filters: Any = json.loads(setting)
+    except ValueError as e:
+        logging.error("Invalid ANALYSIS_PARTITION_FILTERS, running unpartitioned: %s", str(e))
+        return []
+
+    if not isinstance(filters, list) or not all(isinstance(f, str) for f in filters):
+        logging.error("ANALYSIS_PARTITION_FILTERS must be a JSON list of strings, running unpartitioned")
+        return []
+
+    return filters
+
+
+def finish_partition(run: dict[str, Any]) -> bool:
+    """Record that a partition has finished
+
+    Parameters:
+    run (dict): The run context of the finished partition.
+
+    Returns:
+    bool: True if this was the last partition to finish, so the caller should merge the run.
+
+    """
+    if run['partitions'] <= 1:
+        return True
+
+    name: str = get_partitions_name(run)
+
+    while True:
+        state, etag = get_state(name)
+        finished: list[int] = state['finished'] if state else []
+
+        if run['partition'] in finished:
+            # Redelivered message, the partition was already counted
+            return False
+
+        finished = sorted(finished + [run['partition']])
+        if put_state(name, {'partitions': run['partitions'], 'finished': finished}, etag):
+            logging.info("Partition %s of run %s finished (%s of %s)",
+                         run['partition'], run['batch_id'], len(finished), run['partitions'])
+            return len(finished) == run['partitions']
+
+
+def get_partitions_name(run: dict[str, Any]) -> str:
+    """Get the name of the shared state entity recording the finished partitions of a run
+
+    Parameters:
+    run (dict): The run context.
+
+    Returns:
+    str: The state entity name.
+
+    """
+    return f"run-{run['batch_id']}"
+
+
+def delete_partitions(run: dict[str, Any]) -> None:
+    """Delete the record of the finished partitions of a merged run
+
+    Parameters:
+    run (dict): The run context.
+
+    Returns:
+    None
+
+    """
+    if run['partitions'] <= 1:
+        return
+
+    try:
+        delete_state(get_partitions_name(run))
+    except Exception as e:
+        logging.error("Error deleting partitions: %s", str(e))
+
+
+def run_lock_enabled() -> bool:
+    """Check whether runs should hold the run lock.
+
+    Returns:
+    bool: True if RUN_LOCK_SECONDS is set.
+
+    """
+    return bool(os.getenv('RUN_LOCK_SECONDS'))
+
+
+def acquire_run_lock(run: dict[str, Any]) -> bool:
+    """Take the run lock for a new run, unless another run holds it
+
+    The lock expires RUN_LOCK_SECONDS after it was last renewed, so a chain that died does not block later runs.
+
+    Parameters:
+    run (dict): The run context of the new run.
+
+    Returns:
+    bool: True if the run holds the lock, or the lock could not be checked.
+
+    """
+    try:
+        while True:
+            now: float = time.time()
+            state, etag = get_state(RUN_LOCK)
+
+            if state and state['batch_id'] != run['batch_id'] and state['expires'] > now:
+                logging.warning("Run %s is still in progress, not starting run %s", state['batch_id'], run['batch_id'])
+                return False
+
+            lock: dict[str, Any] = {'batch_id': run['batch_id'], 'expires': now + get_lock_seconds()}
+            if put_state(RUN_LOCK, lock, etag):
+                logging.info("Run %s holds the run lock", run['batch_id'])
+                return True
+    except Exception as e:
+        logging.error("Error acquiring run lock, starting anyway: %s", str(e))
+        return True
+
+
+def renew_run_lock(run: dict[str, Any]) -> bool:
+    """Extend the run lock as the chain progresses, once half of it has passed
+
+    Parameters:
+    run (dict): The run context of the current page.
+
+    Returns:
+    bool: False if another run has taken the lock, so this chain should stop.
+
+    """
+    try:
+        while True:
+            now: float = time.time()
+            state, etag = get_state(RUN_LOCK)
+
+            if state and state['batch_id'] != run['batch_id'] and state['expires'] > now:
+                logging.warning("Run %s has taken the run lock, stopping run %s", state['batch_id'], run['batch_id'])
+                return False
+
+            if state and state['batch_id'] == run['batch_id'] and state['expires'] - now > get_lock_seconds() / 2:
+                return True
+
+            if put_state(RUN_LOCK, {'batch_id': run['batch_id'], 'expires': now + get_lock_seconds()}, etag):
+                return True
+    except Exception as e:
+        logging.error("Error renewing run lock: %s", str(e))
+        return True
+
+
+def release_run_lock(run: dict[str, Any]) -> None:
+    """Release the run lock once the run has finished
+
+    Parameters:
+    run (dict): The run context of the finished run.
+
+    Returns:
+    None
+
+    """
+    try:
+        state, _ = get_state(RUN_LOCK)
+        if state and state['batch_id'] == run['batch_id']:
+            delete_state(RUN_LOCK)
+            logging.info("Run %s released the run lock", run['batch_id'])
+    except Exception as e:
+        logging.error("Error releasing run lock: %s", str(e))
+
+
+def get_lock_seconds() -> float:
+    """Get the number of seconds the run lock lasts without being renewed.
+
+    Returns:
+    float: The RUN_LOCK_SECONDS setting.
+
+    """
+    return float(os.getenv('RUN_LOCK_SECONDS', '3600'))
@@ -1,35 +1,85 @@
 """Analytics Storage Module"""
 
+import base64
+import hashlib
+import heapq
+import io
+import itertools
 import json
 import time
 import logging
 import os
-from typing import Any
-from azure.storage.blob import BlobServiceClient, ContainerClient, BlobClient
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+import ijson  # type:ignore[import-untyped]
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, ContainerClient, BlobClient, BlobBlock
+from azure.storage.blob import StorageErrorCode as BlobErrorCode
 from azure.storage.queue import QueueClient, BinaryBase64EncodePolicy, BinaryBase64DecodePolicy
+from azure.storage.queue import StorageErrorCode as QueueErrorCode
 
+from src.config import get_recipients, get_setting
+from src.envelope import compact_messages_enabled, encode_message
 
-def set_blob_data(data: Any) -> str | None:
+BLOCK_SIZE = 4 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+# The most blobs a single batch delete request accepts
+DELETE_BATCH_SIZE = 256
+T = TypeVar('T')
+ROWS_PLACEHOLDER = '__rows__'
+SORTED_METADATA = {'sorted': 'barcode'}
+
+
+def set_blob_data(data: Any, run: dict[str, Any] | None = None) -> str | None:
     """Set blob data in Azure Blob Storage.
 
     Parameters:
     data (dict): The data to be stored in the blob.
+    run (dict): The run context of the page. Pages of a run are stored under its batch prefix.
 
     Returns:
     str: The batch ID of the blob.
 
     """
     container_client: ContainerClient = get_container_client()
+    batch_id, blob_name = get_page_name(run)
+    blob_client: BlobClient = container_client.get_blob_client(blob_name)
+    metadata: dict[str, str] | None = None
 
-    if not container_client.exists():
-        container_client.create_container()
+    key = get_barcode_key(data['data'].get('columns')) if isinstance(data.get('data'), dict) else None
+    if key is not None and 'rows' in data['data']:
+        # Store the page as a sorted run, so the final merge can stream pages in barcode order
+        data = {**data, 'data': {**data['data'], 'rows': sorted(data['data']['rows'], key=key)}}
+        metadata = SORTED_METADATA
 
-    batch_id: str = str(int(time.time()))
+    try:
+        with_container(container_client, lambda: upload_json_blob(blob_client, data, metadata))
+    except Exception as e:
+        logging.error("Error uploading blob: %s", str(e))
+        return None
+
+    return batch_id
 
-    blob_client: BlobClient = container_client.get_blob_client(f'{batch_id}.json')
+
+def set_blob_chunks(chunks: Iterable[str], run: dict[str, Any]) -> str | None:
+    """Set blob data in Azure Blob Storage from JSON text produced while it is being uploaded.
+
+    Parameters:
+    chunks (Iterable[str]): The JSON text of the page in chunks. It can only be consumed once.
+    run (dict): The run context of the page.
+
+    Returns:
+    str: The batch ID of the blob.
+
+    """
+    container_client: ContainerClient = get_container_client()
+    batch_id, blob_name = get_page_name(run)
 
     try:
-        blob_client.upload_blob(json.dumps(data), overwrite=True)
+        # The chunks cannot be replayed, so make sure the container exists before uploading
+        ensure_container(container_client)
+        upload_json_chunks(container_client.get_blob_client(blob_name), chunks)
     except Exception as e:
         logging.error("Error uploading blob: %s", str(e))
         return None
@@ -37,44 +87,274 @@ def set_blob_data(data: Any) -> str | None:
     return batch_id
 
 
-def set_next_request(data: Any, batch_id: str) -> None:
+def delete_blob_data(run: dict[str, Any]) -> None:
+    """Delete a page of a run from Azure Blob Storage.
+
+    Parameters:
+    run (dict): The run context of the page.
+
+    Returns:
+    None
+
+    """
+    try:
+        get_container_client().delete_blob(get_page_name(run)[1])
+    except Exception as e:
+        logging.error("Error deleting blob: %s", str(e))
+
+
+def get_page_name(run: dict[str, Any] | None) -> tuple[str, str]:
+    """Get the batch ID and blob name of a page.
+
+    Parameters:
+    run (dict): The run context of the page, or None for a standalone page.
+
+    Returns:
+    tuple: The batch ID and blob name.
+
+    """
+    if run is None:
+        batch_id: str = str(int(time.time()))
+        return batch_id, f'{batch_id}.json'
+
+    return run['batch_id'], f"batch-{run['batch_id']}/{run['partition']:03d}-{run['page']:06d}.json"
+
+
+def iter_page_json(data: Any) -> Iterator[str]:
+    """Serialize a page to JSON incrementally, one row at a time.
+
+    The output is identical to json.dumps(data), without building the whole string.
+
+    Parameters:
+    data (dict): The page data.
+
+    Returns:
+    Iterator[str]: The JSON text in chunks.
+
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('data'), dict) or 'rows' not in data['data']:
+        yield json.dumps(data)
+        return
+
+    envelope: dict[str, Any] = {**data, 'data': {**data['data'], 'rows': ROWS_PLACEHOLDER}}
+    head, tail = json.dumps(envelope).split(json.dumps(ROWS_PLACEHOLDER), 1)
+
+    yield head + '['
+    for index, row in enumerate(data['data']['rows']):
+        yield (', ' if index else '') + json.dumps(row)
+    yield ']' + tail
+
+
+def stage_block(blob_client: BlobClient, content: bytes, index: int) -> BlobBlock:
+    """Stage one block of a block blob.
+
+    Parameters:
+    blob_client (BlobClient): The blob client.
+    content (bytes): The content of the block.
+    index (int): The position of the block in the blob.
+
+    Returns:
+    BlobBlock: The staged block.
+
+    """
+    block_id: str = base64.b64encode(f'{index:08d}'.encode()).decode()
+    blob_client.stage_block(block_id, content)
+
+    return BlobBlock(block_id=block_id)
+
+
+def upload_json_blob(blob_client: BlobClient, data: Any, metadata: dict[str, str] | None = None) -> None:
+    """Upload data as a JSON blob, staging large pages as parallel blocks.
+
+    Parameters:
+    blob_client (BlobClient): The blob client.
+    data (dict): The data to be stored in the blob.
+    metadata (dict): The blob metadata.
+
+    Returns:
+    None
+
+    """
+    upload_json_chunks(blob_client, iter_page_json(data), metadata)
+
+
+def upload_json_chunks(blob_client: BlobClient, chunks: Iterable[str], metadata: dict[str, str] | None = None) -> None:
+    """Upload JSON text as a blob, staging large pages as parallel blocks.
+
+    Pages that fit in a single block are uploaded in one request. Larger pages are staged in BLOCK_SIZE blocks, with
+    up to BLOB_UPLOAD_CONCURRENCY blocks in flight, and committed once every block has been staged.
+
+    Parameters:
+    blob_client (BlobClient): The blob client.
+    chunks (Iterable[str]): The JSON text in chunks.
+    metadata (dict): The blob metadata.
+
+    Returns:
+    None
+
+    """
+    max_concurrency: int = int(os.getenv('BLOB_UPLOAD_CONCURRENCY', '4'))
+    buffer = io.BytesIO()
+    futures: list[Future] = []
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for chunk in chunks:
+            buffer.write(chunk.encode())
+
+            if buffer.tell() >= BLOCK_SIZE:
+                # Bound memory to the blocks in flight
+                in_flight: list[Future] = [future for future in futures if not future.done()]
+                if len(in_flight) >= max_concurrency:
+                    wait(in_flight, return_when=FIRST_COMPLETED)
+                futures.append(executor.submit(stage_block, blob_client, buffer.getvalue(), len(futures)))
+                buffer = io.BytesIO()
+
+        if not futures:
+            blob_client.upload_blob(buffer.getvalue(), overwrite=True, metadata=metadata)
+            return
+
+        if buffer.tell():
+            futures.append(executor.submit(stage_block, blob_client, buffer.getvalue(), len(futures)))
+
+    blob_client.commit_block_list([future.result() for future in futures], metadata=metadata)
+
+
+def set_next_request(data: Any, batch_id: str, run: dict[str, Any] | None = None) -> None:
     """Set next request in Azure Queue Storage.
 
     Parameters:
     data (dict): The data to be sent in the queue message.
     batch_id (str): The batch ID of the blob.
+    run (dict): The run context of the current page.
 
     Returns:
     None
 
     """
     try:
-        queue_client: QueueClient = QueueClient.from_connection_string(
-            conn_str=os.getenv('AZURE_STORAGE_CONNECTION_STRING'),  # type:ignore[arg-type]
-            queue_name=os.getenv('NEXT_REQUEST_QUEUE'),  # type:ignore[arg-type]
-            message_encode_policy=BinaryBase64EncodePolicy(),
-            message_decode_policy=BinaryBase64DecodePolicy()
-        )
-
         message: dict[str, Any] = {
-            'iz': os.getenv('IZ'),
-            'analysis': os.getenv('ANALYSIS_NAME'),
+            'iz': get_setting('IZ'),
+            'analysis': get_setting('ANALYSIS_NAME'),
             'resume': data['data']['resume'],
             'columns': data['data']['columns'],
             'batch_id': batch_id,
         }
+        if run is not None:
+            message.update({**run, 'batch_id': batch_id, 'page': run['page'] + 1})
+            message.pop('columns_ref', None)
+            if compact_messages_enabled():
+                message = reference_columns(message, run)
 
-        json_data: str = json.dumps(message)
-        encoded_data: bytes = json_data.encode()
-        queue_client.send_message(encoded_data)
+        queue_request(message)
 
     except Exception as e:
         logging.error("Error sending message to queue: %s", str(e))
 
 
-def get_container_client() -> ContainerClient:
+def queue_request(message: dict[str, Any], visibility_timeout: int | None = None) -> None:
+    """Queue a request for the Alma Analytics API in the next request queue.
+
+    Parameters:
+    message (dict): The request to be sent in the queue message.
+    visibility_timeout (int): The number of seconds before the message can be received, or None to send it now.
+
+    Returns:
+    None
+
+    """
+    queue_client: QueueClient = QueueClient.from_connection_string(
+        conn_str=os.getenv('AZURE_STORAGE_CONNECTION_STRING'),  # type:ignore[arg-type]
+        queue_name=os.getenv('NEXT_REQUEST_QUEUE'),  # type:ignore[arg-type]
+        message_encode_policy=BinaryBase64EncodePolicy(),
+        message_decode_policy=BinaryBase64DecodePolicy()
+    )
+
+    send_queue_message(queue_client, encode_message(message), visibility_timeout)
+
+
+def get_columns_name(run: dict[str, Any]) -> str:
+    """Get the name of the shared state entity holding the columns of a partition.
+
+    Parameters:
+    run (dict): The run context.
+
+    Returns:
+    str: The state entity name.
+
+    """
+    return f"columns-{run['batch_id']}-{run['partition']:03d}"
+
+
+def reference_columns(message: dict[str, Any], run: dict[str, Any]) -> dict[str, Any]:
+    """Replace the columns of a next request message with a reference to the partition's columns.
+
+    The columns are stored once, by the first page whose request did not reference them: the first page of the
+    partition, or the current page if compact messages were turned on mid-chain or storing them failed before.
+
+    Parameters:
+    message (dict): The next request message.
+    run (dict): The run context of the current page.
+
+    Returns:
+    dict: The message with a columns reference, or unchanged if the columns could not be stored.
+
+    """
+    name: str = get_columns_name(run)
+
+    if run.get('columns_ref') != name:
+        try:
+            # The entity already existing means another delivery of this page stored the columns
+            put_state(name, {'columns': message['columns']}, None)
+        except Exception as e:
+            logging.warning("Error storing columns, sending them inline: %s", str(e))
+            return message
+
+    return {**{key: value for key, value in message.items() if key != 'columns'}, 'columns_ref': name}
+
+
+def resolve_columns(message: dict[str, Any]) -> dict[str, Any]:
+    """Replace the columns reference of a next request message with the stored columns.
+
+    Parameters:
+    message (dict): The next request message.
+
+    Returns:
+    dict: The message with its columns inline.
+
+    """
+    if 'columns_ref' not in message:
+        return message
+
+    state, _ = get_state(message['columns_ref'])
+    if state is None:
+        raise ValueError(f"Columns {message['columns_ref']} not found")
+
+    return {**{key: value for key, value in message.items() if key != 'columns_ref'}, 'columns': state['columns']}
+
+
+def delete_columns(run: dict[str, Any]) -> None:
+    """Delete the stored columns of every partition of a finished run.
+
+    Parameters:
+    run (dict): The run context.
+
+    Returns:
+    None
+
+    """
+    try:
+        for partition in range(run['partitions']):
+            delete_state(get_columns_name({**run, 'partition': partition}))
+    except Exception as e:
+        logging.error("Error deleting columns: %s", str(e))
+
+
+def get_container_client(container_name: str = 'duplicates-barcode-data') -> ContainerClient:
     """Get container client for Azure Blob Storage.
 
+    Parameters:
+    container_name (str): The name of the blob container.
+
     Returns:
     ContainerClient: The container client for the blob storage.
 
@@ -82,18 +362,561 @@ def get_container_client() -> ContainerClient:
     blob_service: BlobServiceClient = BlobServiceClient.from_connection_string(
         os.getenv('AZURE_STORAGE_CONNECTION_STRING')  # type:ignore[arg-type]
     )
-    container_client: ContainerClient = blob_service.get_container_client(
-        'duplicates-barcode-data')
+    container_client: ContainerClient = blob_service.get_container_client(container_name)
 
     return container_client
 
 
-def merge_blob_data(container_client, data):
+# Containers known to exist in this process
+_ready_containers: set[str] = set()
+
+
+def ensure_container(container_client: ContainerClient) -> None:
+    """Create the container if needed, checking only once per process.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+
+    Returns:
+    None
+
+    """
+    if container_client.container_name in _ready_containers:
+        return
+
+    if not container_client.exists():
+        try:
+            container_client.create_container()
+        except ResourceExistsError:
+            pass  # Created by another instance in the meantime
+
+    _ready_containers.add(container_client.container_name)
+
+
+def with_container(container_client: ContainerClient, operation: Callable[[], T]) -> T:
+    """Run a blob operation, creating the container and retrying if it does not exist yet.
+
+    The container is assumed to exist, so the steady-state cost is the operation alone.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    operation (Callable): The blob operation.
+
+    Returns:
+    Any: The result of the operation.
+
+    """
+    try:
+        return operation()
+    except ResourceNotFoundError as e:
+        if getattr(e, 'error_code', None) != BlobErrorCode.CONTAINER_NOT_FOUND:
+            raise
+
+    try:
+        container_client.create_container()
+    except ResourceExistsError:
+        pass  # Created by another instance in the meantime
+    _ready_containers.add(container_client.container_name)
+
+    return operation()
+
+
+def send_queue_message(queue_client: QueueClient, content: bytes, visibility_timeout: int | None = None) -> None:
+    """Send a queue message, creating the queue and retrying if it does not exist yet.
+
+    Parameters:
+    queue_client (QueueClient): The queue client.
+    content (bytes): The message content.
+    visibility_timeout (int): The number of seconds before the message can be received, or None to send it now.
+
+    Returns:
+    None
+
+    """
+    kwargs: dict[str, Any] = {'visibility_timeout': visibility_timeout} if visibility_timeout else {}
+
+    try:
+        queue_client.send_message(content, **kwargs)
+        return
+    except ResourceNotFoundError as e:
+        if getattr(e, 'error_code', None) != QueueErrorCode.QUEUE_NOT_FOUND:
+            raise
+
+    try:
+        queue_client.create_queue()
+    except ResourceExistsError:
+        pass  # Created by another instance in the meantime
+
+    queue_client.send_message(content, **kwargs)
+
+
+STATE_CONTAINER = 'duplicates-barcode-state'
+
+
+def get_state(name: str) -> tuple[dict[str, Any] | None, str | None]:
+    """Get a shared state entity from Azure Blob Storage.
+
+    Shared state lets scaled-out instances coordinate (rate limits, locks, etc.). Each entity is a small
+    JSON blob whose ETag guards concurrent updates.
+
+    Parameters:
+    name (str): The name of the state entity.
+
+    Returns:
+    tuple: The state dict and its ETag, or (None, None) if the entity does not exist yet.
+
+    """
+    blob_client: BlobClient = get_container_client(STATE_CONTAINER).get_blob_client(f'{name}.json')
+
+    try:
+        downloader = blob_client.download_blob()
+    except ResourceNotFoundError:
+        return None, None
+
+    return json.loads(downloader.readall()), downloader.properties.etag
+
+
+def delete_state(name: str) -> None:
+    """Delete a shared state entity from Azure Blob Storage if it exists.
+
+    Parameters:
+    name (str): The name of the state entity.
+
+    Returns:
+    None
+
+    """
+    try:
+        get_container_client(STATE_CONTAINER).delete_blob(f'{name}.json')
+    except ResourceNotFoundError:
+        pass
+
+
+def put_state(name: str, state: dict[str, Any], etag: str | None) -> bool:
+    """Put a shared state entity in Azure Blob Storage if nobody else changed it first.
+
+    Parameters:
+    name (str): The name of the state entity.
+    state (dict): The new state.
+    etag (str): The ETag returned by get_state, or None to create the entity only if it does not exist.
+
+    Returns:
+    bool: True if the state was written, False if another instance won the race.
+
+    """
+    container_client: ContainerClient = get_container_client(STATE_CONTAINER)
+    blob_client: BlobClient = container_client.get_blob_client(f'{name}.json')
+
+    if etag is None:
+        kwargs: dict[str, Any] = {'overwrite': False}
+    else:
+        kwargs = {'overwrite': True, 'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+
+    try:
+        with_container(container_client, lambda: blob_client.upload_blob(json.dumps(state), **kwargs))
+    except (ResourceExistsError, ResourceModifiedError):
+        return False
+
+    return True
+
+
+def iter_page_rows(container_client: ContainerClient, prefix: str) -> Iterator[list]:
+    """Iterate over the rows of stored pages.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    prefix (str): The blob name prefix of the pages.
+
+    Returns:
+    Iterator[list]: The rows of every page, in listing order.
+
+    """
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        blob_client = container_client.get_blob_client(blob.name)
+        batch_data = json.loads(blob_client.download_blob().readall())
+        yield from batch_data['data']['rows']
+
+
+def delete_run_pages(container_client: ContainerClient, run: dict[str, Any]) -> None:
+    """Delete every stored page of a run.
+
+    Pages are only deleted once the report has been sent, so a failed export or email can still read them again.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    run (dict): The run context.
+
+    Returns:
+    None
+
+    """
+    try:
+        blobs = container_client.list_blobs(name_starts_with=f"batch-{run['batch_id']}/")
+        names: list[str] = [blob.name for blob in blobs]
+
+        for start in range(0, len(names), DELETE_BATCH_SIZE):
+            container_client.delete_blobs(*names[start:start + DELETE_BATCH_SIZE], raise_on_any_failure=False)
+    except Exception as e:
+        logging.error("Error deleting pages: %s", str(e))
+
+
+def iter_run_rows(container_client: ContainerClient, data: Any, pages: set[str] | None = None,
+                  candidates: set[str] | None = None) -> Iterator[list]:
+    """Iterate over the rows of the final batch and every stored page of a run.
+
+    When the barcode column is known, the sorted pages are k-way merged so duplicate barcodes come out as adjacent
+    runs, holding one download range per page in memory. Pages that were not stored sorted (such as streamed pages)
+    are sorted and stored again one at a time first. Otherwise the rows come out in listing order.
+    Repeated rows are dropped if DEDUP_ROWS is set to true. The pages are kept, so the rows can be read again if the
+    report cannot be sent.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    data (dict): The batch ID of the run and the final batch data.
+    pages (set): The names of the pages to read, or None to read every page.
+    candidates (set): The barcodes of the rows to read, or None to read every row. Only a process pool can decode
+    pages faster than this process, and only when it sends back just these rows.
+
+    Returns:
+    Iterator[list]: The rows of the run.
+
+    """
+    batch_prefix: str = f"batch-{data['batch_id']}"
+    columns: Any = data['data'].get('columns')
+    key = get_barcode_key(columns)
+
+    if key is None:
+        rows: Iterable[list] = itertools.chain(data['data']['rows'], iter_page_rows(container_client, batch_prefix))
+    else:
+        blobs: list = list(container_client.list_blobs(name_starts_with=batch_prefix, include=['metadata']))
+        wanted: list = [blob for blob in blobs if pages is None or blob.name in pages]
+        workers: int = get_decode_workers()
+
+        if workers > 1 and len(wanted) > 1 and candidates is not None:
+            runs: list[Iterator[list]] = decode_pages(container_client, wanted, columns, workers, candidates)
+        else:
+            runs = [iter_sorted_page(container_client, sort_page(container_client, blob, key), key) for blob in wanted]
+
+        rows = heapq.merge(sorted(data['data']['rows'], key=key), *runs, key=key)
+
+        if candidates is not None:
+            rows = (row for row in rows if key(row) in candidates)
+
+    if os.getenv('DEDUP_ROWS', '').lower() == 'true':
+        rows = iter_unique_rows(rows, columns)
+
+    yield from rows
+
+
+def iter_unique_rows(rows: Iterable[Any], columns: Any) -> Iterator[Any]:
+    """Drop rows repeated by overlapping pages, such as pages fetched again after a retry or a redelivered message.
+
+    Rows are compared by a 64-bit fingerprint of their DEDUP_KEY_COLUMNS, so memory is bounded by one integer per
+    distinct row instead of the rows themselves. Two items with the same barcode, title and location have identical
+    rows, which is what the report exists to show, so the key columns must include a unique item ID. Nothing is
+    dropped if DEDUP_KEY_COLUMNS is unset or names a column the report does not have.
+
+    Parameters:
+    rows (Iterable): The rows of the run.
+    columns (dict | list): The report columns.
+
+    Returns:
+    Iterator: The rows, without repeats.
+
+    """
+    names: list[str] = [name.strip() for name in os.getenv('DEDUP_KEY_COLUMNS', '').split(',') if name.strip()]
+    key = get_columns_key(columns, names)
+
+    if key is None:
+        logging.warning("DEDUP_ROWS needs DEDUP_KEY_COLUMNS to name the report's item ID column, not dropping rows")
+        yield from rows
+        return
+
+    fingerprints: set[int] = set()
+    dropped: int = 0
+
+    for row in rows:
+        digest: bytes = hashlib.blake2b(json.dumps(key(row), sort_keys=True).encode(), digest_size=8).digest()
+        fingerprint: int = int.from_bytes(digest, 'big')
+
+        if fingerprint in fingerprints:
+            dropped += 1
+            continue
+
+        fingerprints.add(fingerprint)
+        yield row
+
+    logging.info("Dropped %s repeated rows", dropped)
+
+
+def get_columns_key(columns: Any, names: list[str]) -> Callable[[Any], Any] | None:
+    """Get a function returning the values of some columns of a row.
+
+    Parameters:
+    columns (dict | list): The report columns.
+    names (list): The column names, matched case-insensitively.
+
+    Returns:
+    Callable: A function returning the values of the named columns, or None if no names are given or a name is not a
+    column.
+
+    """
+    wanted: set[str] = {name.lower() for name in names}
+    fields: list = list(columns.keys()) if isinstance(columns, dict) else list(range(len(columns or [])))
+    labels: list = list(columns.values()) if isinstance(columns, dict) else list(columns or [])
+    positions: list[int] = [index for index, label in enumerate(labels) if str(label).lower() in wanted]
+
+    if not wanted or {str(labels[index]).lower() for index in positions} != wanted:
+        return None
+
+    def key(row: Any) -> list:
+        if isinstance(row, dict):
+            return [row.get(fields[index]) for index in positions]
+        return [row[index] for index in positions]
+
+    return key
+
+
+def sort_page(container_client: ContainerClient, blob: Any, key: Callable[[Any], str]) -> Any:
+    """Store a page that was not stored sorted (such as a streamed page) again as a sorted run.
+
+    The merge starts reading every page at once, so only sorted pages, read one range at a time, keep its memory
+    bounded. Sorting the other pages one at a time before the merge holds a single page in memory.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    blob (BlobProperties): The page blob, listed with its metadata.
+    key (Callable): The barcode sort key.
+
+    Returns:
+    BlobProperties: The properties of the sorted page, or the page blob if it was already sorted or could not be
+    stored again.
+
+    """
+    if is_sorted_page(blob):
+        return blob
+
+    try:
+        data: Any = json.loads(container_client.download_blob(blob.name).readall())
+        data['data']['rows'].sort(key=key)
+        blob_client: BlobClient = container_client.get_blob_client(blob.name)
+        upload_json_blob(blob_client, data, SORTED_METADATA)
+        return blob_client.get_blob_properties()
+    except Exception as e:
+        logging.error("Error sorting page %s: %s", blob.name, str(e))
+        return blob
+
+
+def is_sorted_page(blob: Any) -> bool:
+    """Check whether a page was stored as a sorted run.
+
+    Parameters:
+    blob (BlobProperties): The page blob, listed with its metadata.
+
+    Returns:
+    bool: True if the page is marked as sorted by barcode.
+
+    """
+    return (blob.metadata or {}).get('sorted') == SORTED_METADATA['sorted']
+
+
+def iter_sorted_page(container_client: ContainerClient, blob: Any, key: Callable[[Any], str]) -> Iterator[list]:
+    """Iterate over the rows of a stored page in barcode order.
+
+    Pages stored as sorted runs are parsed incrementally while they are downloaded in READ_SIZE ranges. Other pages
+    (only pages that could not be sorted by sort_page) are downloaded whole and sorted on read.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    blob (BlobProperties): The page blob, listed with its metadata and size.
+    key (Callable): The barcode sort key.
+
+    Returns:
+    Iterator[list]: The rows of the page.
+
+    """
+    if is_sorted_page(blob):
+        reader = BlobRangeReader(container_client, blob.name, blob.size, READ_SIZE)
+        yield from ijson.items(reader, 'data.rows.item', use_float=True)
+    else:
+        yield from sorted(json.loads(container_client.download_blob(blob.name).readall())['data']['rows'], key=key)
+
+
+class BlobRangeReader:  # pylint: disable=too-few-public-methods
+    """File-like reader of a blob, downloading it one range at a time as it is read
+
+    A plain download fetches up to 32 MiB as soon as it is opened, so merging many pages would hold most of them in
+    memory at once. The reader only downloads the next range once the previous one has been read.
+    """
+
+    def __init__(self, container_client: ContainerClient, name: str, size: int, range_size: int):
+        """Initialize the reader
+
+        Parameters:
+        container_client (ContainerClient): The container client for the blob storage.
+        name (str): The blob name.
+        size (int): The blob size in bytes.
+        range_size (int): The number of bytes downloaded at a time.
+
+        Returns:
+        None
+
+        """
+        self.container_client = container_client
+        self.name = name
+        self.size = size
+        self.range_size = range_size
+        self.offset = 0
+        self.buffer = b''
+
+    def read(self, size: int = -1) -> bytes:
+        """Read bytes from the blob, downloading ranges as needed
+
+        Parameters:
+        size (int): The number of bytes to read, or -1 to read the rest of the blob.
+
+        Returns:
+        bytes: The bytes read, empty at the end of the blob.
+
+        """
+        while (size < 0 or len(self.buffer) < size) and self.offset < self.size:
+            length: int = min(self.range_size, self.size - self.offset)
+            self.buffer += self.container_client.download_blob(self.name, offset=self.offset, length=length).readall()
+            self.offset += length
+
+        content: bytes = self.buffer if size < 0 else self.buffer[:size]
+        self.buffer = self.buffer[len(content):]
+
+        return content
+
+
+def get_decode_workers() -> int:
+    """Get the number of processes decoding pages in the merge.
+
+    Returns:
+    int: The MERGE_DECODE_WORKERS setting, the number of cores if it is auto, or 0 if it is not set.
+
+    """
+    setting: str = os.getenv('MERGE_DECODE_WORKERS', '')
+
+    if setting.lower() == 'auto':
+        return os.cpu_count() or 1
+
+    return int(setting) if setting else 0
+
+
+def decode_pages(container_client: ContainerClient, blobs: list, columns: Any, workers: int,
+                 candidates: set[str]) -> list[Iterator[list]]:
+    """Decode pages in a process pool, so parsing uses every core instead of one.
+
+    Sending decoded rows back to this process costs about as much as parsing them, so the workers only send back the
+    rows of candidate barcodes, sorted. Pages are downloaded in this process and handed to the workers as raw bytes,
+    with at most one page per worker waiting to be decoded.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the blob storage.
+    blobs (list): The page blobs, listed with their metadata.
+    columns (dict | list): The report columns.
+    workers (int): The number of worker processes.
+    candidates (set): The barcodes of the rows to send back.
+
+    Returns:
+    list[Iterator[list]]: The rows of candidate barcodes of every page in barcode order.
+
+    """
+    futures: list[Future] = []
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(blobs)), initializer=set_decode_candidates,
+                             initargs=(candidates,)) as executor:
+        for blob in blobs:
+            # Bound memory to the pages in flight
+            in_flight: list[Future] = [future for future in futures if not future.done()]
+            if len(in_flight) >= workers:
+                wait(in_flight, return_when=FIRST_COMPLETED)
+            futures.append(executor.submit(
+                decode_page,
+                container_client.download_blob(blob.name).readall(),
+                columns,
+                is_sorted_page(blob)
+            ))
+
+    return [iter(future.result()) for future in futures]
+
+
+# The candidate barcodes of the merge, sent once to each worker process
+_decode_candidates: set[str] = set()
+
+
+def set_decode_candidates(candidates: set[str]) -> None:
+    """Receive the candidate barcodes in a worker process.
+
+    Parameters:
+    candidates (set): The barcodes of the rows to send back.
+
+    Returns:
+    None
+
+    """
+    global _decode_candidates  # pylint: disable=global-statement
+    _decode_candidates = candidates
+
+
+def decode_page(content: bytes, columns: Any, is_sorted: bool) -> list:
+    """Decode a page in a worker process, keeping only the rows of candidate barcodes.
+
+    Parameters:
+    content (bytes): The page JSON.
+    columns (dict | list): The report columns, used to rebuild the barcode key in the worker.
+    is_sorted (bool): Whether the page was stored sorted by barcode.
+
+    Returns:
+    list: The rows of candidate barcodes in barcode order.
+
+    """
+    key: Callable[[Any], str] = get_barcode_key(columns)  # type:ignore[assignment]
+    rows: list = [row for row in json.loads(content)['data']['rows'] if key(row) in _decode_candidates]
+
+    return rows if is_sorted else sorted(rows, key=key)
+
+
+def get_barcode_key(columns: Any) -> Callable[[Any], str] | None:
+    """Get a sort key for rows by their barcode.
+
+    Parameters:
+    columns (dict | list): The report columns.
+
+    Returns:
+    Callable: A function returning the barcode of a row, or None if there is no BARCODE_COLUMN column.
+
+    """
+    if not columns:
+        return None
+
+    name: str = os.getenv('BARCODE_COLUMN', 'barcode').lower()
+    fields: list = list(columns.keys()) if isinstance(columns, dict) else list(range(len(columns)))
+    names: list = list(columns.values()) if isinstance(columns, dict) else list(columns)
+
+    matches: list[int] = [index for index, column in enumerate(names) if str(column).lower() == name]
+
+    if not matches:
+        return None
+
+    index: int = matches[0]
+    field: Any = fields[index]
+
+    def key(row: Any) -> str:
+        return str(row.get(field, '') if isinstance(row, dict) else row[index])
+
+    return key
+
+
+def merge_blob_data(container_client, data, rows=None):
     """Merge blob data in Azure Blob Storage.
 
     Parameters:
     container_client (ContainerClient): The container client for the blob storage.
     data (dict): The data to be merged.
+    rows (Iterator): The rows of the run to keep, or None to keep every row.
 
     Returns:
     dict: The merged data.
@@ -102,16 +925,8 @@ def merge_blob_data(container_client, data):
     if 'batch_id' not in data:
         return data
 
-    batch_prefix = f"batch-{data['batch_id']}"
-
     try:
-        blob_list = container_client.list_blobs(name_starts_with=batch_prefix)
-
-        for blob in blob_list:
-            blob_client = container_client.get_blob_client(blob.name)
-            batch_data = json.loads(blob_client.download_blob().readall())
-            data['data']['rows'].extend(batch_data['data']['rows'])
-            blob_client.delete_blob()
+        data['data']['rows'] = list(rows if rows is not None else iter_run_rows(container_client, data))
     except Exception as e:
         logging.error("Error merging blob data: %s", str(e))
         # Return original data as fallback
@@ -119,14 +934,14 @@ def merge_blob_data(container_client, data):
     return data
 
 
-def queue_email(data: Any) -> None:
+def queue_email(data: Any) -> bool:
     """Queue email with complete data.
 
     Parameters:
     data (dict): The data to be sent in the email.
 
     Returns:
-    None
+    bool: True if the email was queued.
 
     """
     mail: dict[str, Any] = {
@@ -136,9 +951,25 @@ def queue_email(data: Any) -> None:
         'columns': data['columns'],
         'rows': data['rows'],
         'footer': 'This is an automated message. Please do not reply.',
-        'recipients': os.getenv('EMAIL_RECIPIENTS'),
-        'sender': os.getenv('EMAIL_SENDER'),
+        'recipients': get_recipients(),
+        'sender': get_setting('EMAIL_SENDER'),
     }
+    if 'report_url' in data:
+        # Large reports are exported to blob storage and only previewed in the email
+        mail['header'] += (f". Showing the first {len(data['rows'])} of {data['row_count']} rows. "
+                           f"Download the full report: {data['report_url']}")
+        mail['report_url'] = data['report_url']
+    if data.get('near_duplicates'):
+        # Pairs of barcodes that are probably the same barcode mistyped or misread
+        limit: int = int(get_setting('NEAR_DUPLICATE_EMAIL_LIMIT', '100'))
+        count: int = data.get('near_duplicate_count', len(data['near_duplicates']))
+        mail['header'] += (f". {count} pairs of near-duplicate barcodes were also found"
+                           + (f", showing the first {limit}" if count > limit else ""))
+        mail['near_duplicates'] = {
+            'columns': ['Barcode', 'Similar Barcode', 'Reason'],
+            'rows': data['near_duplicates'][:limit],
+        }
+
     try:
         queue_client: QueueClient = QueueClient.from_connection_string(
             conn_str=os.getenv('EMAIL_STORAGE_CONNECTION_STRING'),  # type:ignore[arg-type]
@@ -149,7 +980,10 @@ def queue_email(data: Any) -> None:
 
         json_data: str = json.dumps(mail)
         encoded_data: bytes = json_data.encode()
-        queue_client.send_message(encoded_data)
+        send_queue_message(queue_client, encoded_data)
 
     except Exception as e:
         logging.error("Error sending message to email queue: %s", str(e))
+        return False
+
+    return True
@@ -0,0 +1,78 @@
+"""Orphaned Page Sweeper Module"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from azure.storage.blob import ContainerClient
+
+from src.cache import get_response_cache
+from src.storage import DELETE_BATCH_SIZE, get_container_client
+
+
+def sweep_pages(timer: Any) -> None:  # pylint: disable=unused-argument
+    """Delete orphaned pages from the data container and expired responses from the response cache
+
+    Parameters:
+    timer (func.TimerRequest): The timer trigger request object.
+
+    Returns:
+    None
+
+    """
+    try:
+        sweep_orphaned_pages(get_container_client(), float(os.getenv('PAGE_MAX_AGE_HOURS', '72')))
+    except Exception as e:
+        logging.error("Error sweeping orphaned pages: %s", str(e))
+
+    cache = get_response_cache()
+
+    if cache:
+        try:
+            cache.sweep()
+        except Exception as e:
+            logging.error("Error sweeping response cache: %s", str(e))
+
+
+def sweep_orphaned_pages(container_client: ContainerClient, max_age_hours: float) -> dict[str, int]:
+    """Delete pages of runs that finished or were abandoned more than max_age_hours ago
+
+    Only the blob listing is read, never the page content. A run's pages are kept together until its newest page is
+    old enough, so a long-running chain is never swept halfway. Pages named by timestamp alone are swept by their own
+    age.
+
+    Parameters:
+    container_client (ContainerClient): The container client for the data container.
+    max_age_hours (float): The age after which a page is orphaned.
+
+    Returns:
+    dict: The number of pages deleted and the bytes reclaimed.
+
+    """
+    cutoff: datetime = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    runs: dict[str, list[Any]] = {}
+
+    for blob in container_client.list_blobs():
+        run: str = blob.name.split('/', 1)[0] if blob.name.startswith('batch-') else blob.name
+        runs.setdefault(run, []).append(blob)
+
+    orphans: list[Any] = [
+        blob for blobs in runs.values() if max(blob.last_modified for blob in blobs) < cutoff for blob in blobs
+    ]
+
+    deleted: int = 0
+    reclaimed: int = 0
+
+    for start in range(0, len(orphans), DELETE_BATCH_SIZE):
+        batch: list[Any] = orphans[start:start + DELETE_BATCH_SIZE]
+        responses = container_client.delete_blobs(*[blob.name for blob in batch], raise_on_any_failure=False)
+
+        for blob, response in zip(batch, responses):
+            if response.status_code < 300:
+                deleted += 1
+                reclaimed += blob.size or 0
+
+    logging.info("Swept %s orphaned pages, reclaimed %s bytes", deleted, reclaimed)
+
+    return {'deleted': deleted, 'reclaimed_bytes': reclaimed}
@@ -0,0 +1,182 @@
+"""Alma Analytics rate limiter module"""
+
+import logging
+import os
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+from src.storage import get_state, put_state
+
+
+class RateLimiter:
+    """Token bucket shared by every instance through a state blob"""
+
+    def __init__(self, name: str, rate: float, burst: float, max_wait: float = 120.0):
+        """Initialize the rate limiter
+
+        Parameters:
+        name (str): The name of the shared state entity.
+        rate (float): Tokens added per second.
+        burst (float): Maximum number of tokens in the bucket.
+        max_wait (float): Maximum seconds to wait for a token before proceeding anyway.
+
+        Returns:
+        None
+
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+
+    def _refill(self, state: dict[str, Any] | None, now: float) -> dict[str, Any]:
+        """Return the bucket state refilled up to now
+
+        Parameters:
+        state (dict): The stored state, or None if there is none yet.
+        now (float): The current time.
+
+        Returns:
+        dict: The refilled state.
+
+        """
+        if state is None:
+            return {'tokens': self.burst, 'updated': now, 'blocked_until': 0.0}
+
+        elapsed: float = max(0.0, now - state['updated'])
+        return {
+            'tokens': min(self.burst, state['tokens'] + elapsed * self.rate),
+            'updated': now,
+            'blocked_until': state.get('blocked_until', 0.0),
+        }
+
+    def acquire(self) -> float:
+        """Take a token from the bucket, waiting for one if needed
+
+        Returns:
+        float: The number of seconds spent waiting.
+
+        """
+        waited: float = 0.0
+
+        while True:
+            now: float = time.time()
+            stored, etag = get_state(self.name)
+            state: dict[str, Any] = self._refill(stored, now)
+
+            if state['blocked_until'] > now:
+                wait: float = state['blocked_until'] - now
+            elif state['tokens'] >= 1:
+                state['tokens'] -= 1
+                if put_state(self.name, state, etag):
+                    log_throttle_state(state, waited)
+                    return waited
+                continue  # Another instance took a token first, try again
+            else:
+                wait = (1 - state['tokens']) / self.rate
+
+            if waited + wait > self.max_wait:
+                logging.warning("Rate limiter wait exceeded %s seconds, proceeding anyway", self.max_wait)
+                log_throttle_state(state, waited)
+                return waited
+
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self, retry_after: float) -> None:
+        """Block every instance until the upstream Retry-After has passed
+
+        Parameters:
+        retry_after (float): The number of seconds to back off.
+
+        Returns:
+        None
+
+        """
+        while True:
+            now: float = time.time()
+            stored, etag = get_state(self.name)
+            state: dict[str, Any] = self._refill(stored, now)
+            state['blocked_until'] = max(state['blocked_until'], now + retry_after)
+            if put_state(self.name, state, etag):
+                log_throttle_state(state, 0.0)
+                return
+
+    def state(self) -> dict[str, Any]:
+        """Get the current throttle state
+
+        Returns:
+        dict: The number of available tokens and seconds until the bucket is unblocked.
+
+        """
+        now: float = time.time()
+        stored, _ = get_state(self.name)
+        state: dict[str, Any] = self._refill(stored, now)
+
+        return {
+            'tokens': state['tokens'],
+            'blocked_for': max(0.0, state['blocked_until'] - now),
+        }
+
+
+def log_throttle_state(state: dict[str, Any], waited: float) -> None:
+    """Log the throttle state as a metric for Application Insights
+
+    Parameters:
+    state (dict): The bucket state.
+    waited (float): The number of seconds the caller waited.
+
+    Returns:
+    None
+
+    """
+    logging.info(
+        "Alma rate limiter: tokens=%.2f blocked_for=%.1f waited=%.1f",
+        state['tokens'],
+        max(0.0, state['blocked_until'] - time.time()),
+        waited
+    )
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """Get the Alma Analytics rate limiter configured by the app settings
+
+    Returns:
+    RateLimiter: The rate limiter, or None if ALMA_RATE_LIMIT_PER_MINUTE is not set.
+
+    """
+    per_minute: str | None = os.getenv('ALMA_RATE_LIMIT_PER_MINUTE')
+
+    if not per_minute:
+        return None
+
+    rate: float = float(per_minute) / 60
+    burst: float = float(os.getenv('ALMA_RATE_LIMIT_BURST', '1'))
+
+    return RateLimiter('alma-analytics-rate-limit', rate, burst)
+
+
+def parse_retry_after(value: str | None, default: float = 60.0) -> float:
+    """Parse a Retry-After header in seconds or HTTP date form
+
+    Parameters:
+    value (str): The header value.
+    default (float): The delay to use when the header is missing or invalid.
+
+    Returns:
+    float: The number of seconds to back off.
+
+    """
+    if not value:
+        return default
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
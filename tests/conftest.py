@@ -1,8 +1,10 @@
 """Common test fixtures for all test files"""
 
+import importlib
 import json
 import os
-from typing import Generator
+from contextlib import ExitStack
+from typing import Any, Generator
 from unittest.mock import MagicMock, patch
 import pytest
 from src.processors import AnalyticsProcessor
@@ -44,6 +46,52 @@ def mock_azure_storage() -> Generator[dict, None, None]:
         }
 
 
+class FakeState:
+    """In-memory stand-in for the shared state blobs"""
+
+    def __init__(self) -> None:
+        """Initialize the fake state store"""
+        self.entities: dict[str, tuple[dict[str, Any], str]] = {}
+        self.writes = 0
+
+    def get(self, name: str) -> tuple[dict[str, Any] | None, str | None]:
+        """Get an entity and its ETag"""
+        if name not in self.entities:
+            return None, None
+        return self.entities[name]
+
+    def put(self, name: str, state: dict[str, Any], etag: str | None) -> bool:
+        """Put an entity if its ETag still matches, or if it does not exist when the ETag is None"""
+        if self.entities.get(name, (None, None))[1] != etag:
+            return False
+        self.writes += 1
+        self.entities[name] = (dict(state), str(self.writes))
+        return True
+
+    def delete(self, name: str) -> None:
+        """Delete an entity if it exists"""
+        self.entities.pop(name, None)
+
+
+@pytest.fixture
+def shared_state() -> Generator[FakeState, None, None]:
+    """Replace the shared state blobs with an in-memory store
+
+    Returns:
+    FakeState: The in-memory store
+
+    """
+    store = FakeState()
+    functions = {'get_state': store.get, 'put_state': store.put, 'delete_state': store.delete}
+
+    with ExitStack() as stack:
+        for module in ('src.breaker', 'src.index', 'src.runs', 'src.storage', 'src.throttle'):
+            for name, function in functions.items():
+                if hasattr(importlib.import_module(module), name):
+                    stack.enter_context(patch(f'{module}.{name}', side_effect=function))
+        yield store
+
+
 @pytest.fixture
 # pylint: disable=redefined-outer-name
 def analytics_processor(mock_azure_storage):
@@ -0,0 +1,48 @@
+"""Unit tests for breaker.py"""
+
+from unittest.mock import patch
+from src.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class TestCircuitBreaker:
+    """Test the CircuitBreaker class"""
+
+    def test_open_half_open_closed(self, shared_state):
+        """Test that failures open the circuit, one trial is let through, and its success closes the circuit"""
+        with patch('src.breaker.time.time') as mock_time:
+            mock_time.return_value = 1000.0
+            breaker = CircuitBreaker('test', failure_threshold=2, open_seconds=60)
+
+            breaker.record_failure()
+            assert breaker.allow() == 0
+            breaker.record_failure()
+            assert shared_state.entities['test'][0]['state'] == OPEN
+            assert breaker.allow() == 60
+
+            mock_time.return_value = 1061.0
+            assert breaker.allow() == 0
+            assert shared_state.entities['test'][0]['state'] == HALF_OPEN
+            assert breaker.allow() > 0  # Only one trial request
+
+            breaker.record_success()
+            assert shared_state.entities['test'][0]['state'] == CLOSED
+            assert breaker.allow() == 0
+
+    def test_failed_trial_reopens(self, shared_state):
+        """Test that a failed trial request opens the circuit again"""
+        with patch('src.breaker.time.time') as mock_time:
+            mock_time.return_value = 1000.0
+            breaker = CircuitBreaker('test', failure_threshold=1, open_seconds=60)
+            breaker.record_failure()
+
+            mock_time.return_value = 1061.0
+            assert breaker.allow() == 0
+            breaker.record_failure()
+
+            assert shared_state.entities['test'][0]['state'] == OPEN
+            assert breaker.allow() == 60
+
+    def test_state_unavailable(self):
+        """Test that requests are let through when the shared state cannot be read"""
+        with patch('src.breaker.get_state', side_effect=Exception("Storage unavailable")):
+            assert CircuitBreaker('test', failure_threshold=1, open_seconds=60).allow() == 0
@@ -0,0 +1,145 @@
+"""Unit tests for cache.py"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from src.cache import ResponseCache, get_response_cache
+
+
+class TestResponseCache:
+    """Test the ResponseCache class"""
+
+    def test_key_ignores_run_context(self):
+        """Test that only the fields that determine the response are part of the key"""
+        payload = {'iz': 'TEST_IZ', 'analysis': 'TEST_ANALYSIS', 'resume': 'token123'}
+
+        assert ResponseCache.key(payload) == ResponseCache.key({**payload, 'batch_id': '42', 'page': 3})
+        assert ResponseCache.key(payload) != ResponseCache.key({**payload, 'resume': 'token456'})
+
+    def test_disk_tier_round_trip(self, tmp_path):
+        """Test that a response survives a new process through the disk tier
+
+        Parameters:
+        tmp_path (Path): Temporary directory for the disk tier
+
+        Returns:
+        None
+
+        """
+        payload = {'iz': 'TEST_IZ', 'analysis': 'TEST_ANALYSIS'}
+        ResponseCache(ttl=60, directory=str(tmp_path)).put(payload, '{"status": "success"}')
+
+        cache = ResponseCache(ttl=60, directory=str(tmp_path))
+
+        assert cache.get(payload) == '{"status": "success"}'
+        assert cache.get({'iz': 'OTHER_IZ'}) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_expired_entries_are_misses(self, tmp_path):
+        """Test that entries older than the TTL are ignored
+
+        Parameters:
+        tmp_path (Path): Temporary directory for the disk tier
+
+        Returns:
+        None
+
+        """
+        cache = ResponseCache(ttl=60, directory=str(tmp_path))
+        payload = {'iz': 'TEST_IZ'}
+        cache.put(payload, 'old')
+
+        with patch('src.cache.time.time', return_value=os.path.getmtime(tmp_path) + 3600):
+            assert cache.get(payload) is None
+
+        assert not os.listdir(tmp_path)
+        assert not cache.memory
+
+    def test_memory_tier_evicts_least_recently_used(self, tmp_path):
+        """Test that the memory tier is bounded to max_entries
+
+        Parameters:
+        tmp_path (Path): Temporary directory for the disk tier
+
+        Returns:
+        None
+
+        """
+        cache = ResponseCache(ttl=60, max_entries=2, directory=str(tmp_path))
+        cache.put({'resume': 'a'}, 'a')
+        cache.put({'resume': 'b'}, 'b')
+        cache.get({'resume': 'a'})
+        cache.put({'resume': 'c'}, 'c')
+
+        assert cache.key({'resume': 'a'}) in cache.memory
+        assert cache.key({'resume': 'b'}) not in cache.memory
+        assert cache.key({'resume': 'c'}) in cache.memory
+
+    def test_memory_tier_is_bounded_by_size(self, tmp_path):
+        """Test that the memory tier is bounded to max_bytes and skips responses larger than the bound
+
+        Parameters:
+        tmp_path (Path): Temporary directory for the disk tier
+
+        Returns:
+        None
+
+        """
+        cache = ResponseCache(ttl=60, directory=str(tmp_path), max_bytes=2 * sys.getsizeof('x' * 100) + 10)
+        cache.put({'resume': 'a'}, 'a' * 100)
+        cache.put({'resume': 'b'}, 'b' * 100)
+        cache.put({'resume': 'c'}, 'c' * 100)
+        cache.put({'resume': 'd'}, 'd' * 1000)
+
+        assert list(cache.memory) == [cache.key({'resume': 'b'}), cache.key({'resume': 'c'})]
+        assert cache.memory_bytes == 2 * sys.getsizeof('x' * 100)
+        assert cache.get({'resume': 'd'}) == 'd' * 1000
+        assert cache.key({'resume': 'd'}) not in cache.memory
+
+    def test_sweep_disk_tier(self, tmp_path):
+        """Test that the sweep deletes only the expired entries of the disk tier
+
+        Parameters:
+        tmp_path (Path): Temporary directory for the disk tier
+
+        Returns:
+        None
+
+        """
+        cache = ResponseCache(ttl=60, directory=str(tmp_path))
+        cache.put({'resume': 'old'}, 'old')
+        cache.put({'resume': 'new'}, 'new')
+        old_path = tmp_path / f"{cache.key({'resume': 'old'})}.json"
+        os.utime(old_path, (0, 0))
+
+        assert cache.sweep() == 1
+        assert not old_path.exists()
+        assert len(os.listdir(tmp_path)) == 1
+
+    @patch('src.cache.get_container_client')
+    def test_sweep_blob_tier(self, mock_get_container):
+        """Test that the sweep deletes the expired blobs of the cache container
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+
+        Returns:
+        None
+
+        """
+        now = datetime.now(timezone.utc)
+        old = MagicMock(last_modified=now - timedelta(hours=2))
+        old.name = 'old.json'
+        new = MagicMock(last_modified=now)
+        new.name = 'new.json'
+        container = mock_get_container.return_value
+        container.list_blobs.return_value = [old, new]
+
+        assert ResponseCache(ttl=3600).sweep() == 1
+        container.delete_blobs.assert_called_once_with('old.json', raise_on_any_failure=False)
+
+    def test_get_response_cache_disabled(self):
+        """Test that no cache is configured without the app setting"""
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_response_cache() is None
@@ -0,0 +1,86 @@
+"""Unit tests for config.py"""
+
+import os
+from unittest.mock import patch
+from sqlalchemy import create_engine, insert
+from src import config
+from src.config import ConfigProvider, get_config_provider, get_recipients, get_setting
+from src.config import job_recipients, job_settings, metadata
+
+
+def make_provider(ttl=300):
+    """Create a provider backed by an in-memory SQLite database
+
+    Parameters:
+    ttl (float): The number of seconds the settings are cached.
+
+    Returns:
+    ConfigProvider: The provider.
+
+    """
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(job_settings), [
+            {'job': 'scf-duplicates', 'name': 'IZ', 'value': 'DB_IZ'},
+            {'job': 'other', 'name': 'IZ', 'value': 'OTHER_IZ'},
+        ])
+        connection.execute(insert(job_recipients), [
+            {'job': 'scf-duplicates', 'email': 'b@example.com'},
+            {'job': 'scf-duplicates', 'email': 'a@example.com'},
+        ])
+
+    return ConfigProvider(engine, 'scf-duplicates', ttl)
+
+
+class TestConfigProvider:
+    """Test the database configuration provider"""
+
+    def test_settings_and_fallback(self):
+        """Test that database settings win over app settings, which are used for anything the job does not set"""
+        provider = make_provider()
+
+        with patch('src.config.get_config_provider', return_value=provider), \
+                patch.dict(os.environ, {'IZ': 'ENV_IZ', 'EMAIL_SENDER': 'sender@example.com'}):
+            assert get_setting('IZ') == 'DB_IZ'
+            assert get_setting('EMAIL_SENDER') == 'sender@example.com'
+            assert get_setting('EXPORT_PREVIEW_ROWS', '50') == '50'
+            assert get_recipients() == 'a@example.com,b@example.com'
+
+    def test_cache(self):
+        """Test that warm lookups are served from the cache until the TTL expires"""
+        provider = make_provider()
+        provider.get('IZ')
+
+        with patch.object(provider.engine, 'connect') as mock_connect:
+            assert provider.get('IZ') == 'DB_IZ'
+            mock_connect.assert_not_called()
+
+            provider.ttl = 0
+            mock_connect.side_effect = Exception("Database unavailable")
+            assert provider.get('IZ') == 'DB_IZ'
+            mock_connect.assert_called_once()
+
+    def test_disabled(self):
+        """Test that app settings are used when SQLALCHEMY_DB_URL is not set"""
+        with patch.dict(os.environ, {'EMAIL_RECIPIENTS': 'env@example.com'}, clear=True):
+            assert get_recipients() == 'env@example.com'
+
+    def test_opt_in(self):
+        """Test that the database is only used when CONFIG_FROM_DB is true"""
+        with patch.dict(os.environ, {'SQLALCHEMY_DB_URL': 'sqlite://'}, clear=True), \
+                patch('src.config.create_engine') as mock_create_engine:
+            assert get_config_provider() is None
+            mock_create_engine.assert_not_called()
+
+    def test_engine_error(self):
+        """Test that app settings are used, without retrying, when the engine cannot be created"""
+        with patch.dict(os.environ, {'CONFIG_FROM_DB': 'true', 'SQLALCHEMY_DB_URL': 'mysql+missing://host/db',
+                                     'IZ': 'ENV_IZ'}, clear=True), \
+                patch.object(config, '_config_provider', None), patch.object(config, '_config_unavailable', False), \
+                patch('src.config.create_engine', side_effect=ModuleNotFoundError("No module named 'missing'")) \
+                as mock_create_engine, patch('src.config.logging.error') as mock_logging:
+            assert get_setting('IZ') == 'ENV_IZ'
+            assert get_setting('IZ') == 'ENV_IZ'
+            mock_create_engine.assert_called_once()
+            mock_logging.assert_called_once()
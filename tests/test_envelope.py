@@ -0,0 +1,42 @@
+"""Unit tests for envelope.py"""
+
+import json
+import os
+from unittest.mock import patch
+import pytest
+from src.envelope import MSGPACK_VERSION, MSGPACK_ZLIB_VERSION, decode_message, encode_message
+
+
+class TestEnvelope:
+    """Test encoding and decoding queue messages"""
+
+    def test_json_by_default(self):
+        """Test that messages stay JSON when compact messages are disabled"""
+        message = {'iz': 'TEST_IZ', 'page': 1}
+
+        with patch.dict(os.environ, {}, clear=True):
+            body = encode_message(message)
+
+        assert json.loads(body) == message
+        assert decode_message(body) == message
+
+    def test_compact_round_trip(self):
+        """Test that compact messages are compressed only when large, and decode to the original message"""
+        small = {'iz': 'TEST_IZ', 'resume': 'token', 'page': 1}
+        large = {**small, 'columns': {f'Column{i}': 'Barcode' for i in range(100)}}
+
+        with patch.dict(os.environ, {'COMPACT_QUEUE_MESSAGES': 'true'}):
+            small_body = encode_message(small)
+            large_body = encode_message(large)
+
+        assert small_body[0] == MSGPACK_VERSION
+        assert large_body[0] == MSGPACK_ZLIB_VERSION
+        assert len(large_body) < len(json.dumps(large))
+        assert decode_message(small_body) == small
+        assert decode_message(large_body) == large
+
+    def test_invalid_messages(self):
+        """Test that undecodable messages raise ValueError"""
+        for body in (b'', b'invalid json', bytes([MSGPACK_ZLIB_VERSION]) + b'not zlib', b'[1, 2]'):
+            with pytest.raises(ValueError):
+                decode_message(body)
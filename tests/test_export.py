@@ -0,0 +1,153 @@
+"""Unit tests for export.py"""
+
+import os
+from unittest.mock import MagicMock, patch
+from src.export import export_enabled, export_report, get_download_url, REPORT_CONTAINER
+
+
+class TestExportReport:
+    """Test the export_report function"""
+
+    @patch('src.export.get_download_url', return_value='https://example.com/report.csv?sas')
+    @patch('src.export.get_container_client')
+    # pylint: disable=unused-argument
+    def test_export_report(self, mock_get_container, mock_get_url):
+        """Test that rows are staged as blocks and previewed
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_get_url (MagicMock): Mocked get_download_url function
+
+        Returns:
+        None
+
+        """
+        blob_client = mock_get_container.return_value.get_blob_client.return_value
+        rows = iter([['123', 'Book A'], ['123', 'Book B'], ['456', 'Book C']])
+
+        with patch.dict(os.environ, {'EXPORT_PREVIEW_ROWS': '2'}):
+            report = export_report(['barcode', 'title'], rows)
+
+        mock_get_container.assert_called_once_with(REPORT_CONTAINER)
+        assert report == {
+            'url': 'https://example.com/report.csv?sas',
+            'row_count': 3,
+            'preview': [['123', 'Book A'], ['123', 'Book B']],
+        }
+        block = blob_client.stage_block.call_args.args[1]
+        assert block == b'barcode,title\r\n123,Book A\r\n123,Book B\r\n456,Book C\r\n'
+        blob_client.commit_block_list.assert_called_once()
+
+    @patch('src.export.get_download_url')
+    @patch('src.export.BLOCK_SIZE', 10)
+    @patch('src.export.get_container_client')
+    # pylint: disable=unused-argument
+    def test_export_report_stages_blocks(self, mock_get_container, mock_get_url):
+        """Test that large reports are split into several blocks
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_get_url (MagicMock): Mocked get_download_url function
+
+        Returns:
+        None
+
+        """
+        blob_client = mock_get_container.return_value.get_blob_client.return_value
+
+        export_report({'column1': 'barcode'}, ([str(n) * 12] for n in range(3)))
+
+        block_ids = [block.id for block in blob_client.commit_block_list.call_args.args[0]]
+        assert len(block_ids) == 3
+        assert len(set(block_ids)) == 3
+
+    @patch('src.export.get_container_client')
+    def test_export_report_exception_handling(self, mock_get_container):
+        """Test that a failed export is logged and reported as None
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+
+        Returns:
+        None
+
+        """
+        blob_client = MagicMock()
+        blob_client.stage_block.side_effect = Exception("Test export exception")
+        mock_get_container.return_value.get_blob_client.return_value = blob_client
+
+        with patch('src.export.logging.error') as mock_logging:
+            assert export_report(['barcode'], [['123']]) is None
+            mock_logging.assert_called_once()
+
+    def test_export_enabled(self):
+        """Test the EXPORT_REPORT app setting"""
+        with patch.dict(os.environ, {'EXPORT_REPORT': 'true'}):
+            assert export_enabled()
+        with patch.dict(os.environ, {}, clear=True):
+            assert not export_enabled()
+
+
+class TestGetDownloadUrl:
+    """Test the get_download_url function"""
+
+    @staticmethod
+    def get_blob_client(credential):
+        """Create a mock report blob client
+
+        Parameters:
+        credential (Any): The storage credential.
+
+        Returns:
+        MagicMock: The blob client.
+
+        """
+        blob_client = MagicMock(spec=['account_name', 'container_name', 'blob_name', 'credential', 'url', 'scheme',
+                                      'primary_hostname'])
+        blob_client.account_name = 'account'
+        blob_client.container_name = REPORT_CONTAINER
+        blob_client.blob_name = 'report.csv'
+        blob_client.credential = credential
+        blob_client.url = 'https://account.blob.core.windows.net/duplicates-barcode-reports/report.csv'
+        blob_client.scheme = 'https'
+        blob_client.primary_hostname = 'account.blob.core.windows.net'
+        return blob_client
+
+    @patch('src.export.generate_blob_sas', return_value='sig=key')
+    def test_account_key(self, mock_sas):
+        """Test that the link is signed with the account key of the connection string
+
+        Parameters:
+        mock_sas (MagicMock): Mocked generate_blob_sas function
+
+        Returns:
+        None
+
+        """
+        blob_client = self.get_blob_client(MagicMock(spec=['account_key'], account_key='secret'))
+
+        assert get_download_url(blob_client) == f'{blob_client.url}?sig=key'
+        assert mock_sas.call_args.kwargs['account_key'] == 'secret'
+
+    @patch('src.export.BlobServiceClient')
+    @patch('src.export.generate_blob_sas', return_value='sig=delegation')
+    def test_managed_identity(self, mock_sas, mock_service):
+        """Test that a managed identity signs the link with a user delegation key
+
+        Parameters:
+        mock_sas (MagicMock): Mocked generate_blob_sas function
+        mock_service (MagicMock): Mocked BlobServiceClient class
+
+        Returns:
+        None
+
+        """
+        blob_client = self.get_blob_client(MagicMock(spec=['get_token']))
+
+        assert get_download_url(blob_client) == f'{blob_client.url}?sig=delegation'
+        key = mock_service.return_value.get_user_delegation_key.return_value
+        assert mock_sas.call_args.kwargs['user_delegation_key'] is key
+
+    def test_no_signing_credential(self):
+        """Test that no link is made when the credential cannot sign one, such as a SAS connection string"""
+        assert get_download_url(self.get_blob_client(None)) is None
@@ -1,10 +1,14 @@
 """Unit tests for handlers.py"""
 
+import io
 import json
+import os
 from unittest.mock import MagicMock, patch
 import azure.functions as func
+import pytest
 import requests
-from src.handlers import start_analytics, send_next_request
+from src.cache import CachedResponse
+from src.handlers import start_analytics, send_next_request, post_analytics, handle_response
 
 
 class TestStartDuplicatesData:
@@ -43,8 +47,10 @@ class TestStartDuplicatesData:
         assert kwargs['json']['analysis'] == 'TEST_ANALYSIS'
         assert kwargs['headers']['x-functions-key'] == 'test-key'
 
-        # Verify response was processed
-        mock_process.assert_called_once_with(mock_successful_response.text)
+        # Verify response was processed as a new single-partition run
+        mock_process.assert_called_once()
+        assert mock_process.call_args.args[0] == mock_successful_response.text
+        assert mock_process.call_args.args[1]['partitions'] == 1
 
     @patch('requests.post')
     # pylint: disable=redefined-outer-name,unused-argument
@@ -73,6 +79,33 @@ class TestStartDuplicatesData:
             # Verify that error was logged
             mock_log.assert_called_once()
 
+    @patch('requests.post')
+    @patch('src.handlers.queue_request')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_partitioned_run(self, mock_queue_request, mock_post, mock_env_variables):
+        """Test that a partitioned run queues one request per partition instead of calling the API
+
+        Parameters:
+        mock_queue_request (MagicMock): Mocked queue_request function
+        mock_post (MagicMock): Mocked requests.post function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        filters = ['<filter-a/>', '<filter-b/>', '<filter-c/>']
+
+        with patch.dict(os.environ, {'ANALYSIS_PARTITION_FILTERS': json.dumps(filters)}):
+            start_analytics(MagicMock(spec=func.TimerRequest))
+
+        mock_post.assert_not_called()
+        messages = [call.args[0] for call in mock_queue_request.call_args_list]
+        assert [message['filter'] for message in messages] == filters
+        assert [message['partition'] for message in messages] == [0, 1, 2]
+        assert {message['partitions'] for message in messages} == {3}
+        assert len({message['batch_id'] for message in messages}) == 1
+
 
 class TestSendNextRequest:  # pylint: disable=too-few-public-methods
     """Test the send_next_request function"""
@@ -113,8 +146,83 @@ class TestSendNextRequest:  # pylint: disable=too-few-public-methods
         # Verify request was made
         mock_post.assert_called_once()
 
-        # Verify response was processed
-        mock_process.assert_called_once_with(mock_successful_response.text)
+        # Verify response was processed with the run from the message
+        mock_process.assert_called_once_with(
+            mock_successful_response.text,
+            {'batch_id': '123456789', 'partition': 0, 'partitions': 1, 'page': 0}
+        )
+
+
+class TestCircuitBreaker:
+    """Tests for failing fast while the circuit breaker is open"""
+
+    @patch('src.handlers.queue_request')
+    @patch('src.handlers.requests.post')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_send_next_request_parks_message(self, mock_post, mock_queue_request, mock_env_variables):
+        """Test that an open circuit parks the message instead of calling Alma Analytics
+
+        Parameters:
+        mock_post (MagicMock): Mocked requests.post function
+        mock_queue_request (MagicMock): Mocked queue_request function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        message = {'iz': 'TEST_IZ', 'resume': 'token123', 'batch_id': '42', 'page': 3}
+        mock_msg = MagicMock(spec=func.QueueMessage)
+        mock_msg.get_body.return_value = json.dumps(message).encode()
+
+        with patch('src.handlers.get_circuit_breaker') as mock_get_breaker:
+            mock_get_breaker.return_value.allow.return_value = 120.0
+            send_next_request(mock_msg)
+
+        mock_post.assert_not_called()
+        mock_queue_request.assert_called_once_with(message, 121)
+
+    @patch('src.handlers.send_throttled', side_effect=requests.ConnectionError("Connection refused"))
+    def test_failures_are_recorded(self, mock_send):
+        """Test that connection errors count as circuit breaker failures
+
+        Parameters:
+        mock_send (MagicMock): Mocked send_throttled function
+
+        Returns:
+        None
+
+        """
+        with patch('src.handlers.get_circuit_breaker') as mock_get_breaker, \
+                patch('src.handlers.get_response_cache', return_value=None):
+            mock_get_breaker.return_value.allow.return_value = 0.0
+            with pytest.raises(requests.ConnectionError):
+                post_analytics({'iz': 'TEST_IZ'})
+
+        mock_send.assert_called_once()
+        mock_get_breaker.return_value.record_failure.assert_called_once()
+
+
+class TestRunLock:  # pylint: disable=too-few-public-methods
+    """Tests for preventing overlapping runs"""
+
+    @patch('src.handlers.requests.post')
+    def test_start_analytics_while_run_in_progress(self, mock_post):
+        """Test that a start is a no-op while another run holds the run lock
+
+        Parameters:
+        mock_post (MagicMock): Mocked requests.post function
+
+        Returns:
+        None
+
+        """
+        with patch('src.handlers.run_lock_enabled', return_value=True), \
+                patch('src.handlers.acquire_run_lock', return_value=False) as mock_acquire:
+            start_analytics(MagicMock())
+
+        mock_acquire.assert_called_once()
+        mock_post.assert_not_called()
 
 
 class TestHandlersErrorHandling:
@@ -210,3 +318,198 @@ class TestHandlersErrorHandling:
                 send_next_request(mock_msg)
 
                 mock_logging.assert_called_once_with("Error response")
+
+
+class TestPostAnalytics:
+    """Tests for the rate-limited Alma Analytics request helper"""
+
+    @patch('requests.post')
+    @patch('src.handlers.get_rate_limiter')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_throttled_request_is_retried(self, mock_get_limiter, mock_post, mock_env_variables):
+        """Test that a 429 response penalizes the limiter and is retried
+
+        Parameters:
+        mock_get_limiter (MagicMock): Mocked get_rate_limiter function
+        mock_post (MagicMock): Mocked requests.post function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        throttled = MagicMock()
+        throttled.status_code = 429
+        throttled.headers = {'Retry-After': '15'}
+        ok = MagicMock()
+        ok.status_code = 200
+        mock_post.side_effect = [throttled, ok]
+        limiter = mock_get_limiter.return_value
+
+        response = post_analytics({'iz': 'TEST_IZ'})
+
+        assert response is ok
+        assert limiter.acquire.call_count == 2
+        limiter.penalize.assert_called_once_with(15.0)
+
+    @patch('requests.post')
+    @patch('src.handlers.get_rate_limiter', return_value=None)
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_throttled_request_without_limiter(self, mock_get_limiter, mock_post, mock_env_variables):
+        """Test that a 429 response is waited out locally when no limiter is configured, unless the wait is too long
+
+        Parameters:
+        mock_get_limiter (MagicMock): Mocked get_rate_limiter function
+        mock_post (MagicMock): Mocked requests.post function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        throttled = MagicMock()
+        throttled.status_code = 429
+        throttled.headers = {'Retry-After': '15'}
+        ok = MagicMock()
+        ok.status_code = 200
+        mock_post.side_effect = [throttled, ok]
+
+        with patch('src.handlers.time.sleep') as mock_sleep:
+            assert post_analytics({'iz': 'TEST_IZ'}) is ok
+            mock_sleep.assert_called_once_with(15.0)
+
+            throttled.headers = {'Retry-After': '600'}
+            mock_post.side_effect = None
+            mock_post.return_value = throttled
+            mock_sleep.reset_mock()
+
+            assert post_analytics({'iz': 'TEST_IZ'}) is throttled
+            mock_sleep.assert_not_called()
+
+    @patch('src.handlers.queue_request')
+    @patch('requests.post')
+    @patch('src.handlers.get_rate_limiter', return_value=None)
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_throttled_message_is_parked(self, mock_get_limiter, mock_post, mock_queue_request, mock_env_variables):
+        """Test that a next request throttled for longer than can be waited out is put back in the queue
+
+        Parameters:
+        mock_get_limiter (MagicMock): Mocked get_rate_limiter function
+        mock_post (MagicMock): Mocked requests.post function
+        mock_queue_request (MagicMock): Mocked queue_request function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        message = {'iz': 'TEST_IZ', 'resume': 'token123', 'batch_id': '42', 'page': 3}
+        mock_msg = MagicMock(spec=func.QueueMessage)
+        mock_msg.get_body.return_value = json.dumps(message).encode()
+        mock_post.return_value.status_code = 429
+        mock_post.return_value.headers = {'Retry-After': '600'}
+
+        send_next_request(mock_msg)
+
+        mock_post.assert_called_once()
+        mock_queue_request.assert_called_once_with(message, 601)
+
+    @patch('requests.post')
+    @patch('src.handlers.get_rate_limiter', return_value=None)
+    @patch('src.handlers.get_response_cache')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_cached_response_skips_request(self, mock_get_cache, mock_get_limiter, mock_post, mock_env_variables):
+        """Test that a cache hit is served without calling the API
+
+        Parameters:
+        mock_get_cache (MagicMock): Mocked get_response_cache function
+        mock_get_limiter (MagicMock): Mocked get_rate_limiter function
+        mock_post (MagicMock): Mocked requests.post function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        mock_get_cache.return_value.get.return_value = '{"status": "success"}'
+
+        response = post_analytics({'iz': 'TEST_IZ'})
+
+        assert response.status_code == 200
+        assert response.text == '{"status": "success"}'
+        mock_post.assert_not_called()
+
+    @patch('requests.post')
+    @patch('src.handlers.get_rate_limiter', return_value=None)
+    @patch('src.handlers.get_response_cache')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_successful_response_is_cached(self, mock_get_cache, mock_get_limiter, mock_post, mock_env_variables):
+        """Test that a cache miss stores the successful response
+
+        Parameters:
+        mock_get_cache (MagicMock): Mocked get_response_cache function
+        mock_get_limiter (MagicMock): Mocked get_rate_limiter function
+        mock_post (MagicMock): Mocked requests.post function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        cache = mock_get_cache.return_value
+        cache.get.return_value = None
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.text = '{"status": "success"}'
+
+        post_analytics({'iz': 'TEST_IZ'})
+
+        cache.put.assert_called_once_with({'iz': 'TEST_IZ'}, '{"status": "success"}')
+
+
+class TestHandleResponse:
+    """Tests for choosing between buffered and streamed response processing"""
+
+    @patch('src.handlers.process_stream')
+    @patch('src.handlers.process_response')
+    def test_streamed_response(self, mock_process, mock_process_stream):
+        """Test that a live response is parsed incrementally when streaming is enabled
+
+        Parameters:
+        mock_process (MagicMock): Mocked process_response function
+        mock_process_stream (MagicMock): Mocked process_stream function
+
+        Returns:
+        None
+
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(b'{"status": "success"}')
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 0}
+
+        with patch.dict(os.environ, {'STREAM_RESPONSES': 'true'}):
+            handle_response(response, run)
+
+        mock_process_stream.assert_called_once_with(response.raw, run)
+        mock_process.assert_not_called()
+
+    @patch('src.handlers.process_stream')
+    @patch('src.handlers.process_response')
+    def test_cached_response_is_not_streamed(self, mock_process, mock_process_stream):
+        """Test that a cached response is processed from its text
+
+        Parameters:
+        mock_process (MagicMock): Mocked process_response function
+        mock_process_stream (MagicMock): Mocked process_stream function
+
+        Returns:
+        None
+
+        """
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 0}
+
+        with patch.dict(os.environ, {'STREAM_RESPONSES': 'true'}):
+            handle_response(CachedResponse('{"status": "success"}'), run)
+
+        mock_process.assert_called_once_with('{"status": "success"}', run)
+        mock_process_stream.assert_not_called()
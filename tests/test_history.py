@@ -0,0 +1,38 @@
+"""Unit tests for history.py"""
+
+import os
+from unittest.mock import patch
+import pyarrow.dataset as ds  # type:ignore[import-untyped]
+from src.history import query_history, record_history
+
+
+class TestHistory:  # pylint: disable=too-few-public-methods
+    """Test recording and querying the duplicate history"""
+
+    def test_record_and_query(self, tmp_path):
+        """Test that rows pass through unchanged and can be queried by partition, value and column
+
+        Parameters:
+        tmp_path (Path): Temporary directory for the dataset
+
+        Returns:
+        None
+
+        """
+        columns = {'Column1': 'Barcode', 'Column2': 'Location'}
+        runs = [
+            ({'batch_id': '1735689600'}, [['1', 'Main'], ['1', 'Annex'], ['2', 'Main'], ['2', 'Main']]),  # 2025-01-01
+            ({'batch_id': '1767225600-0a1b2c3d'}, [['1', 'Main'], ['1', 'Main'], ['1', 'Annex']]),  # 2026-01-01
+        ]
+
+        with patch.dict(os.environ, {'HISTORY_DIR': str(tmp_path), 'HISTORY_BATCH_ROWS': '2'}):
+            for run, rows in runs:
+                assert list(record_history(columns, rows, run)) == rows
+
+            table = query_history(['run_id', 'cluster_size', 'Location'],
+                                  (ds.field('year') >= 2026) & (ds.field('Barcode') == '1'))
+            everything = query_history()
+
+        assert table.to_pylist() == [{'run_id': '1767225600-0a1b2c3d', 'cluster_size': 3, 'Location': location}
+                                     for location in ('Main', 'Main', 'Annex')]
+        assert everything.num_rows == 7
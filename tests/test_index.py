@@ -0,0 +1,76 @@
+"""Unit tests for index.py"""
+
+from src.index import BarcodeIndex, BloomFilter, iter_duplicates, resolve_duplicates, update_barcode_index
+
+
+class TestBloomFilter:  # pylint: disable=too-few-public-methods
+    """Test the BloomFilter class"""
+
+    def test_add_reports_seen_items(self):
+        """Test that re-added items are reported as seen and the filter survives serialization"""
+        bloom = BloomFilter.for_capacity(1000)
+
+        assert not bloom.add('123456789')
+        assert bloom.add('123456789')
+
+        restored = BloomFilter.from_dict(bloom.to_dict())
+        assert restored.add('123456789')
+        assert not restored.add('987654321')
+
+
+class TestBarcodeIndex:
+    """Test the BarcodeIndex class"""
+
+    def test_exact_index(self):
+        """Test that small runs record the pages of every barcode and skip redelivered pages"""
+        index = BarcodeIndex(exact_limit=10, capacity=100)
+        index.add_page(0, ['1', '2'])
+        index.add_page(1, ['2', '3'])
+        index.add_page(1, ['2', '3'])
+
+        assert index.pages == {'1': [0], '2': [0, 1], '3': [1]}
+
+    def test_switch_to_sketch(self):
+        """Test that large runs switch to a Bloom filter and keep duplicate candidates"""
+        index = BarcodeIndex(exact_limit=3, capacity=100)
+        index.add_page(0, ['1', '2', '2'])
+        index.add_page(1, ['3', '4', '1'])
+
+        restored = BarcodeIndex.from_dict(index.to_dict(), exact_limit=3, capacity=100)
+
+        assert restored.pages is None
+        assert restored.candidates == {'1', '2'}
+
+
+class TestResolveDuplicates:
+    """Test building and resolving the run's barcode indexes"""
+
+    def test_resolve_across_partitions(self, shared_state):  # pylint: disable=unused-argument
+        """Test that duplicates are found within and across partitions, with the pages that hold them"""
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 2, 'page': 0}
+
+        update_barcode_index(run, [['1'], ['2']], lambda row: row[0])
+        update_barcode_index({**run, 'page': 1}, [['3'], ['3']], lambda row: row[0])
+        update_barcode_index({**run, 'partition': 1}, [['2'], ['4']], lambda row: row[0])
+
+        candidates, pages = resolve_duplicates(run)
+
+        assert candidates == {'2', '3'}
+        assert pages == {'batch-42/000-000000.json', 'batch-42/000-000001.json', 'batch-42/001-000000.json'}
+
+    def test_unindexed_page_forces_full_check(self, shared_state):  # pylint: disable=unused-argument
+        """Test that a page that could not be indexed makes the final step check every row"""
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 0}
+
+        update_barcode_index(run, [], None)
+
+        assert resolve_duplicates(run) == (None, None)
+
+    def test_iter_duplicates(self):
+        """Test that only clusters of more than one row are kept"""
+        rows = [['1', 'A'], ['2', 'B'], ['2', 'C'], ['3', 'D'], ['4', 'E'], ['4', 'F']]
+
+        assert list(iter_duplicates(rows, lambda row: row[0], None)) == [
+            ['2', 'B'], ['2', 'C'], ['4', 'E'], ['4', 'F']
+        ]
+        assert list(iter_duplicates(rows, lambda row: row[0], {'4'})) == [['4', 'E'], ['4', 'F']]
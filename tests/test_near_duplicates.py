@@ -0,0 +1,71 @@
+"""Unit tests for near_duplicates.py"""
+
+import os
+from unittest.mock import patch
+from src.near_duplicates import collect_barcodes, find_near_duplicates
+
+
+class TestFindNearDuplicates:
+    """Test the find_near_duplicates function"""
+
+    def test_error_kinds(self):
+        """Test that each kind of near duplicate is found and exact strangers are not"""
+        barcodes = {'39000123', '0039000123', '39OO0456', '39000456', '39000789', '39000788', '39001789', '3900789',
+                    '3900A788', '55555555'}
+
+        count, pairs = find_near_duplicates(barcodes, max_distance=1, limit=100)
+
+        assert ['0039000123', '39000123', 'leading zeros'] in pairs
+        assert ['39000456', '39OO0456', 'ocr'] in pairs
+        assert ['39000788', '3900A788', 'substitution'] in pairs
+        assert ['39000789', '3900789', 'insertion/deletion'] in pairs
+        assert not any('55555555' in pair for pair in pairs)
+        assert count == len(pairs) == len({(first, second) for first, second, _ in pairs})
+
+    def test_digit_edits(self):
+        """Test that digit substitutions and transpositions are only reported when enabled"""
+        barcodes = {'39000123', '39000213', '39000124'}
+
+        assert find_near_duplicates(barcodes, max_distance=1, limit=100) == (0, [])
+
+        with patch.dict(os.environ, {'NEAR_DUPLICATE_DIGIT_EDITS': 'true'}):
+            assert find_near_duplicates(barcodes, max_distance=1, limit=100) == (2, [
+                ['39000123', '39000124', 'substitution'],
+                ['39000123', '39000213', 'transposition'],
+            ])
+
+    def test_sequential_barcodes(self):
+        """Test that barcodes issued in a sequential range are not reported as near duplicates of each other"""
+        barcodes = {f'39000{number:06d}' for number in range(20000)}
+
+        assert find_near_duplicates(barcodes, max_distance=1, limit=100) == (0, [])
+
+        count, pairs = find_near_duplicates(barcodes | {'39000000O12'}, max_distance=1, limit=100)
+
+        assert count == 10
+        assert ['39000000012', '39000000O12', 'ocr'] in pairs
+        assert all('39000000O12' in pair for pair in pairs)
+
+    def test_limit(self):
+        """Test that every pair is counted but only the first pairs are kept"""
+        barcodes = {f'0{number}' for number in range(10, 20)} | {str(number) for number in range(10, 20)}
+
+        count, pairs = find_near_duplicates(barcodes, max_distance=0, limit=3)
+
+        assert count == 10
+        assert pairs == [['010', '10', 'leading zeros'], ['011', '11', 'leading zeros'], ['012', '12', 'leading zeros']]
+
+    def test_distance_zero(self):
+        """Test that single edits are not reported when the maximum distance is 0"""
+        assert find_near_duplicates({'3900A789', '39000789', '039000789'}, max_distance=0, limit=100) == (1, [
+            ['039000789', '39000789', 'leading zeros']
+        ])
+
+
+def test_collect_barcodes():
+    """Test that rows pass through unchanged while their barcodes are collected"""
+    rows = [['123 ', 'Test Book'], ['456', 'Another Book']]
+    barcodes = set()
+
+    assert list(collect_barcodes(rows, lambda row: row[0], barcodes)) == rows
+    assert barcodes == {'123', '456'}
@@ -1,8 +1,10 @@
 """Unit tests for processors.py"""
 
+import io
 import json
+import os
 from unittest.mock import MagicMock, patch
-from src.processors import process_response
+from src.processors import process_response, process_stream, iter_stream_json
 
 
 class TestProcessResponse:
@@ -89,7 +91,212 @@ class TestProcessResponse:
 
         mock_get_container.assert_called_once()
         mock_merge.assert_called_once()
-        mock_queue.assert_called_once_with(merged_data)
+        assert mock_merge.call_args.args[1]['batch_id'] is not None
+        mock_queue.assert_called_once_with(merged_data['data'])
+
+    @patch('src.processors.get_container_client')
+    @patch('src.processors.export_enabled', return_value=True)
+    @patch('src.processors.export_report')
+    @patch('src.processors.queue_email')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_process_final_batch_with_export(
+            self, mock_queue, mock_export, mock_enabled, mock_get_container, mock_env_variables
+    ):
+        """Test that the final batch is exported and previewed when export is enabled
+
+        Parameters:
+        mock_queue (MagicMock): Mocked queue_email function
+        mock_export (MagicMock): Mocked export_report function
+        mock_enabled (MagicMock): Mocked export_enabled function
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        mock_export.return_value = {'url': 'https://example.com/r.csv', 'row_count': 1, 'preview': []}
+
+        process_response(json.dumps({
+            'status': 'success',
+            'data': {
+                'is_finished': 'true',
+                'columns': ['barcode', 'title'],
+                'rows': [['123456789', 'Test Book']]
+            }
+        }))
+
+        assert list(mock_export.call_args.args[1]) == [['123456789', 'Test Book']]
+        email_data = mock_queue.call_args.args[0]
+        assert email_data['report_url'] == 'https://example.com/r.csv'
+        assert email_data['rows'] == []
+        assert email_data['row_count'] == 1
+
+    @patch('src.processors.get_container_client')
+    @patch('src.processors.export_enabled', return_value=True)
+    @patch('src.processors.export_report', return_value=None)
+    @patch('src.processors.queue_email', return_value=True)
+    @patch('src.processors.delete_run_pages')
+    # pylint: disable=redefined-outer-name,unused-argument,too-many-arguments,too-many-positional-arguments
+    def test_process_final_batch_export_failure(
+            self, mock_delete_pages, mock_queue, mock_export, mock_enabled, mock_get_container, mock_env_variables
+    ):
+        """Test that a failed export falls back to the stored pages, which are deleted once the email is queued
+
+        Parameters:
+        mock_delete_pages (MagicMock): Mocked delete_run_pages function
+        mock_queue (MagicMock): Mocked queue_email function
+        mock_export (MagicMock): Mocked export_report function
+        mock_enabled (MagicMock): Mocked export_enabled function
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        page = MagicMock()
+        page.name = 'batch-42/000-000000.json'
+        container = mock_get_container.return_value
+        container.list_blobs.return_value = [page]
+        container.get_blob_client.return_value.download_blob.return_value.readall.return_value = json.dumps(
+            {'data': {'rows': [['111', 'Stored Book']]}}
+        )
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 1}
+
+        process_response(json.dumps({
+            'status': 'success',
+            'data': {'is_finished': 'true', 'columns': ['title'], 'rows': [['Final Book']]}
+        }), run)
+
+        assert mock_queue.call_args.args[0]['rows'] == [['Final Book'], ['111', 'Stored Book']]
+        container.get_blob_client.return_value.delete_blob.assert_not_called()
+        mock_delete_pages.assert_called_once_with(container, run)
+
+        mock_delete_pages.reset_mock()
+        mock_queue.return_value = False
+        process_response(json.dumps({
+            'status': 'success',
+            'data': {'is_finished': 'true', 'columns': ['title'], 'rows': [['Final Book']]}
+        }), run)
+
+        mock_delete_pages.assert_not_called()
+
+    @patch('src.processors.get_container_client')
+    @patch('src.processors.export_enabled', return_value=True)
+    @patch('src.processors.detection_enabled', return_value=True)
+    @patch('src.processors.resolve_duplicates', return_value=({'111'}, None))
+    @patch('src.processors.iter_run_rows')
+    @patch('src.processors.queue_email', return_value=True)
+    @patch('src.processors.delete_run_pages')
+    # pylint: disable=redefined-outer-name,unused-argument,too-many-arguments,too-many-positional-arguments
+    def test_unlinked_export_keeps_duplicates_only(
+            self, mock_delete_pages, mock_queue, mock_iter_rows, mock_resolve, mock_detection, mock_enabled,
+            mock_get_container, mock_env_variables
+    ):
+        """Test that the rows sent inline when the report cannot be linked are still only the duplicates
+
+        Parameters:
+        mock_delete_pages (MagicMock): Mocked delete_run_pages function
+        mock_queue (MagicMock): Mocked queue_email function
+        mock_iter_rows (MagicMock): Mocked iter_run_rows function
+        mock_resolve (MagicMock): Mocked resolve_duplicates function
+        mock_detection (MagicMock): Mocked detection_enabled function
+        mock_enabled (MagicMock): Mocked export_enabled function
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        mock_iter_rows.side_effect = lambda *args: iter([['111', 'A'], ['111', 'B'], ['222', 'C']])
+        report = {'preview': [], 'row_count': 2, 'url': None}
+
+        with patch('src.processors.export_report', side_effect=lambda columns, rows: (list(rows), report)[1]):
+            process_response(json.dumps({
+                'status': 'success',
+                'data': {'is_finished': 'true', 'columns': ['barcode', 'title'], 'rows': []}
+            }), {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 1})
+
+        assert mock_queue.call_args.args[0]['rows'] == [['111', 'A'], ['111', 'B']]
+
+    @patch('src.processors.set_blob_data')
+    @patch('src.processors.finish_partition', return_value=False)
+    @patch('src.processors.merge_blob_data')
+    @patch('src.processors.queue_email')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_process_partition_final_batch(
+            self, mock_queue, mock_merge, mock_finish, mock_set_blob, mock_env_variables
+    ):
+        """Test that a partition that is not the last to finish stores its page and waits
+
+        Parameters:
+        mock_queue (MagicMock): Mocked queue_email function
+        mock_merge (MagicMock): Mocked merge_blob_data function
+        mock_finish (MagicMock): Mocked finish_partition function
+        mock_set_blob (MagicMock): Mocked set_blob_data function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        run = {'batch_id': '1700000000', 'partition': 1, 'partitions': 3, 'page': 4}
+
+        process_response(json.dumps({
+            'status': 'success',
+            'data': {
+                'is_finished': 'true',
+                'columns': ['barcode', 'title'],
+                'rows': [['123456789', 'Test Book']]
+            }
+        }), run)
+
+        mock_set_blob.assert_called_once()
+        assert mock_set_blob.call_args.args[1] == run
+        mock_finish.assert_called_once_with(run)
+        mock_merge.assert_not_called()
+        mock_queue.assert_not_called()
+
+    @patch('src.processors.get_container_client')
+    @patch('src.processors.merge_blob_data')
+    @patch('src.processors.queue_email')
+    @patch('src.processors.update_barcode_index')
+    @patch('src.processors.resolve_duplicates', return_value=({'123456789'}, set()))
+    @patch('src.processors.delete_barcode_indexes')
+    # pylint: disable=redefined-outer-name,unused-argument,too-many-arguments,too-many-positional-arguments
+    def test_process_final_batch_with_detection(
+            self, mock_delete_indexes, mock_resolve, mock_update_index, mock_queue, mock_merge, mock_get_container,
+            mock_env_variables
+    ):
+        """Test that only duplicate barcodes are merged when detection is enabled
+
+        Parameters:
+        mock_delete_indexes (MagicMock): Mocked delete_barcode_indexes function
+        mock_resolve (MagicMock): Mocked resolve_duplicates function
+        mock_update_index (MagicMock): Mocked update_barcode_index function
+        mock_queue (MagicMock): Mocked queue_email function
+        mock_merge (MagicMock): Mocked merge_blob_data function
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        mock_get_container.return_value.list_blobs.return_value = []
+        rows = [['123456789', 'Test Book'], ['123456789', 'Test Book copy'], ['987654321', 'Another Book']]
+
+        with patch.dict(os.environ, {'DETECT_DUPLICATES': 'true'}):
+            process_response(json.dumps({
+                'status': 'success',
+                'data': {'is_finished': 'true', 'columns': ['barcode', 'title'], 'rows': rows}
+            }))
+
+        mock_update_index.assert_called_once()
+        assert list(mock_merge.call_args.args[2]) == rows[:2]
+        mock_delete_indexes.assert_called_once()
 
     def test_process_response_general_exception(self):
         """Test handling of general exception in process_response function"""
@@ -111,3 +318,123 @@ class TestProcessResponse:
 
                 # Verify error was logged
                 mock_logging.assert_called_once()
+
+
+class TestProcessStream:
+    """Test the streaming response path"""
+
+    def test_iter_stream_json_round_trip(self):
+        """Test that a streamed response is re-serialized as an equivalent page"""
+        response = {
+            'status': 'success',
+            'data': {
+                'is_finished': 'false',
+                'rows': [['123456789', 'Test Book', 1.5], ['987654321', 'Another Book', 2]],
+                'resume': 'token123',
+                'columns': {'column1': 'barcode', 'column2': 'title', 'column3': 'count'}
+            }
+        }
+        envelope = {}
+
+        page = json.loads(''.join(iter_stream_json(io.BytesIO(json.dumps(response).encode()), envelope)))
+
+        assert page == response
+        assert envelope['data']['resume'] == 'token123'
+        assert envelope['data']['rows'] == []
+
+    @patch('src.processors.set_blob_chunks')
+    @patch('src.processors.set_next_request')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_process_stream_with_continuation(self, mock_set_next, mock_set_chunks, mock_env_variables):
+        """Test that a streamed page is stored and the next request queued
+
+        Parameters:
+        mock_set_next (MagicMock): Mocked set_next_request function
+        mock_set_chunks (MagicMock): Mocked set_blob_chunks function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        stored = []
+
+        def set_blob_chunks(chunks, run):
+            stored.append(''.join(chunks))
+            return run['batch_id']
+
+        mock_set_chunks.side_effect = set_blob_chunks
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 0}
+        stream = io.BytesIO(json.dumps({
+            'status': 'success',
+            'data': {'is_finished': 'false', 'resume': 'token123', 'columns': ['barcode'], 'rows': [['123']]}
+        }).encode())
+
+        process_stream(stream, run)
+
+        assert json.loads(stored[0])['data']['rows'] == [['123']]
+        envelope, batch_id, next_run = mock_set_next.call_args.args
+        assert envelope['data']['resume'] == 'token123'
+        assert (batch_id, next_run) == ('42', run)
+
+    @patch('src.processors.set_blob_chunks')
+    @patch('src.processors.finish_partition', return_value=True)
+    @patch('src.processors.get_container_client')
+    @patch('src.processors.merge_blob_data')
+    @patch('src.processors.queue_email')
+    # pylint: disable=redefined-outer-name,unused-argument,too-many-arguments,too-many-positional-arguments
+    def test_process_stream_final_batch(
+            self, mock_queue, mock_merge, mock_get_container, mock_finish, mock_set_chunks, mock_env_variables
+    ):
+        """Test that the final streamed page is stored and merged with the rest of the run
+
+        Parameters:
+        mock_queue (MagicMock): Mocked queue_email function
+        mock_merge (MagicMock): Mocked merge_blob_data function
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_finish (MagicMock): Mocked finish_partition function
+        mock_set_chunks (MagicMock): Mocked set_blob_chunks function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        mock_set_chunks.side_effect = lambda chunks, run: ''.join(chunks) and run['batch_id']
+        mock_merge.side_effect = lambda container, data, rows: data
+        stream = io.BytesIO(json.dumps({
+            'status': 'success',
+            'data': {'is_finished': 'true', 'columns': ['barcode'], 'rows': [['123']]}
+        }).encode())
+
+        process_stream(stream, {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 3})
+
+        merge_data = mock_merge.call_args.args[1]
+        assert merge_data['batch_id'] == '42'
+        assert merge_data['data']['rows'] == []
+        mock_queue.assert_called_once_with(merge_data['data'])
+
+    @patch('src.processors.set_blob_chunks')
+    @patch('src.processors.delete_blob_data')
+    @patch('src.processors.set_next_request')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_process_stream_error_response(self, mock_set_next, mock_delete, mock_set_chunks, mock_env_variables):
+        """Test that the page of an unsuccessful response is discarded
+
+        Parameters:
+        mock_set_next (MagicMock): Mocked set_next_request function
+        mock_delete (MagicMock): Mocked delete_blob_data function
+        mock_set_chunks (MagicMock): Mocked set_blob_chunks function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        mock_set_chunks.side_effect = lambda chunks, run: ''.join(chunks) and run['batch_id']
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 0}
+
+        process_stream(io.BytesIO(b'{"status": "error", "message": "Analysis not found"}'), run)
+
+        mock_delete.assert_called_once_with(run)
+        mock_set_next.assert_not_called()
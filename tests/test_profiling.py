@@ -0,0 +1,48 @@
+"""Unit tests for profiling.py"""
+
+import os
+from unittest.mock import patch
+from src.profiling import profiled, set_profile_run
+
+
+def handler(value):
+    """Handler to profile
+
+    Parameters:
+    value (int): The value to return.
+
+    Returns:
+    int: The value.
+
+    """
+    set_profile_run({'batch_id': '42', 'partition': 1, 'partitions': 2, 'page': 3})
+    return [value] * 10
+
+
+class TestProfiled:
+    """Test the profiled decorator"""
+
+    def test_disabled(self):
+        """Test that handlers are not wrapped when profiling is disabled"""
+        with patch.dict(os.environ, {}, clear=True):
+            assert profiled(handler) is handler
+
+    @patch('src.profiling.get_container_client')
+    def test_sampled_call(self, mock_get_container):
+        """Test that a sampled call writes its profile and allocations named by run and page
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+
+        Returns:
+        None
+
+        """
+        with patch.dict(os.environ, {'PROFILE_SAMPLE_RATE': '1'}):
+            wrapped = profiled(handler)
+
+        assert wrapped(7) == [7] * 10
+
+        uploads = {call.args[0]: call.args[1] for call in mock_get_container.return_value.upload_blob.call_args_list}
+        assert set(uploads) == {'batch-42/001-000003-handler.prof', 'batch-42/001-000003-handler.txt'}
+        assert 'Top allocations' in uploads['batch-42/001-000003-handler.txt']
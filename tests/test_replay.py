@@ -0,0 +1,89 @@
+"""Unit tests for replay.py"""
+
+import json
+import os
+from unittest.mock import patch
+from src.export import export_enabled
+from src.history import history_enabled
+from src.replay import anonymize_response, capture_response, load_bundle, replay_bundle
+from src.runs import run_lock_enabled
+
+
+class TestCapture:
+    """Test capturing anonymized responses"""
+
+    def test_anonymize_response(self):
+        """Test that rows are anonymized consistently, keeping lengths, character classes and columns"""
+        data = {
+            'status': 'success',
+            'data': {'is_finished': 'false', 'resume': 'secret', 'columns': ['barcode', 'title'],
+                     'rows': [['39000123', 'Test Book'], ['39000123', 'Another Book'], [None, 7]]},
+        }
+
+        anonymized = anonymize_response(data, b'salt')
+        rows = anonymized['data']['rows']
+
+        assert anonymized['data']['columns'] == ['barcode', 'title']
+        assert anonymized['data']['resume'] == 'replay'
+        assert rows[0][0] == rows[1][0] != '39000123'
+        assert rows[0][0].isdigit() and len(rows[0][0]) == 8
+        assert rows[0][1][0].isupper() and rows[0][1][4] == ' ' and len(rows[0][1]) == 9
+        assert rows[2] == [None, 7]
+        assert anonymize_response(data, b'other')['data']['rows'][0][0] != rows[0][0]
+
+    @patch('src.replay.get_container_client')
+    def test_capture_response(self, mock_get_container):
+        """Test that a captured page records its run position, timing and size
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+
+        Returns:
+        None
+
+        """
+        text = json.dumps({'status': 'success', 'data': {'is_finished': 'true', 'rows': [['1']]}})
+
+        with patch.dict(os.environ, {'CAPTURE_SALT': 'salt'}):
+            capture_response(text, {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 3}, 1.5)
+
+        name, content = mock_get_container.return_value.upload_blob.call_args.args
+        page = json.loads(content)
+        assert name == 'batch-42/000-000003.json'
+        assert (page['page'], page['elapsed'], page['bytes']) == (3, 1.5, len(text))
+
+
+class TestReplay:  # pylint: disable=too-few-public-methods
+    """Test replaying a bundle"""
+
+    @patch('src.replay.process_response')
+    def test_replay_bundle(self, mock_process, tmp_path):
+        """Test that a bundle is replayed in capture order with the queues redirected
+
+        Parameters:
+        mock_process (MagicMock): Mocked process_response function
+        tmp_path (Path): Temporary directory holding the bundle
+
+        Returns:
+        None
+
+        """
+        for page in (1, 0):
+            (tmp_path / f'000-{page:06d}.json').write_text(json.dumps({
+                'partition': 0, 'partitions': 1, 'page': page, 'captured_at': 100 + page,
+                'response': {'status': 'success', 'data': {'rows': [[str(page)]]}},
+            }))
+        queues = []
+        mock_process.side_effect = lambda text, run: queues.append((
+            run['page'], os.getenv('NEXT_REQUEST_QUEUE'), history_enabled(), export_enabled(), run_lock_enabled()
+        ))
+
+        with patch.dict(os.environ, {'NEXT_REQUEST_QUEUE': 'live-queue', 'RECORD_HISTORY': 'true',
+                                     'EXPORT_REPORT': 'true', 'RUN_LOCK_SECONDS': '3600'}):
+            timings = replay_bundle(load_bundle(str(tmp_path)))
+            assert os.getenv('NEXT_REQUEST_QUEUE') == 'live-queue'
+            assert history_enabled() and export_enabled() and run_lock_enabled()
+
+        assert len(timings) == 2
+        assert queues == [(0, 'duplicates-barcode-replay', False, False, False),
+                          (1, 'duplicates-barcode-replay', False, False, False)]
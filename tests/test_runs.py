@@ -0,0 +1,88 @@
+"""Unit tests for runs.py"""
+
+import os
+import time
+from unittest.mock import patch
+from src.runs import delete_partitions, finish_partition, get_partition_filters, get_run, new_run
+from src.runs import RUN_LOCK, acquire_run_lock, release_run_lock, renew_run_lock
+
+
+class TestRuns:
+    """Test the run context helpers"""
+
+    def test_get_run_from_message(self):
+        """Test that the run context is read from a next request message"""
+        message = {'iz': 'TEST_IZ', 'resume': 'token', 'batch_id': '42', 'partition': 2, 'partitions': 4, 'page': 7}
+
+        assert get_run(message) == {'batch_id': '42', 'partition': 2, 'partitions': 4, 'page': 7}
+        assert get_run({**message, 'columns_ref': 'columns-42-002'})['columns_ref'] == 'columns-42-002'
+
+    def test_get_partition_filters(self):
+        """Test parsing of the ANALYSIS_PARTITION_FILTERS app setting"""
+        with patch.dict(os.environ, {'ANALYSIS_PARTITION_FILTERS': '["<a/>", "<b/>"]'}):
+            assert get_partition_filters() == ['<a/>', '<b/>']
+
+        with patch.dict(os.environ, {}, clear=True):
+            assert not get_partition_filters()
+
+        with patch.dict(os.environ, {'ANALYSIS_PARTITION_FILTERS': 'not json'}):
+            with patch('src.runs.logging.error') as mock_logging:
+                assert not get_partition_filters()
+                mock_logging.assert_called_once()
+
+    def test_finish_partition_single(self):
+        """Test that an unpartitioned run is finished without shared state"""
+        with patch('src.runs.get_state') as mock_get_state:
+            assert finish_partition(new_run())
+            mock_get_state.assert_not_called()
+
+    def test_finish_partition_last(self, shared_state):
+        """Test that only the last partition to finish is told to merge"""
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 2, 'page': 3}
+
+        assert not finish_partition(run)
+        assert not finish_partition(run)
+        assert finish_partition({**run, 'partition': 1})
+
+        delete_partitions(run)
+        assert not shared_state.entities
+
+
+class TestRunLock:
+    """Test the run lock"""
+
+    def test_overlapping_runs(self, shared_state):
+        """Test that a second run cannot start while the first holds the lock, and can once it is released"""
+        first = {'batch_id': '1', 'partition': 0, 'partitions': 1, 'page': 0}
+        second = {**first, 'batch_id': '2'}
+
+        with patch.dict(os.environ, {'RUN_LOCK_SECONDS': '3600'}):
+            assert acquire_run_lock(first)
+            assert not acquire_run_lock(second)
+            assert renew_run_lock({**first, 'page': 5})
+            assert shared_state.writes == 1  # Not renewed until half the lock has passed
+
+            release_run_lock(second)
+            assert RUN_LOCK in shared_state.entities
+            release_run_lock(first)
+            assert acquire_run_lock(second)
+            assert not renew_run_lock(first)
+
+    def test_runs_started_in_the_same_second(self, shared_state):  # pylint: disable=unused-argument
+        """Test that a run started in the same second as the run holding the lock does not take it"""
+        with patch('src.runs.time.time', return_value=1700000000.0), \
+                patch.dict(os.environ, {'RUN_LOCK_SECONDS': '3600'}):
+            first = new_run()
+            second = new_run()
+
+            assert first['batch_id'] != second['batch_id']
+            assert first['batch_id'].startswith('1700000000-')
+            assert acquire_run_lock(first)
+            assert not acquire_run_lock(second)
+
+    def test_expired_lock(self, shared_state):
+        """Test that a lock left by a chain that died does not block the next run"""
+        shared_state.entities[RUN_LOCK] = ({'batch_id': '1', 'expires': time.time() - 1}, 'etag')
+
+        assert acquire_run_lock({'batch_id': '2', 'partition': 0, 'partitions': 1, 'page': 0})
+        assert shared_state.entities[RUN_LOCK][0]['batch_id'] == '2'
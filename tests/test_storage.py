@@ -1,8 +1,14 @@
 """Unit tests for storage.py"""
 
 import json
+import os
 from unittest.mock import MagicMock, patch
+import pytest
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
 from src.storage import set_blob_data, queue_email, get_container_client, merge_blob_data, set_next_request
+from src.storage import get_state, put_state, STATE_CONTAINER, iter_page_json, upload_json_blob
+from src.storage import ensure_container, send_queue_message, get_barcode_key, iter_run_rows, SORTED_METADATA
+from src.storage import resolve_columns, delete_run_pages
 
 
 class TestStorage:
@@ -23,16 +29,41 @@ class TestStorage:
 
         """
         mock_container = MagicMock()
-        mock_container.exists.return_value = False
         mock_get_container.return_value = mock_container
+        container_not_found = ResourceNotFoundError("no container")
+        container_not_found.error_code = 'ContainerNotFound'
+        mock_container.get_blob_client.return_value.upload_blob.side_effect = [container_not_found, None]
 
         test_data = {'status': 'success', 'data': {'rows': []}}
 
         batch_id = set_blob_data(test_data)
 
         assert batch_id is not None
+        mock_container.exists.assert_not_called()
         mock_container.create_container.assert_called_once()
         mock_container.get_blob_client.assert_called_once()
+        assert mock_container.get_blob_client.return_value.upload_blob.call_count == 2
+
+    @patch('src.storage.get_container_client')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_set_blob_data_for_run(self, mock_get_container, mock_env_variables):
+        """Test that pages of a run are stored under the run's batch prefix
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        mock_container = mock_get_container.return_value
+        run = {'batch_id': '1700000000', 'partition': 2, 'partitions': 4, 'page': 11}
+
+        batch_id = set_blob_data({'status': 'success', 'data': {'rows': []}}, run)
+
+        assert batch_id == '1700000000'
+        mock_container.get_blob_client.assert_called_once_with('batch-1700000000/002-000011.json')
 
     @patch('azure.storage.queue.QueueClient')
     # pylint: disable=redefined-outer-name,unused-argument
@@ -60,6 +91,33 @@ class TestStorage:
 
         mock_queue.send_message.assert_called_once()
 
+    @patch('azure.storage.queue.QueueClient')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_queue_email_with_report_url(self, mock_queue_client, mock_env_variables, mock_azure_storage):
+        """Test that an exported report is linked from the email
+
+        Parameters:
+        mock_queue_client (MagicMock): Mocked QueueClient
+        mock_env_variables (dict): Mocked environment variables
+        mock_azure_storage (dict): Mocked Azure Storage services
+
+        Returns:
+        None
+
+        """
+        test_data = {
+            'columns': ['barcode', 'title'],
+            'rows': [['123456789', 'Test Book']],
+            'row_count': 5000,
+            'report_url': 'https://example.com/report.csv',
+        }
+
+        queue_email(test_data)
+
+        mail = json.loads(mock_azure_storage['queue_instance'].send_message.call_args.args[0])
+        assert mail['report_url'] == 'https://example.com/report.csv'
+        assert 'first 1 of 5000 rows' in mail['header']
+
     @patch('azure.storage.blob.BlobServiceClient.from_connection_string')
     # pylint: disable=redefined-outer-name,unused-argument
     def test_get_container_client(self, mock_from_connection_string, mock_env_variables):
@@ -167,11 +225,11 @@ class TestStorage:
         # Call function
         result = merge_blob_data(mock_container, test_data)
 
-        # Verify blobs were listed, downloaded, and deleted
+        # Verify blobs were listed and downloaded, and kept until the email is sent
         mock_container.list_blobs.assert_called_once_with(name_starts_with='batch-123')
         mock_container.get_blob_client.assert_called_once_with(blob1.name)
         mock_blob_client.download_blob.assert_called_once()
-        mock_blob_client.delete_blob.assert_called_once()
+        mock_blob_client.delete_blob.assert_not_called()
 
         # Verify data was merged correctly
         assert len(result['data']['rows']) == 2
@@ -328,3 +386,424 @@ class TestStorageErrorHandling:
                     "Error sending message to email queue: %s",
                     "Test queue exception"
                 )
+
+    @patch('src.storage.DELETE_BATCH_SIZE', 2)
+    def test_delete_run_pages(self):
+        """Test that the pages of a run are deleted in batches"""
+        container = MagicMock()
+        blobs = [MagicMock() for _ in range(3)]
+        for index, blob in enumerate(blobs):
+            blob.name = f'batch-42/000-{index:06d}.json'
+        container.list_blobs.return_value = blobs
+
+        delete_run_pages(container, {'batch_id': '42'})
+
+        container.list_blobs.assert_called_once_with(name_starts_with='batch-42/')
+        assert [call.args for call in container.delete_blobs.call_args_list] == [
+            ('batch-42/000-000000.json', 'batch-42/000-000001.json'),
+            ('batch-42/000-000002.json',),
+        ]
+
+
+class TestSharedState:
+    """Tests for the shared state helpers"""
+
+    @patch('src.storage.get_container_client')
+    def test_get_state_missing(self, mock_get_container):
+        """Test that a missing state entity returns no state and no ETag
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+
+        Returns:
+        None
+
+        """
+        blob_client = mock_get_container.return_value.get_blob_client.return_value
+        blob_client.download_blob.side_effect = ResourceNotFoundError("missing")
+
+        assert get_state('test') == (None, None)
+        mock_get_container.assert_called_once_with(STATE_CONTAINER)
+
+    @patch('src.storage.get_container_client')
+    def test_put_state_conflict(self, mock_get_container):
+        """Test that a stale ETag reports a lost race
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+
+        Returns:
+        None
+
+        """
+        blob_client = mock_get_container.return_value.get_blob_client.return_value
+        blob_client.upload_blob.side_effect = ResourceModifiedError("conflict")
+
+        assert put_state('test', {'tokens': 1}, 'etag-1') is False
+
+    @patch('src.storage.get_container_client')
+    def test_put_state_creates_container(self, mock_get_container):
+        """Test that the state container is created on first use
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+
+        Returns:
+        None
+
+        """
+        container = mock_get_container.return_value
+        blob_client = container.get_blob_client.return_value
+        container_not_found = ResourceNotFoundError("no container")
+        container_not_found.error_code = 'ContainerNotFound'
+        blob_client.upload_blob.side_effect = [container_not_found, None]
+
+        assert put_state('test', {'tokens': 1}, None) is True
+        container.create_container.assert_called_once()
+        assert blob_client.upload_blob.call_args.kwargs == {'overwrite': False}
+
+
+class TestJsonUpload:
+    """Tests for the incremental JSON page upload"""
+
+    def test_iter_page_json_matches_json_dumps(self):
+        """Test that the incremental serializer produces the same JSON as json.dumps"""
+        page = {
+            'status': 'success',
+            'data': {
+                'is_finished': 'false',
+                'resume': 'token123',
+                'columns': ['barcode', 'title'],
+                'rows': [['123456789', 'Test "Book"'], ['987654321', 'Another Book']]
+            }
+        }
+
+        assert ''.join(iter_page_json(page)) == json.dumps(page)
+        assert ''.join(iter_page_json({'key': 'value'})) == json.dumps({'key': 'value'})
+
+    def test_upload_small_page(self):
+        """Test that a page smaller than one block is uploaded in a single request"""
+        blob_client = MagicMock()
+
+        upload_json_blob(blob_client, {'data': {'rows': [['123']]}})
+
+        blob_client.upload_blob.assert_called_once()
+        blob_client.stage_block.assert_not_called()
+
+    @patch('src.storage.BLOCK_SIZE', 64)
+    def test_upload_large_page_in_blocks(self):
+        """Test that a large page is staged in ordered blocks and committed"""
+        blob_client = MagicMock()
+        page = {'data': {'rows': [[str(n) * 20] for n in range(10)]}}
+
+        upload_json_blob(blob_client, page)
+
+        blob_client.upload_blob.assert_not_called()
+        staged = {call.args[0]: call.args[1] for call in blob_client.stage_block.call_args_list}
+        committed = [block.id for block in blob_client.commit_block_list.call_args.args[0]]
+        assert len(committed) > 1
+        assert json.loads(b''.join(staged[block_id] for block_id in committed)) == page
+
+
+class TestContainerBootstrap:
+    """Tests for the container and queue bootstrap helpers"""
+
+    def test_ensure_container_checks_once(self):
+        """Test that container existence is only checked once per process"""
+        container = MagicMock()
+        container.container_name = 'test-ensure-container'
+        container.exists.return_value = False
+
+        ensure_container(container)
+        ensure_container(container)
+
+        container.exists.assert_called_once()
+        container.create_container.assert_called_once()
+
+    def test_send_queue_message_creates_queue(self):
+        """Test that a missing queue is created and the message resent"""
+        queue_client = MagicMock()
+        queue_not_found = ResourceNotFoundError("no queue")
+        queue_not_found.error_code = 'QueueNotFound'
+        queue_client.send_message.side_effect = [queue_not_found, None]
+
+        send_queue_message(queue_client, b'message')
+
+        queue_client.create_queue.assert_called_once()
+        assert queue_client.send_message.call_count == 2
+
+    def test_send_queue_message_reraises_other_errors(self):
+        """Test that errors other than a missing queue are not swallowed"""
+        queue_client = MagicMock()
+        queue_client.send_message.side_effect = ResourceNotFoundError("other")
+
+        with pytest.raises(ResourceNotFoundError):
+            send_queue_message(queue_client, b'message')
+
+        queue_client.create_queue.assert_not_called()
+
+
+def make_page_container(pages):
+    """Create a container holding the stored pages of a run
+
+    Parameters:
+    pages (dict): The rows and metadata of each page by blob name.
+
+    Returns:
+    MagicMock: The container client, listing the pages, downloading them whole or by range and storing them again.
+
+    """
+    contents = {name: json.dumps({'data': {'rows': rows}}).encode() for name, (rows, _) in pages.items()}
+    blobs = {}
+    for name, (_, metadata) in pages.items():
+        blob = MagicMock()
+        blob.name = name
+        blob.metadata = metadata
+        blob.size = len(contents[name])
+        blobs[name] = blob
+
+    def download_blob(name, offset=0, length=None):
+        content = contents[name][offset:None if length is None else offset + length]
+        return MagicMock(readall=MagicMock(return_value=content))
+
+    def get_blob_client(name):
+        def upload_blob(content, overwrite=False, metadata=None):
+            assert overwrite
+            contents[name] = content
+            blobs[name] = MagicMock(size=len(content), metadata=metadata)
+            blobs[name].name = name
+
+        return MagicMock(upload_blob=MagicMock(side_effect=upload_blob),
+                         get_blob_properties=MagicMock(side_effect=lambda: blobs[name]))
+
+    container = MagicMock()
+    container.list_blobs.return_value = list(blobs.values())
+    container.download_blob.side_effect = download_blob
+    container.get_blob_client.side_effect = get_blob_client
+    return container
+
+
+class TestSortedMerge:
+    """Tests for sorted page runs and the k-way merge"""
+
+    def test_get_barcode_key(self):
+        """Test finding the barcode column in list and dict columns"""
+        assert get_barcode_key(['title', 'Barcode'])(['Test Book', '123']) == '123'
+        assert get_barcode_key({'Column1': 'Title', 'Column2': 'Barcode'})({'Column2': '456'}) == '456'
+        assert get_barcode_key({'Column1': 'Title', 'Column2': 'Barcode'})(['Test Book', '789']) == '789'
+        assert get_barcode_key(['title']) is None
+        assert get_barcode_key(None) is None
+
+    @patch('src.storage.get_container_client')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_set_blob_data_sorts_page(self, mock_get_container, mock_env_variables):
+        """Test that pages are stored sorted by barcode and marked as sorted
+
+        Parameters:
+        mock_get_container (MagicMock): Mocked get_container_client function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        blob_client = mock_get_container.return_value.get_blob_client.return_value
+        rows = [['3', 'C'], ['1', 'A'], ['2', 'B']]
+
+        set_blob_data({'data': {'columns': ['barcode', 'title'], 'rows': rows}})
+
+        content, = blob_client.upload_blob.call_args.args
+        assert json.loads(content)['data']['rows'] == [['1', 'A'], ['2', 'B'], ['3', 'C']]
+        assert blob_client.upload_blob.call_args.kwargs['metadata'] == SORTED_METADATA
+        assert rows[0] == ['3', 'C']
+
+    def test_iter_run_rows_merges_pages(self):
+        """Test that sorted and unsorted pages are merged into barcode order and kept"""
+        container = make_page_container({
+            'batch-42/000-000000.json': ([['1', 'A'], ['3', 'C']], SORTED_METADATA),
+            'batch-42/000-000001.json': ([['4', 'D'], ['1', 'A2']], {}),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'title'], 'rows': [['2', 'B']]}}
+        rows = list(iter_run_rows(container, data))
+
+        assert [row[0] for row in rows] == ['1', '1', '2', '3', '4']
+        container.list_blobs.assert_called_once_with(name_starts_with='batch-42', include=['metadata'])
+        container.delete_blob.assert_not_called()
+
+    @patch('src.storage.READ_SIZE', 8)
+    def test_iter_run_rows_sorts_unsorted_pages_first(self):
+        """Test that unsorted pages are stored again sorted before the merge, so every page is read in ranges"""
+        container = make_page_container({
+            'batch-42/000-000000.json': ([['4', 'D'], ['1', 'A']], {}),
+            'batch-42/000-000001.json': ([['3', 'C'], ['2', 'B']], {}),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'title'], 'rows': []}}
+        rows = iter_run_rows(container, data)
+
+        assert next(rows) == ['1', 'A']
+        ranged = [call for call in container.download_blob.call_args_list if 'length' in call.kwargs]
+        assert ranged and all(call.kwargs['length'] <= 8 for call in ranged)
+        assert [row[0] for row in rows] == ['2', '3', '4']
+        assert list(iter_run_rows(container, data)) == [['1', 'A'], ['2', 'B'], ['3', 'C'], ['4', 'D']]
+
+    @patch('src.storage.READ_SIZE', 8)
+    def test_iter_run_rows_reads_sorted_pages_in_ranges(self):
+        """Test that sorted pages are downloaded one range at a time as the merge reads them"""
+        container = make_page_container({
+            'batch-42/000-000000.json': ([['1', 'A'], ['3', 'C']], SORTED_METADATA),
+            'batch-42/000-000001.json': ([['2', 'B'], ['4', 'D']], SORTED_METADATA),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'title'], 'rows': []}}
+        rows = iter_run_rows(container, data)
+
+        assert next(rows) == ['1', 'A']
+        assert all(call.kwargs['length'] <= 8 for call in container.download_blob.call_args_list)
+        assert [row[0] for row in rows] == ['2', '3', '4']
+
+    def test_iter_run_rows_decodes_in_processes(self):
+        """Test that pages decoded by a process pool send back only candidate rows, merged in barcode order"""
+        container = make_page_container({
+            'batch-42/000-000000.json': ([['1', 'A'], ['3', 'C']], SORTED_METADATA),
+            'batch-42/000-000001.json': ([['4', 'D'], ['1', 'A2'], ['3', 'C2']], {}),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'title'], 'rows': [['2', 'B'], ['1', 'A3']]}}
+        with patch.dict(os.environ, {'MERGE_DECODE_WORKERS': '2'}):
+            rows = list(iter_run_rows(container, data, candidates={'1', '3'}))
+
+        assert [row[0] for row in rows] == ['1', '1', '1', '3', '3']
+        container.delete_blob.assert_not_called()
+
+    @patch('src.storage.decode_pages')
+    def test_iter_run_rows_decodes_every_row_in_process(self, mock_decode_pages):
+        """Test that the process pool is not used when every row has to be sent back
+
+        Parameters:
+        mock_decode_pages (MagicMock): Mocked decode_pages function
+
+        Returns:
+        None
+
+        """
+        container = make_page_container({
+            'batch-42/000-000000.json': ([['1', 'A']], SORTED_METADATA),
+            'batch-42/000-000001.json': ([['2', 'B']], SORTED_METADATA),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'title'], 'rows': []}}
+        with patch.dict(os.environ, {'MERGE_DECODE_WORKERS': '2'}):
+            assert list(iter_run_rows(container, data)) == [['1', 'A'], ['2', 'B']]
+
+        mock_decode_pages.assert_not_called()
+
+    def test_iter_run_rows_drops_repeated_rows(self):
+        """Test that rows repeated by overlapping pages are dropped, comparing only the key columns"""
+        container = make_page_container({
+            'batch-42/000-000001.json': ([['1', 'i1', 'x'], ['1', 'i2', 'x'], ['3', 'i3', 'z']], SORTED_METADATA),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'item_id', 'note'], 'rows': [['1', 'i1', 'w']]}}
+        with patch.dict(os.environ, {'DEDUP_ROWS': 'true', 'DEDUP_KEY_COLUMNS': 'Barcode, ITEM_ID'}):
+            rows = list(iter_run_rows(container, data))
+
+        assert rows == [['1', 'i1', 'w'], ['1', 'i2', 'x'], ['3', 'i3', 'z']]
+
+    def test_iter_run_rows_keeps_identical_items(self):
+        """Test that identical rows of different items are kept without key columns naming the item ID"""
+        container = make_page_container({
+            'batch-42/000-000001.json': ([['1', 'A'], ['1', 'A']], SORTED_METADATA),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'title'], 'rows': []}}
+        for key_columns in ('', 'barcode, item_id'):
+            with patch.dict(os.environ, {'DEDUP_ROWS': 'true', 'DEDUP_KEY_COLUMNS': key_columns}), \
+                    patch('src.storage.logging.warning') as mock_warning:
+                assert list(iter_run_rows(container, data)) == [['1', 'A'], ['1', 'A']]
+                mock_warning.assert_called_once()
+
+    def test_iter_run_rows_skips_pages(self):
+        """Test that pages without duplicate candidates are not read"""
+        container = make_page_container({
+            'batch-42/000-000000.json': ([['1', 'A']], SORTED_METADATA),
+            'batch-42/000-000001.json': ([['2', 'B']], SORTED_METADATA),
+        })
+
+        data = {'batch_id': '42', 'data': {'columns': ['barcode', 'title'], 'rows': []}}
+        rows = list(iter_run_rows(container, data, {'batch-42/000-000000.json'}))
+
+        assert rows == [['1', 'A']]
+        assert {call.args[0] for call in container.download_blob.call_args_list} == {'batch-42/000-000000.json'}
+        container.delete_blob.assert_not_called()
+
+
+class TestColumnReferences:
+    """Tests for referencing columns by run in compact next request messages"""
+
+    @patch('src.storage.queue_request')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_columns_round_trip(self, mock_queue_request, mock_env_variables, shared_state):
+        """Test that the columns are stored with the first page and restored from the reference
+
+        Parameters:
+        mock_queue_request (MagicMock): Mocked queue_request function
+        mock_env_variables (dict): Mocked environment variables
+        shared_state (FakeState): In-memory shared state
+
+        Returns:
+        None
+
+        """
+        columns = {'Column1': 'Barcode', 'Column2': 'Title'}
+        run = {'batch_id': '42', 'partition': 1, 'partitions': 2, 'page': 0}
+
+        with patch.dict(os.environ, {'COMPACT_QUEUE_MESSAGES': 'true'}):
+            set_next_request({'data': {'resume': 'token', 'columns': columns}}, '42', run)
+            message = mock_queue_request.call_args.args[0]
+
+            assert 'columns' not in message
+            assert message['columns_ref'] == 'columns-42-001'
+            assert shared_state.entities['columns-42-001'][0] == {'columns': columns}
+            assert resolve_columns(message)['columns'] == columns
+
+    @patch('src.storage.queue_request')
+    # pylint: disable=redefined-outer-name,unused-argument
+    def test_columns_stored_when_not_referenced(self, mock_queue_request, mock_env_variables):
+        """Test that a page whose request carried the columns inline stores them before referencing them
+
+        Parameters:
+        mock_queue_request (MagicMock): Mocked queue_request function
+        mock_env_variables (dict): Mocked environment variables
+
+        Returns:
+        None
+
+        """
+        columns = ['barcode', 'title']
+        data = {'data': {'resume': 'token', 'columns': columns}}
+        run = {'batch_id': '42', 'partition': 0, 'partitions': 1, 'page': 0}
+
+        with patch.dict(os.environ, {'COMPACT_QUEUE_MESSAGES': 'true'}), \
+                patch('src.storage.put_state', side_effect=Exception("Test state exception")):
+            set_next_request(data, '42', run)
+            assert mock_queue_request.call_args.args[0]['columns'] == columns
+            assert 'columns_ref' not in mock_queue_request.call_args.args[0]
+
+        with patch.dict(os.environ, {'COMPACT_QUEUE_MESSAGES': 'true'}), \
+                patch('src.storage.put_state', return_value=True) as mock_put_state:
+            # The previous page sent its columns inline, so this page stores them
+            set_next_request(data, '42', {**run, 'page': 1})
+            mock_put_state.assert_called_once_with('columns-42-000', {'columns': columns}, None)
+            assert mock_queue_request.call_args.args[0]['columns_ref'] == 'columns-42-000'
+
+            # The previous page referenced the columns, so they are not stored again
+            mock_put_state.reset_mock()
+            set_next_request(data, '42', {**run, 'page': 2, 'columns_ref': 'columns-42-000'})
+            mock_put_state.assert_not_called()
+            assert mock_queue_request.call_args.args[0]['columns_ref'] == 'columns-42-000'
+
+        set_next_request(data, '42', {**run, 'page': 3, 'columns_ref': 'columns-42-000'})
+        assert mock_queue_request.call_args.args[0]['columns'] == columns
+        assert 'columns_ref' not in mock_queue_request.call_args.args[0]
@@ -0,0 +1,46 @@
+"""Unit tests for sweeper.py"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+from src.sweeper import sweep_orphaned_pages
+
+
+def make_blob(name, hours_old, size=100):
+    """Create a listed blob
+
+    Parameters:
+    name (str): The blob name.
+    hours_old (float): The age of the blob in hours.
+    size (int): The blob size in bytes.
+
+    Returns:
+    MagicMock: The blob properties.
+
+    """
+    blob = MagicMock()
+    blob.name = name
+    blob.last_modified = datetime.now(timezone.utc) - timedelta(hours=hours_old)
+    blob.size = size
+    return blob
+
+
+class TestSweepOrphanedPages:  # pylint: disable=too-few-public-methods
+    """Test the sweep_orphaned_pages function"""
+
+    def test_sweeps_old_runs_and_pages(self):
+        """Test that abandoned runs and old timestamp pages are deleted in batches, and active runs are kept"""
+        abandoned = [make_blob(f'batch-1/000-{page:06d}.json', 200) for page in range(300)]
+        active = [make_blob('batch-2/000-000000.json', 200), make_blob('batch-2/000-000001.json', 1)]
+        legacy = [make_blob('1700000000.json', 1000, size=50), make_blob('1800000000.json', 1)]
+
+        container = MagicMock()
+        container.list_blobs.return_value = abandoned + active + legacy
+        container.delete_blobs.side_effect = lambda *names, **kwargs: [MagicMock(status_code=202) for _ in names]
+
+        result = sweep_orphaned_pages(container, 72)
+
+        assert result == {'deleted': 301, 'reclaimed_bytes': 300 * 100 + 50}
+        assert [len(call.args) for call in container.delete_blobs.call_args_list] == [256, 45]
+        deleted = {name for call in container.delete_blobs.call_args_list for name in call.args}
+        assert '1700000000.json' in deleted
+        assert not deleted & {blob.name for blob in active + legacy[1:]}
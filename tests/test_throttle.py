@@ -0,0 +1,75 @@
+"""Unit tests for throttle.py"""
+
+import os
+from unittest.mock import patch
+from src.throttle import RateLimiter, get_rate_limiter, parse_retry_after
+
+
+class TestRateLimiter:
+    """Test the RateLimiter class"""
+
+    def test_acquire_takes_token_without_waiting(self, shared_state):
+        """Test that a full bucket hands out a token immediately"""
+        with patch('src.throttle.time.sleep') as mock_sleep:
+            limiter = RateLimiter('test', rate=1.0, burst=2.0)
+
+            assert limiter.acquire() == 0.0
+            mock_sleep.assert_not_called()
+            assert shared_state.entities['test'][0]['tokens'] == 1.0
+
+    def test_acquire_waits_for_refill(self, shared_state):
+        """Test that an empty bucket waits for a token to be refilled"""
+        shared_state.entities['test'] = ({'tokens': 0.0, 'updated': 1000.0, 'blocked_until': 0.0}, '1')
+        clock = [1000.0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        with patch('src.throttle.time.time', side_effect=lambda: clock[0]), \
+                patch('src.throttle.time.sleep', side_effect=sleep):
+            limiter = RateLimiter('test', rate=0.5, burst=1.0)
+
+            assert limiter.acquire() == 2.0
+
+    def test_penalize_blocks_bucket(self, shared_state):  # pylint: disable=unused-argument
+        """Test that a Retry-After penalty is stored for every instance"""
+        limiter = RateLimiter('test', rate=1.0, burst=1.0)
+        limiter.penalize(30)
+
+        assert 29 < limiter.state()['blocked_for'] <= 30
+
+    def test_acquire_gives_up_after_max_wait(self, shared_state):
+        """Test that the limiter proceeds once the maximum wait is exceeded"""
+        shared_state.entities['test'] = ({'tokens': 0.0, 'updated': 1000.0, 'blocked_until': 5000.0}, '1')
+
+        with patch('src.throttle.time.time', return_value=1000.0), \
+                patch('src.throttle.time.sleep') as mock_sleep:
+            limiter = RateLimiter('test', rate=1.0, burst=1.0, max_wait=60)
+
+            assert limiter.acquire() == 0.0
+            mock_sleep.assert_not_called()
+
+
+class TestThrottleHelpers:
+    """Test the throttle helper functions"""
+
+    def test_get_rate_limiter_disabled(self):
+        """Test that no limiter is configured without the app setting"""
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_rate_limiter() is None
+
+    def test_get_rate_limiter_configured(self):
+        """Test that the limiter is configured from the app settings"""
+        with patch.dict(os.environ, {'ALMA_RATE_LIMIT_PER_MINUTE': '30', 'ALMA_RATE_LIMIT_BURST': '5'}):
+            limiter = get_rate_limiter()
+
+            assert limiter is not None
+            assert limiter.rate == 0.5
+            assert limiter.burst == 5.0
+
+    def test_parse_retry_after(self):
+        """Test parsing of Retry-After header values"""
+        assert parse_retry_after('12') == 12.0
+        assert parse_retry_after(None, default=7.0) == 7.0
+        assert parse_retry_after('not a date', default=3.0) == 3.0
+        assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0